@@ -1,17 +1,37 @@
 ## libraries
 import os
 import sys
+import json
+import hmac
+import time
+import signal
+import asyncio
 from quart import Quart, Response, request, abort
-from aiohttp import ClientConnectorError
 
 ## source
 sys.path.insert(0, './')
 from .src.extract import ExtractClient
+from .src.record import Recorder, Replayer
 
 ## params
 INI_FILE = str(os.getenv(key = 'INI_PATH', default = '/app/ext/conf/feed/ww-full.ini'))
 INI_SECT = str(os.getenv(key = 'INI_SECT', default = 'api'))
 ENV_FILE = str(os.getenv(key = 'ENV_FILE', default = './ext/.env'))
+R_PARAM = int(os.getenv(key = 'R_PARAM', default = 30))  ## fallback refresh rate without feed timestamps (seconds)
+S_PARAM = int(os.getenv(key = 'S_PARAM', default = 120))  ## stale limit (seconds)
+D_PARAM = int(os.getenv(key = 'D_PARAM', default = 20))  ## per feed deadline (seconds)
+P_PARAM = os.getenv(key = 'P_PARAM', default = None)  ## parse processes, 0 for inline (default cores)
+C_PARAM = str(os.getenv(key = 'C_PARAM', default = 'gzip'))  ## content encodings compressed per feed update (gzip, zstd)
+F_PARAM = str(os.getenv(key = 'F_PARAM', default = 'protobuf'))  ## formats serialized per feed update (protobuf, arrow)
+SHM_PATH = str(os.getenv(key = 'SHM_PATH', default = '/dev/shm/extract.snap'))  ## snapshot shared across workers, empty for none
+REC_PATH = str(os.getenv(key = 'REC_PATH', default = ''))  ## record raw feeds to segment files, empty for none
+REC_SIZE = int(os.getenv(key = 'REC_SIZE', default = 64))  ## max segment size (MiB)
+REC_TIME = int(os.getenv(key = 'REC_TIME', default = 3600))  ## max segment age (seconds)
+REC_KEEP = int(os.getenv(key = 'REC_KEEP', default = 0))  ## segments to keep, 0 for all
+PLAY_PATH = str(os.getenv(key = 'PLAY_PATH', default = ''))  ## replay recorded segment files instead of polling, empty for none
+PLAY_SPEED = float(os.getenv(key = 'PLAY_SPEED', default = 1))  ## replay speed, 0 for no delay
+PLAY_LOOP = str(os.getenv(key = 'PLAY_LOOP', default = 'false')).lower() == 'true'  ## restart replay at the end
+ADMIN_TOKEN = str(os.getenv(key = 'ADMIN_TOKEN', default = ''))  ## bearer token of admin routes, empty for none
 LOG_LEVEL = str(os.getenv(key = 'LOG_LEVEL', default = 'INFO'))
 
 ## app
@@ -29,24 +49,78 @@ client = ExtractClient(
     ini_sect = INI_SECT
 )
 
-## test app
+## background refresh
+@app.before_serving
+async def startup():
+    await client.start(
+        time_r = R_PARAM,
+        time_s = S_PARAM,
+        time_d = D_PARAM,
+        proc_n = int(P_PARAM) if P_PARAM else None,
+        path = SHM_PATH or None,  ## one fetcher worker publishes, all workers serve
+        record = Recorder(
+            path = REC_PATH,
+            size_m = REC_SIZE * 2 ** 20,
+            time_m = REC_TIME,
+            keep_n = REC_KEEP
+        ) if REC_PATH else None,
+        replay = Replayer(
+            path = PLAY_PATH,
+            speed = PLAY_SPEED,
+            loop = PLAY_LOOP
+        ) if PLAY_PATH else None,
+        codecs = tuple(i.strip() for i in C_PARAM.split(',') if i.strip()),
+        forms = tuple(i.strip() for i in F_PARAM.split(',') if i.strip())
+    )  ## pooled session and refresh
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGHUP,
+            lambda: asyncio.ensure_future(hangup())
+        )  ## reload on kill -HUP
+    except (NotImplementedError, RuntimeError):
+        app.logger.warning(msg = 'Application layer cannot reload on SIGHUP.')
+
+@app.after_serving
+async def shutdown():
+    try:
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+    except (NotImplementedError, RuntimeError):
+        pass
+    await client.close()  ## stop refresh and close session
+
+## reload feed configuration on SIGHUP
+async def hangup():
+    try:
+        diff = await client.reload()  ## all workers with a shared snapshot
+    except (KeyError, OSError, ValueError) as e:
+        app.logger.error(msg = 'Application failed to reload feed configuration: {x}'.format(x = e))
+        return
+    app.logger.info(msg = 'Application layer sucessfully reloaded: {x}'.format(x = json.dumps(obj = diff)))
+
+## test app (unhealthy while the served snapshot is stale)
 @app.route(rule = '/', methods = ['GET'])
 def test():
     if request.args:
         abort(code = 400, text = 'Application test does not accept parameters.')
+    time_a = client.age(time_t = time.time())
+    if time_a is not None and time_a > S_PARAM:
+        app.logger.error(msg = 'Application layer serves snapshot of age {x:.0f} seconds.'.format(x = time_a))
+        return Response(response = None, status = 503, headers = {'X-Snapshot-Age': str(int(time_a))})
     app.logger.info(msg = 'Application layer tested sucessfully.')
     return Response(response = None, status = 200)
 
-## extract data
-@app.route(rule = '/extract', methods = ['GET'])
-async def extract():
-    if request.args:
-        abort(code = 400, text = 'Application does not accept parameters.')
+## read snapshot from cache
+def respond(keys = None):
     try:
-        response, status, headers = await client.run()
-    except ClientConnectorError as e:
-        app.logger.error(msg = 'Application failed to connect: {x}'.format(x = e))
-        return Response(response = str(e), status = 500)
+        response, status, headers = client.read(  ## latest snapshot from cache
+            etag = request.headers.get('If-None-Match'),  ## unchanged since last request
+            framing = request.args.get('framing'),  ## length-delimited messages
+            keys = keys,  ## agencies to return
+            encoding = request.headers.get('Accept-Encoding'),  ## gzip or zstd
+            form = request.args.get('format')  ## protobuf or arrow record batches
+        )
+    except ValueError as e:
+        abort(code = 400, description = str(e))
     app.logger.info(msg = 'Application layer sucessfully executed.')
     return Response(
         response = response,
@@ -54,6 +128,46 @@ async def extract():
         headers = headers
     )
 
+## extract data
+@app.route(rule = '/extract', methods = ['GET'])
+async def extract():
+    if set(request.args) - {'framing', 'format', 'iata_id'}:
+        abort(code = 400, description = 'Application only accepts the framing, format, and iata_id parameters.')
+    iata = request.args.get('iata_id')
+    try:
+        keys = client.select(iata = iata.split(',') if iata is not None else None)
+    except ValueError as e:
+        abort(code = 400, description = str(e))
+    return respond(keys = keys)
+
+## extract data by region
+@app.route(rule = '/extract/region/<region>', methods = ['GET'])
+async def extract_region(region):
+    if set(request.args) - {'framing', 'format'}:
+        abort(code = 400, description = 'Application only accepts the framing and format parameters.')
+    try:
+        keys = client.select(region = region)
+    except KeyError:
+        abort(code = 404, description = 'Application found no region {x}.'.format(x = region))
+    return respond(keys = keys)
+
+## reload feed configuration
+@app.route(rule = '/admin/reload', methods = ['POST'])
+async def reload():
+    token = request.headers.get('Authorization', '')
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ('Bearer ' + ADMIN_TOKEN).encode()):
+        abort(code = 404)
+    try:
+        diff = await client.reload()  ## all workers with a shared snapshot
+    except (KeyError, OSError, ValueError) as e:
+        abort(code = 400, description = 'Application failed to reload feed configuration: {x}'.format(x = e))
+    app.logger.info(msg = 'Application layer sucessfully reloaded.')
+    return Response(
+        response = json.dumps(obj = diff),
+        status = 200,
+        content_type = 'application/json'
+    )
+
 ## run app (does not execute with gunicorn)
 # if __name__ == '__main__':
 #     app.run()
@@ -1,5 +1,10 @@
 ## library
 import os
+import sys
+
+## source (shared with the parse process pool)
+sys.path.insert(0, './')
+from ext.src.cores import cpu_count
 
 ## params
 LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
@@ -7,8 +12,9 @@ LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
 ## host and port (inside container)
 bind = "127.0.0.1:8000"
 
-## workers (outbound traffic)
-workers = 1  ## one request at a time
+## workers (one fetcher worker publishes a shared snapshot, all workers serve it)
+W_PARAM = os.getenv(key = 'W_PARAM', default = '')  ## serving workers, empty for container cores up to 4
+workers = int(W_PARAM) if W_PARAM else min(4, cpu_count())
 threads = 1
 
 ## timeouts
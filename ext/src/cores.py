@@ -0,0 +1,72 @@
+## libraries
+import os
+import math
+
+## cgroup cpu quota files (v2, then v1 quota and period)
+CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CPU_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+CPU_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+
+## cgroup cpu quota
+def cpu_quota(root = ''):
+
+    """
+    Desc:
+        Returns the cgroup cpu quota of the container in cores (e.g. docker
+        --cpus or compose 'cpus:'), from cgroup v2 'cpu.max' or else cgroup 
+        v1 'cpu.cfs_quota_us' and 'cpu.cfs_period_us'.
+
+    Args:
+        root (str): prefix of the cgroup paths (default none).
+
+    Returns:
+        A positive int rounded up, or None without a quota.
+
+    Raises:
+        None.
+    """
+
+    ## cgroup v2
+    try:
+        with open(root + CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == 'max' else max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+
+    ## cgroup v1
+    try:
+        with open(root + CPU_QUOTA) as f:
+            quota = int(f.read().split()[0])
+        with open(root + CPU_PERIOD) as f:
+            period = int(f.read().split()[0])
+        return None if quota <= 0 else max(1, math.ceil(quota / period))
+    except (OSError, ValueError, IndexError):
+        return None
+
+## container cores
+def cpu_count(root = ''):
+
+    """
+    Desc:
+        Returns the number of cores available to the container, from the cpu 
+        affinity of the process capped by the cgroup cpu quota when one is set.
+
+    Args:
+        root (str): prefix of the cgroup paths (default none).
+
+    Returns:
+        A positive int.
+
+    Raises:
+        None.
+    """
+
+    try:
+        n = len(os.sched_getaffinity(0))
+    except AttributeError:
+        n = os.cpu_count() or 1
+    quota = cpu_quota(root = root)
+    return n if quota is None else min(n, quota)
+
+## end program
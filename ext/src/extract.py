@@ -1,19 +1,58 @@
 ## libraries
 import os
 import ssl
+import gzip
+import time
 import uuid
+import hashlib
+import functools
 import logging
 import aiohttp
 import asyncio
 import selectors
+import statistics
 import configparser
-from datetime import datetime
-from dotenv import load_dotenv
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv, dotenv_values
 from google.transit import gtfs_realtime_pb2
 from urllib.parse import urlparse
+from .share import lock, publish, SharedSnapshot
+from .keys import KeyPool, KeyWait, key_pools, quota
+from .cores import cpu_count
+
+## optional zstd encoding
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+## optional arrow format
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 ## params
 LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
+CODECS = ('zstd', 'gzip') if zstandard is not None else ('gzip',)  ## content encodings (preferred first)
+FORMATS = ('protobuf', 'arrow') if pyarrow is not None else ('protobuf',)  ## response formats
+
+## arrow columns read by subset (one record batch per agency)
+if pyarrow is not None:
+    SCHEMA = pyarrow.schema([
+        ('iata_id', pyarrow.string()),
+        ('vehicle_id', pyarrow.string()),
+        ('trip_id', pyarrow.string()),
+        ('route_id', pyarrow.string()),
+        ('latitude', pyarrow.float32()),
+        ('longitude', pyarrow.float32()),
+        ('timestamp', pyarrow.int64())
+    ])
+    ARROW_HEAD = SCHEMA.serialize().to_pybytes()  ## stream schema message
+ARROW_TAIL = b'\xff\xff\xff\xff\x00\x00\x00\x00'  ## stream end of stream marker
 
 ## logging
 fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
@@ -73,8 +112,85 @@ def ini_key(file, sect = None):
 
     return keys
 
+## region ini files
+def ini_region(file, sect = None):
+
+    """
+    Desc:
+        Loads the keys of the specified section of every .ini file in the 
+        directory of 'file' as a region named after the file (e.g. 
+        'us-east.ini' is region 'us-east').
+
+    Args:
+        file (str): Path of the .ini configuration file.
+        sect (str): Name of the section within the .ini files. Default is None.
+
+    Returns:
+        dict: A dictionary of region names and lists of keys.
+
+    Raises:
+        TypeError: The argument 'file' is not a string.
+    """
+
+    ## arg check
+    if not isinstance(file, str):
+        raise TypeError("The 'file' argument must be a string.")
+
+    ## region per ini file
+    path = os.path.dirname(os.path.abspath(file))
+    regions = dict()
+    for i in sorted(os.listdir(path)):
+        if not i.endswith('.ini'):
+            continue
+        try:
+            regions[i[:-len('.ini')]] = list(ini_key(file = os.path.join(path, i), sect = sect))
+        except KeyError:
+            logger.warning(msg = 'Client found no section {x} in {y}, skipped region.'.format(
+                x = sect,
+                y = i
+                )
+            )
+
+    return regions
+
+## quota ini section
+def ini_quota(file, sect = 'quota'):
+
+    """
+    Desc:
+        Loads the optional quota of each API key pool from the specified 
+        section of the .ini file (e.g. 'API_KEY_DUB=5000/86400').
+
+    Args:
+        file (str): Path of the .ini configuration file.
+        sect (str): Name of the section within the .ini file (default 'quota').
+
+    Returns:
+        dict: A dictionary of pool names and tuples of rate and bucket size.
+
+    Raises:
+        None.
+    """
+
+    try:
+        values = ini_key(file = file, sect = sect)
+    except KeyError:
+        return dict()
+
+    quotas = dict()
+    for i in values:
+        try:
+            quotas[i] = quota(value = values[i])
+        except ValueError as e:
+            logger.error(msg = 'Client ignored quota of {x}: {y}'.format(
+                x = i,
+                y = e
+                )
+            )
+    return quotas
+
 ## env variables
-def env_var(file):
+def env_var(file, override = False, clear = None):
 
     """
     Desc:
@@ -82,6 +198,9 @@ def env_var(file):
 
     Args:
         file (str): The path of the .env file.
+        override (bool): Replace variables already set, as on reload. Default is False.
+        clear (str): Unset variables with this prefix that are not in the file, 
+            as on reload. Default is None.
 
     Returns:
         dict: A dictionary containing the environment variables.
@@ -94,8 +213,14 @@ def env_var(file):
     if not isinstance(file, str):
         raise TypeError("The 'file' argument must be a string.")
 
+    ## unset vars removed from the file
+    if clear is not None:
+        file_vars = dotenv_values(file)
+        for i in [i for i in os.environ if i.startswith(clear) and i not in file_vars]:
+            del os.environ[i]
+
     ## load env vars
-    load_dotenv(file)
+    load_dotenv(file, override = override)
 
     ## output vars
     vars = dict()
@@ -105,9 +230,12 @@ def env_var(file):
     return vars
 
 ## fetch data
-async def fetch(session, url, headers = None, params = None):
+async def fetch(session, url, headers = None, params = None, time_o = None):
+    kwargs = dict()
+    if time_o is not None:
+        kwargs['timeout'] = aiohttp.ClientTimeout(total = time_o)  ## per feed deadline
     try:
-        async with session.get(url = url, headers = headers, params = params) as response:
+        async with session.get(url = url, headers = headers, params = params, **kwargs) as response:
             status = response.status
             content = await response.read()
             response_headers = response.headers
@@ -115,6 +243,410 @@ async def fetch(session, url, headers = None, params = None):
     except Exception as e:
         return e
 
+## retry after header
+def retry_after(headers, default = 0):
+
+    """
+    Desc:
+        Parses the 'Retry-After' header of a response as either a number of 
+        seconds or an HTTP date.
+
+    Args:
+        headers (dict): response headers.
+        default (int): seconds when missing or invalid (default 0).
+
+    Returns:
+        A float of seconds to wait.
+
+    Raises:
+        None.
+    """
+
+    value = headers.get('Retry-After') if headers is not None else None
+    if value is None:
+        return float(default)
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return float(default)
+
+## parse and validate feed
+def proc_feed(content, iata, codecs = (), arrow = False):
+
+    """
+    Desc:
+        Parses a protobuf feed, validates its header and entities, reassigns 
+        vehicle ids and labels, and serializes it again, compressed once per 
+        codec. With 'arrow', the columns subset reads are also serialized as
+        one Arrow record batch, see 'arrow_batch'. Takes and returns bytes 
+        only, so it runs in a process pool as well as inline.
+
+    Args:
+        content (bytes): raw protobuf feed.
+        iata (str): IATA code of the agency (e.g. 'NYC').
+        codecs (tuple): content encodings to compress with (default none).
+        arrow (bool): serialize an Arrow record batch (default False).
+
+    Returns:
+        A tuple of the header timestamp, the serialized protobuf message, and
+        a dict of compressed messages per codec (and Arrow batches as 'arrow'
+        and 'arrow-<codec>'), or None for both when the header is invalid 
+        (strict order).
+
+    Raises:
+        google.protobuf.message.DecodeError: If the feed fails to parse.
+    """
+
+    ## parse protobuf
+    message = gtfs_realtime_pb2.FeedMessage()
+    message.ParseFromString(
+        bytes(content)
+    )
+    logger.debug(msg = 'Client successfully parsed protobuf message.')
+
+    # validate message header
+    if (message.header.gtfs_realtime_version == '2.0' or
+        message.header.gtfs_realtime_version == '1.0' or
+        message.header.gtfs_realtime_version == '0.1') and \
+            message.header.incrementality == gtfs_realtime_pb2.FeedHeader.FULL_DATASET:
+        logger.debug(msg = 'Client successfully validated protobuf message header.')
+
+        ## validate entity
+        entity_valid = [j for j in message.entity if (
+            (j.vehicle.vehicle.id or (j.vehicle.vehicle.label and j.id)) and
+            j.vehicle.timestamp and
+            j.vehicle.position.latitude and
+            j.vehicle.position.longitude and
+            (j.vehicle.trip.route_id or j.vehicle.trip.trip_id)
+        )]
+        for j in entity_valid:
+            if not j.vehicle.vehicle.id and j.vehicle.vehicle.label and j.id:
+                j.vehicle.vehicle.id = j.id  ## reassign vehicle id with label
+            j.vehicle.vehicle.label = iata  ## reassign vehicle label with IATA code
+
+        ## final message validation
+        del message.entity[:]
+        message.entity.extend(entity_valid)
+        logger.debug(msg = 'Client successfully processed protobuf message entity.')
+        data = message.SerializeToString()
+        codes = {i: encode(data = data, codec = i) for i in codecs}
+        if arrow:
+            batch = arrow_batch(entity = entity_valid)
+            codes['arrow'] = batch
+            codes.update({'arrow-' + i: encode(data = batch, codec = i) for i in codecs})
+        return message.header.timestamp, data, codes
+
+    return message.header.timestamp, None, None
+
+## arrow record batch
+def arrow_batch(entity):
+
+    """
+    Desc:
+        Serializes the iata id, vehicle id, trip id, route id, position, and
+        timestamp of validated entities as one Arrow IPC record batch message.
+        Batches of all agencies are sent between one schema message and the
+        end of stream marker, which reads as one Arrow stream.
+
+    Args:
+        entity (list): validated protobuf entities with reassigned labels.
+
+    Returns:
+        Bytes.
+
+    Raises:
+        None.
+    """
+
+    vehicles = [i.vehicle for i in entity]
+    return pyarrow.record_batch([
+        pyarrow.array([i.vehicle.label for i in vehicles], type = pyarrow.string()),
+        pyarrow.array([i.vehicle.id for i in vehicles], type = pyarrow.string()),
+        pyarrow.array([i.trip.trip_id for i in vehicles], type = pyarrow.string()),
+        pyarrow.array([i.trip.route_id for i in vehicles], type = pyarrow.string()),
+        pyarrow.array([i.position.latitude for i in vehicles], type = pyarrow.float32()),
+        pyarrow.array([i.position.longitude for i in vehicles], type = pyarrow.float32()),
+        pyarrow.array([i.timestamp for i in vehicles], type = pyarrow.int64())
+    ], schema = SCHEMA).serialize().to_pybytes()
+
+## content encoding
+def encode(data, codec):
+
+    """
+    Desc:
+        Compresses bytes as one gzip member or one zstd frame. Members and 
+        frames decode back to back, so per agency bodies are compressed once 
+        and concatenated per request.
+
+    Args:
+        data (bytes): bytes to compress.
+        codec (str): 'gzip' or 'zstd'.
+
+    Returns:
+        Bytes.
+
+    Raises:
+        ValueError: If 'codec' is not supported.
+    """
+
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel = 6, mtime = 0)
+    if codec == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level = 3).compress(data)
+    raise ValueError('Client does not support content encoding {x}.'.format(x = codec))
+
+## negotiate content encoding
+def accept(header, codecs = CODECS):
+
+    """
+    Desc:
+        Selects the content encoding from an 'Accept-Encoding' header by 
+        quality value, preferring 'codecs' order on ties.
+
+    Args:
+        header (str): 'Accept-Encoding' header of the request.
+        codecs (tuple): content encodings offered (default 'CODECS').
+
+    Returns:
+        A str of the codec, or None for identity.
+
+    Raises:
+        None.
+    """
+
+    if not header:
+        return None
+    quality = dict()
+    for i in header.split(','):
+        name, _, param = i.strip().partition(';')
+        q = 1.0
+        param = param.strip()
+        if param.startswith('q='):
+            try:
+                q = float(param[2:])
+            except ValueError:
+                q = 0.0
+        quality[name.strip().lower()] = q
+    codecs = [i for i in codecs if quality.get(i, quality.get('*', 0.0)) > 0]
+    if not codecs:
+        return None
+    return max(codecs, key = lambda i: quality.get(i, quality.get('*', 0.0)))
+
+## cached buffers
+def blob_keys(codecs = (), forms = ()):
+
+    """
+    Desc:
+        Returns the names of the buffers encoded once per feed update for the
+        configured content encodings and formats, as keys of the dict of 
+        compressed messages returned by 'proc_feed'.
+
+    Args:
+        codecs (tuple): content encodings (default none).
+        forms (tuple): response formats (default none, protobuf only).
+
+    Returns:
+        A tuple of str.
+
+    Raises:
+        None.
+    """
+
+    arrow = ('arrow',) + tuple('arrow-' + i for i in codecs) if 'arrow' in forms else ()
+    return tuple(codecs) + arrow
+
+## varint length prefix
+def varint(n):
+    out = bytearray()
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+## frame feed chunks
+def frame(chunks, framing = None, codec = None, sizes = None):
+
+    """
+    Desc:
+        Frames a list of serialized protobuf messages as a response body 
+        without joining them. By default the messages are sent back to back, 
+        which parses as one merged message. With 'delimited', each message is
+        prefixed with its varint length, so consumers parse each message as
+        soon as it arrives. With 'codec', the chunks are already compressed 
+        and each prefix is compressed on its own.
+
+    Args:
+        chunks (list): serialized protobuf messages, compressed with 'codec'.
+        framing (str): None or 'delimited' (default None).
+        codec (str): content encoding of the chunks (default None).
+        sizes (list): uncompressed size of each chunk (default chunk size).
+
+    Returns:
+        A list of bytes.
+
+    Raises:
+        ValueError: If 'framing' is not None or 'delimited'.
+    """
+
+    if framing is None:
+        return chunks
+    if framing == 'delimited':
+        sizes = sizes if sizes is not None else [len(i) for i in chunks]
+        prefix = [varint(i) for i in sizes]
+        if codec is not None:
+            prefix = [encode(data = i, codec = codec) for i in prefix]
+        return [j for i in zip(prefix, chunks) for j in i]
+    raise ValueError("The 'framing' argument must be None or 'delimited'.")
+
+## feed schedule
+class FeedState():
+    def __init__(self, key, url, time_r = 30, time_min = 5, time_max = 60, time_l = 1):
+
+        """
+        Desc:
+            Polling schedule of one agency feed. Learns the publish interval 
+            from changes in 'FeedHeader.timestamp' and the offset between the 
+            agency clock and ours from the age of each feed at fetch, then 
+            plans the next poll just after the expected next publish.
+
+        Args:
+            key (str): .ini key of the feed (e.g. 'API_END_NYC').
+            url (str): URL of the feed.
+            time_r (pos int): fallback seconds between polls (default 30).
+            time_min (pos int): min seconds between polls (default 5).
+            time_max (pos int): max seconds between polls (default 60).
+            time_l (pos int): seconds to poll after expected publish (default 1).
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.key = key
+        self.url = url
+        self.time_r = time_r
+        self.time_min = time_min
+        self.time_max = time_max
+        self.time_l = time_l
+        self.time_f = None  ## last header timestamp
+        self.time_w = 0.0  ## suspended until (epoch)
+        self.time_i = deque(maxlen = 9)  ## publish intervals
+        self.time_a = deque(maxlen = 9)  ## feed age at fetch
+        self.changed = False  ## new header timestamp on last poll
+
+        ## conditional request and dedupe
+        self.etag = None  ## last 'ETag' header
+        self.time_m = None  ## last 'Last-Modified' header
+        self.digest = b''  ## hash of last processed raw feed
+
+        ## request latency
+        self.time_q = deque(maxlen = 50)  ## seconds of recent requests
+
+    ## publish interval
+    def interval(self):
+        if not self.time_i:
+            return None
+        return min(self.time_max, max(self.time_min, statistics.median(self.time_i)))
+
+    ## learn from header timestamp
+    def learn(self, time_f, time_t):
+        self.changed = bool(time_f) and time_f != self.time_f
+        if not time_f:
+            return
+        self.time_a.append(time_t - time_f)
+        if self.time_f is not None and time_f > self.time_f:
+            self.time_i.append(time_f - self.time_f)
+        self.time_f = max(time_f, self.time_f or 0)
+
+    ## suspend polling
+    def suspend(self, time_w, time_t):
+        self.time_w = max(self.time_w, time_t + time_w)
+
+    ## seconds until next poll
+    def plan(self, time_t):
+
+        """
+        Desc:
+            Returns the seconds until the next poll. Suspended feeds wait out 
+            the suspension. Feeds without header timestamps poll every 
+            'time_r' seconds. Feeds with a learned interval poll 'time_l' 
+            seconds after the expected next publish, or after 'time_min' 
+            seconds when that publish is already due.
+
+        Args:
+            time_t (float): epoch time in seconds.
+
+        Returns:
+            A float of seconds.
+
+        Raises:
+            None.
+        """
+
+        ## rate limited
+        if self.time_w > time_t:
+            return self.time_w - time_t
+
+        ## no header timestamp
+        if not self.time_f:
+            return float(self.time_r)
+
+        ## learning interval
+        time_i = self.interval()
+        if time_i is None:
+            return float(self.time_min)
+
+        ## expected next publish (local clock)
+        time_e = self.time_f + min(self.time_a) + time_i + self.time_l
+        return min(self.time_max, max(self.time_min, time_e - time_t))
+
+    ## hedge delay
+    def hedge(self, q = 0.95, n = 10, r = 2.0):
+
+        """
+        Desc:
+            Returns the 'q' percentile of recent request latency, after which a
+            hedged second request is sent, once 'n' requests were timed. Only 
+            feeds with an erratic tail, whose 'q' percentile is at least 'r' 
+            times the median, are hedged, so stable feeds do not spend API 
+            key quota on duplicate requests.
+
+        Args:
+            q (float): percentile between 0 and 1 (default 0.95).
+            n (pos int): min number of timed requests (default 10).
+            r (float): min ratio of percentile to median latency (default 2).
+
+        Returns:
+            A float of seconds, or None while learning or when the tail is 
+            stable.
+
+        Raises:
+            None.
+        """
+
+        if len(self.time_q) < n:
+            return None
+        time_q = sorted(self.time_q)
+        time_h = time_q[int(q * (len(time_q) - 1))]
+        if time_h < r * statistics.median(time_q):
+            return None  ## stable tail
+        return time_h
+
+    ## conditional request headers
+    def cond(self):
+        headers = dict()
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.time_m:
+            headers['If-Modified-Since'] = self.time_m
+        return headers
+
 ## client to extract data
 class ExtractClient():
     def __init__(self, env_file, ini_file, ini_sect):
@@ -128,9 +660,11 @@ class ExtractClient():
             ini_sect (str): Section of the .ini configuration file to use (optional).
 
         Returns:
-            A tuple with three elements:
-            - A serialized protobuf message response.
-            - An HTTP status code (200 good, 500 error).
+            None. The latest validated feed of each agency is kept in a snapshot
+            cache refreshed by one polling task per feed (see 'start') and read 
+            with 'read' as a tuple with three elements:
+            - A list of serialized protobuf messages, one per agency.
+            - An HTTP status code (200 good, 202 empty, 304 unchanged).
             - A dictionary with three key-value pairs indicating content type, content
               length, and connection type.
 
@@ -151,22 +685,94 @@ class ExtractClient():
         self.ini_sect = ini_sect
         self.key_last = dict()
 
+        ## snapshot cache
+        self.cache = dict()  ## latest feed per agency (time, bytes, compressed bytes per codec)
+        self.feeds = list()  ## latest snapshot of all agencies (buffer per agency)
+        self.codes = dict()  ## compressed snapshot buffers per codec, and arrow batches
+        self.codecs = ('gzip',)  ## content encodings compressed per feed update
+        self.forms = ('protobuf',)  ## response formats
+        self.blobs = blob_keys(codecs = self.codecs, forms = self.forms)  ## cached buffers per feed
+        self.live = list()  ## .ini keys of the snapshot buffers
+        self.time_s = 120  ## stale limit (seconds)
+        self.time_d = 20  ## per feed deadline (seconds)
+        self.hedge_q = 0.95  ## latency percentile to hedge requests after
+        self.hedge_r = 2.0  ## min ratio of percentile to median latency to hedge
+        self.polls = set()  ## polls still running after a cycle deadline
+        self.time_n = 0.0  ## snapshot time
+        self.etag = None  ## snapshot version
+        self.dirty = False  ## cache changed since snapshot
+        self.session = None
+
+        ## shared snapshot across workers
+        self.path = None  ## shared snapshot file
+        self.lock = None  ## fetcher lock (fetcher worker only)
+        self.shared = None  ## mapped snapshot (other workers only)
+        self.time_p = 0.0  ## publish time
+        self.etag_p = None  ## published snapshot version
+        self.conf = dict()  ## polling params
+        self.task_s = None
+        self.time_u = 0.0  ## last reload trigger seen (mtime)
+
+        ## process pool (bytes in, bytes out)
+        self.pool = None
+        self.size_p = 65536  ## min feed size to process in pool (bytes)
+
+        ## record and replay raw feeds
+        self.recorder = None  ## appends raw feeds to segment files
+        self.replayer = None  ## replays segment files instead of polling
+        self.rec_pool = None  ## one writer thread keeps records in order
+
+        ## per feed schedule
+        self.state = dict()
+        self.tasks = dict()
+
         ## api keys
         self.keys = env_var(
             file = self.env_file
         )
 
+        ## api key pools with optional quota per key
+        quotas = ini_quota(file = self.ini_file)
+        self.pools = dict()
+        for name, keys in key_pools(env = self.keys).items():
+            rate, size = quotas.get(name, (None, 1.0))
+            self.pools[name] = KeyPool(name = name, keys = keys, rate = rate, size = size)
+
         ## api endpoints (gtfs realtime feeds)
         self.urls = ini_key(
             file = self.ini_file,
             sect = self.ini_sect
         )
+        for i, url in self.urls.items():
+            self.state[i] = FeedState(key = i, url = url)
+
+        ## agency and region filters
+        self.iata = {i.upper()[-3:]: i for i in self.urls}
+        self.regions = ini_region(
+            file = self.ini_file,
+            sect = self.ini_sect
+        )
+
+    ## take api key from pool
+    def pool_key(self, name, url):
+
+        """
+        Desc:
+            Takes the API key with the most headroom from a key pool.
+
+        Args:
+            name (str): pool name (e.g. 'API_KEY_DUB').
+            url (str): URL of the feed.
+
+        Returns:
+            A str of the API key.
 
-    ## toggle between two api keys
-    def alt_key(self, url, keys):
-        second = datetime.now().second
-        key = keys[second % len(keys)]
+        Raises:
+            KeyError: If the pool has no keys.
+            KeyWait: If no key of the pool has headroom.
+        """
 
+        key = self.pools[name].take(time_t = time.time())
         logger.debug(msg = 'Client used API key {x} for URL {y}'.format(
             x = hash(key),  ## hash of the key for security
             y = url
@@ -174,11 +780,36 @@ class ExtractClient():
         )
         return key
 
-    ## extract data
-    async def run(self):
+    ## open pooled session
+    async def open(self):
+
+        """
+        Desc:
+            Opens the long-lived client session shared by every extract run, if
+            not already open. Connections are kept alive and pooled per host, 
+            and DNS lookups are cached, so each run reuses warm TCP and TLS 
+            connections instead of repeating handshakes to every agency.
+
+        Args:
+            None.
+
+        Returns:
+            An aiohttp client session.
+
+        Raises:
+            None.
+        """
+
+        if self.session is not None and not self.session.closed:
+            return self.session
+
         connector = aiohttp.TCPConnector(
             ssl = ssl_context if 'https' in self.urls else False,
-            keepalive_timeout = 120
+            limit_per_host = 4,  ## per agency host
+            ttl_dns_cache = 300,  ## cached dns (seconds)
+            use_dns_cache = True,
+            keepalive_timeout = 120,
+            enable_cleanup_closed = True
         )
 
         ## stop auto headers
@@ -188,357 +819,1219 @@ class ExtractClient():
             aiohttp.hdrs.CONNECTION,
             aiohttp.hdrs.CACHE_CONTROL
         }
-        headers_master = {
-            'User-Agent': 'GRD-TRT-BUF-4I/0.0.1',
-            'Accept': '*/*',
-            'Connection': 'keep-alive',
-            'Cache-Control': 'no-cache',
-            'Request-Id': str(uuid.uuid4())  ## generate unique token for each request
-        }
 
         ## create session
-        async with aiohttp.ClientSession(
+        self.session = aiohttp.ClientSession(
             connector = connector,
-            loop = asyncio.get_event_loop(),
             skip_auto_headers = skip_auto_headers,
             trust_env = True,
             timeout = aiohttp.ClientTimeout(total = 120)
-            ) as session:
-
-            ## add headers and params for selected endpoints
-            connection = list()
-            for i, url in self.urls.items():
-                headers = headers_master.copy()
-
-                ## add host header based on the url's host
-                parsed_url = urlparse(url)
-                headers['Host'] = parsed_url.netloc
-
-                ## default params
-                params = None
-
-                ## new york
-                if i == 'API_END_NYC':
-                    params = {'key': self.keys['API_KEY_NYC']}
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers,
-                            params = params
-                        )
-                    )
-                ## wash dc
-                elif i == 'API_END_DCA':
-                    headers['api_key'] = self.keys['API_KEY_DCA']
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers
-                        )
-                    )
-                ## los angeles, miami
-                elif i in ['API_END_LAX', 'API_END_MIA', 'API_END_TPA']:
-                    headers['Authorization'] = self.keys['API_KEY_LBM']
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers
-                        )
-                    )
-                ## san fran
-                elif i == 'API_END_SFO':
-                    params = {
-                        'api_key': self.keys['API_KEY_SFO'],
-                        'agency': 'RG'
-                    }
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers,
-                            params = params
-                        )
-                    )
-                ## san diego
-                elif i == 'API_END_SAN':
-                    params = {
-                        'key': self.keys['API_KEY_SAN']
-                    }
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers,
-                            params = params
-                        )
-                    )
-                ## portland
-                elif i == 'API_END_PDX':
-                    params = {'appID': self.keys['API_KEY_PDX']}
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers,
-                            params = params
-                        )
-                    )
-                ## phoenix
-                elif i == 'API_END_PHX':
-                    params = {'apiKey': self.keys['API_KEY_PHX']}
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers,
-                            params = params
-                        )
-                    )
-                ## montreal
-                elif i == 'API_END_YUL':
-                    headers['apiKey'] = self.keys['API_KEY_YUL']
-                    headers['Accept'] = 'application/x-protobuf'  ## required to return protobufs
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers
-                        )
-                    )
-                ## vancouver
-                elif i == 'API_END_YVR':
-                    params = {'apikey': self.keys['API_KEY_YVR']}
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers,
-                            params = params
-                        )
-                    )
-                ## stockholm
-                elif i == 'API_END_ARN':
-                    params = {'key': self.keys['API_KEY_ARN']}
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers,
-                            params = params
-                        )
-                    )
-                ## dublin
-                elif i == 'API_END_DUB':
-                    keys = (self.keys['API_KEY_DUB_A'], self.keys['API_KEY_DUB_B'])
-                    headers['x-api-key'] = self.alt_key(  ## toggle api keys
-                        url = url,
-                        keys = keys
-                    )
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers
-                        )
-                    )
-                ## sydney
-                elif i == 'API_END_SYD':
-                    headers['Authorization'] = 'apikey' + ' ' + self.keys['API_KEY_SYD']
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers
-                        )
-                    )
-                ## auckland
-                elif i == 'API_END_AKL':
-                    headers['Ocp-Apim-Subscription-Key'] = self.keys['API_KEY_AKL']
-                    headers['Accept'] = 'application/x-protobuf'  ## required to return protobufs
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers
-                        )
-                    )
-                ## christchurch
-                elif i == 'API_END_CHC':
-                    headers['Ocp-Apim-Subscription-Key'] = self.keys['API_KEY_CHC']
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers
-                        )
-                    )
-                ## delhi
-                elif i == 'API_END_DEL':
-                    params = {'key': self.keys['API_KEY_DEL']}
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers,
-                            params = params
-                        )
-                    )
-                ## other cities without headers and params
-                else:
-                    connection.append(
-                        fetch(
-                            session,
-                            url = url,
-                            headers = headers_master
-                        )
-                    )
+        )
+        logger.info(msg = 'Client opened pooled session.')
+        return self.session
 
-                ## log request headers before sending requests
-                logger.debug('Request headers for {x}: {y}'.format(
-                    x = url,
-                    y = headers
-                ))
-
-            ## join requests and process responses
-            response = await asyncio.gather(*connection, return_exceptions = True)
-            feeds = bytes()
-            for url_idx, result in enumerate(response):
-
-                ## log response status
-                url_log = list(self.urls.values())[url_idx]
-                content = None
-
-                ## failed request
-                if isinstance(result, Exception):
-                    if hasattr(result, 'status'):
-
-                        ## exceeded rate limit response
-                        if result.status == 429:
-                            t_retry = int(result.headers.get('Retry-After', 0))
-                            logger.warning(
-                                msg = 'GET request to {x} rate limited with HTTP status code {y}. Retry after {t} seconds.'.format(
-                                    x = url_log,
-                                    y = result.status,
-                                    t = t_retry
-                                )
-                            )
-                            continue  # proceeds to next url upon exception
-
-                        ## other unsuccessful response
-                        elif result.status != 200:
-                            logger.warning(
-                                msg = 'GET request to {x} unsuccessful with HTTP status code {y}.'.format(
-                                    x = url_log,
-                                    y = result.status
-                                )
-                            )
-                            continue  ## proceeds to next url upon exception
-                    else:
-                        logger.error(
-                            msg = 'GET request to {x} failed with exception: {e}.'.format(
-                                x = url_log,
-                                e = result
-                            )
-                        )
-                    continue  ## proceeds to next url upon exception
-
-                ## successful response
-                else:
-                    status, content, response_headers = result
-
-                    if status == 429:
-                        t_retry = int(response_headers.get('Retry-After', 0))
-                        logger.warning(
-                            msg = 'GET request to {x} rate limited with HTTP status code {y}. Retry after {t} seconds.'.format(
-                                x = url_log,
-                                y = status,
-                                t = t_retry
-                            )
-                        )
-                        continue  # proceeds to next url upon exception
+    ## request headers and params
+    def req_args(self, i, url):
 
-                    elif status != 200:
-                        logger.warning(
-                            msg = 'GET request to {x} unsuccessful with HTTP status code {y}.'.format(
-                                x = url_log,
-                                y = status
-                            )
-                        )
-                        continue  ## proceeds to next url upon exception
+        """
+        Desc:
+            Builds the request headers and params of a feed, including the API 
+            key of agencies that require one, taken from its key pool.
 
-                    else:
-                        logger.debug(
-                            msg = 'GET request to {x} successful with HTTP status code {y}.'.format(
-                                x = url_log,
-                                y = status
-                            )
-                        )
+        Args:
+            i (str): .ini key of the feed (e.g. 'API_END_NYC').
+            url (str): URL of the feed.
+
+        Returns:
+            A tuple of request headers, params, and the pool name and API key 
+            used or None (strict order).
+
+        Raises:
+            KeyError: If a required API key is missing.
+            KeyWait: If no API key of the pool has headroom.
+        """
+
+        ## api key from pool
+        cred = list()
+        def key(name):
+            value = self.pool_key(name = name, url = url)
+            cred.append((name, value))
+            return value
+
+        headers_master = {
+            'User-Agent': 'GRD-TRT-BUF-4I/0.0.1',
+            'Accept': '*/*',
+            'Connection': 'keep-alive',
+            'Cache-Control': 'no-cache',
+            'Request-Id': str(uuid.uuid4())  ## generate unique token for each request
+        }
+        headers = headers_master.copy()
+
+        ## add host header based on the url's host
+        parsed_url = urlparse(url)
+        headers['Host'] = parsed_url.netloc
+
+        ## default params
+        params = None
+
+        ## new york
+        if i == 'API_END_NYC':
+            params = {'key': key('API_KEY_NYC')}
+        ## wash dc
+        elif i == 'API_END_DCA':
+            headers['api_key'] = key('API_KEY_DCA')
+        ## los angeles, miami
+        elif i in ['API_END_LAX', 'API_END_MIA', 'API_END_TPA']:
+            headers['Authorization'] = key('API_KEY_LBM')
+        ## san fran
+        elif i == 'API_END_SFO':
+            params = {
+                'api_key': key('API_KEY_SFO'),
+                'agency': 'RG'
+            }
+        ## san diego
+        elif i == 'API_END_SAN':
+            params = {
+                'key': key('API_KEY_SAN')
+            }
+        ## portland
+        elif i == 'API_END_PDX':
+            params = {'appID': key('API_KEY_PDX')}
+        ## phoenix
+        elif i == 'API_END_PHX':
+            params = {'apiKey': key('API_KEY_PHX')}
+        ## montreal
+        elif i == 'API_END_YUL':
+            headers['apiKey'] = key('API_KEY_YUL')
+            headers['Accept'] = 'application/x-protobuf'  ## required to return protobufs
+        ## vancouver
+        elif i == 'API_END_YVR':
+            params = {'apikey': key('API_KEY_YVR')}
+        ## stockholm
+        elif i == 'API_END_ARN':
+            params = {'key': key('API_KEY_ARN')}
+        ## dublin
+        elif i == 'API_END_DUB':
+            headers['x-api-key'] = key('API_KEY_DUB')  ## pool of keys A and B
+        ## sydney
+        elif i == 'API_END_SYD':
+            headers['Authorization'] = 'apikey' + ' ' + key('API_KEY_SYD')
+        ## auckland
+        elif i == 'API_END_AKL':
+            headers['Ocp-Apim-Subscription-Key'] = key('API_KEY_AKL')
+            headers['Accept'] = 'application/x-protobuf'  ## required to return protobufs
+        ## christchurch
+        elif i == 'API_END_CHC':
+            headers['Ocp-Apim-Subscription-Key'] = key('API_KEY_CHC')
+        ## delhi
+        elif i == 'API_END_DEL':
+            params = {'key': key('API_KEY_DEL')}
+        ## other cities without headers and params
+        else:
+            headers = headers_master
+
+        ## log request headers before sending requests
+        logger.debug('Request headers for {x}: {y}'.format(
+            x = url,
+            y = headers
+        ))
+        return headers, params, cred[0] if cred else None
+
+    ## fetch and process one feed
+    async def poll(self, i):
+
+        """
+        Desc:
+            Requests one agency feed, validates it, and replaces its entry in the
+            snapshot cache. Updates the feed schedule from the header timestamp,
+            and suspends the feed for the 'Retry-After' time when rate limited.
+
+        Args:
+            i (str): .ini key of the feed (e.g. 'API_END_NYC').
+
+        Returns:
+            True if the feed was cached, otherwise False.
+
+        Raises:
+            None.
+        """
+
+        session = await self.open()  ## persistent pooled session
+        url_log = self.urls[i]
+        state = self.state[i]
+
+        ## request args with api key from pool
+        def args():
+            headers, params, cred = self.req_args(i = i, url = url_log)
+            if i in self.cache:
+                headers.update(state.cond())  ## conditional request when cached before
+            return headers, params, cred
+
+        try:
+            request = args()
+        except KeyError as e:
+            logger.error(msg = 'Client is missing API key {x} for {y}.'.format(
+                x = e,
+                y = url_log
+                )
+            )
+            return False
+        except KeyWait as e:
+            state.suspend(time_w = e.time_w, time_t = time.time())  ## wait for headroom
+            logger.debug(msg = 'Client deferred GET request to {x}: {y}'.format(
+                x = url_log,
+                y = e
+                )
+            )
+            return False
 
-                ## parse protobuf
-                if content:
+        ## timed request
+        async def req(headers, params, cred):
+            time_0 = time.monotonic()
+            result = await fetch(
+                session,
+                url = url_log,
+                headers = headers,
+                params = params,
+                time_o = self.time_d
+            )
+            if not isinstance(result, Exception):
+                state.time_q.append(time.monotonic() - time_0)
+            return result, cred
+
+        ## hedged request after learned percentile delay
+        tasks = {asyncio.ensure_future(req(*request))}
+        result, cred = None, None
+        try:
+            time_h = state.hedge(q = self.hedge_q, r = self.hedge_r)
+            if time_h is not None and time_h < self.time_d:
+                done, _ = await asyncio.wait(tasks, timeout = time_h)
+                if not done:
                     try:
-                        message = gtfs_realtime_pb2.FeedMessage()
-                        message.ParseFromString(
-                            bytes(content)
-                        )
-                        logger.debug(msg = 'Client successfully parsed protobuf message.')
-                    except Exception as e:
-                        logger.error(
-                            msg = 'Client failed to parse protobuf message from {url}: {x}'.format(
-                                url = url_log,
-                                x = e
+                        tasks.add(asyncio.ensure_future(req(*args())))
+                        logger.debug(msg = 'Client hedged GET request to {x} after {y:.2f} seconds.'.format(
+                            x = url_log,
+                            y = time_h
                             )
                         )
-                        continue
-
-                ## unsuccessful protobuf response, http status, headers (strict order)
-                else:
-                    logger.warning(msg = 'Client found no protobuf response to parse.')
-                    return None, 202, {
-                        'Content-Type': 'application/x-protobuf',
-                        'Content-Length': 0,
-                        'Connection': 'keep-alive'
-                    }
-
-                # validate message header
-                if (message.header.gtfs_realtime_version == '2.0' or
-                    message.header.gtfs_realtime_version == '1.0' or
-                    message.header.gtfs_realtime_version == '0.1') and \
-                        message.header.incrementality == gtfs_realtime_pb2.FeedHeader.FULL_DATASET:
-                    logger.debug(msg = 'Client successfully validated protobuf message header.')
-
-                    ## validate entity
-                    entity_valid = [j for j in message.entity if (
-                        (j.vehicle.vehicle.id or (j.vehicle.vehicle.label and j.id)) and
-                        j.vehicle.timestamp and
-                        j.vehicle.position.latitude and
-                        j.vehicle.position.longitude and
-                        (j.vehicle.trip.route_id or j.vehicle.trip.trip_id)
-                    )]
-                    url_key = list(self.urls.keys())[url_idx]
-                    for j in entity_valid:
-                        if not j.vehicle.vehicle.id and j.vehicle.vehicle.label and j.id:
-                            j.vehicle.vehicle.id = j.id  ## reassign vehicle id with label
-                        j.vehicle.vehicle.label = url_key.upper()[-3:]  ## reassign vehicle label with IATA code
-
-                    ## final message validation
-                    del message.entity[:]
-                    message.entity.extend(entity_valid)
-                    logger.debug(msg = 'Client successfully processed protobuf message entity.')
-
-                    ## serialize message, append to feed, update content length
-                    feeds += message.SerializeToString()
-                    content_length = len(feeds) if feeds else 0
-
-            ## successful protobuf response, http status, headers (strict order)
-            logger.info(msg = 'Client successfully processed GET request.')
-            return feeds, 200, {
+                    except (KeyError, KeyWait):
+                        pass  ## no headroom to hedge
+
+            ## first response wins, unless it failed and another is pending
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when = asyncio.FIRST_COMPLETED)
+                results = [j.result() for j in done]
+                result, cred = next((j for j in results if not isinstance(j[0], Exception)), results[0])
+                if not isinstance(result, Exception):
+                    break
+        finally:
+            for j in tasks:
+                j.cancel()
+
+        return await self.proc(i = i, result = result, cred = cred)  ## process as soon as it arrives
+
+    ## process one response
+    async def proc(self, i, result, cred = None):
+
+        """
+        Desc:
+            Handles the response of one agency feed. Parses and validates the 
+            protobuf message, reassigns vehicle ids and labels, and replaces the 
+            feed in the snapshot cache.
+
+        Args:
+            i (str): .ini key of the feed (e.g. 'API_END_NYC').
+            result (tuple): status, content, and headers, or an exception.
+            cred (tuple): pool name and API key of the request (default None).
+
+        Returns:
+            True if the feed was cached, otherwise False.
+
+        Raises:
+            None.
+        """
+
+        ## feed removed by a reload while requested
+        if i not in self.state:
+            return False
+
+        url_log = self.urls[i]
+        state = self.state[i]
+        time_t = time.time()
+        content = None
+
+        ## exceeded deadline, drop feed from this cycle
+        if isinstance(result, asyncio.TimeoutError):
+            logger.warning(
+                msg = 'GET request to {x} exceeded deadline of {y} seconds, dropped from this cycle.'.format(
+                    x = url_log,
+                    y = self.time_d
+                )
+            )
+            return False
+
+        ## failed request
+        elif isinstance(result, Exception):
+            status = getattr(result, 'status', None)
+            response_headers = getattr(result, 'headers', None)
+            if status is None:
+                logger.error(
+                    msg = 'GET request to {x} failed with exception: {e}.'.format(
+                        x = url_log,
+                        e = result
+                    )
+                )
+                return False
+
+        ## completed request
+        else:
+            status, content, response_headers = result
+
+        ## exceeded rate limit response
+        if status == 429:
+            t_retry = retry_after(headers = response_headers, default = state.time_r)
+
+            ## back off the key, feed waits for the next key with headroom
+            if cred is not None:
+                pool = self.pools[cred[0]]
+                pool.backoff(key = cred[1], time_w = t_retry, time_t = time_t)
+                t_retry = pool.wait(time_t = time_t)
+            state.suspend(time_w = t_retry, time_t = time_t)
+            logger.warning(
+                msg = 'GET request to {x} rate limited with HTTP status code {y}. Retry after {t} seconds.'.format(
+                    x = url_log,
+                    y = status,
+                    t = t_retry
+                )
+            )
+            return False  ## suspends feed until retry
+
+        ## not modified since last poll
+        elif status == 304 and i in self.cache:
+            logger.debug(msg = 'GET request to {x} not modified, reused cached feed.'.format(
+                x = url_log
+                )
+            )
+            return self.keep(i = i, time_t = time_t)
+
+        ## other unsuccessful response
+        elif status != 200:
+            logger.warning(
+                msg = 'GET request to {x} unsuccessful with HTTP status code {y}.'.format(
+                    x = url_log,
+                    y = status
+                )
+            )
+            return False
+
+        else:
+            logger.debug(
+                msg = 'GET request to {x} successful with HTTP status code {y}.'.format(
+                    x = url_log,
+                    y = status
+                )
+            )
+
+        ## record raw feed, unchanged feeds too to keep recorded timing
+        if self.recorder is not None and content:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    self.rec_pool, self.recorder.write, i, self.urls[i], content, time_t
+                )
+            except OSError as e:
+                logger.error(msg = 'Client failed to record feed from {x}: {y}'.format(
+                    x = url_log,
+                    y = e
+                    )
+                )
+
+        ## skip parse when raw feed is unchanged
+        if content:
+            digest = hashlib.blake2b(content, digest_size = 16).digest()
+            if digest == state.digest and i in self.cache:
+                state.etag = response_headers.get('ETag')
+                state.time_m = response_headers.get('Last-Modified')
+                logger.debug(msg = 'Client found unchanged feed from {x}, reused cached feed.'.format(
+                    x = url_log
+                    )
+                )
+                return self.keep(i = i, time_t = time_t)
+
+        ## unsuccessful protobuf response
+        if not content:
+            logger.warning(msg = 'Client found no protobuf response to parse from {url}.'.format(
+                url = url_log
+                )
+            )
+            return False
+
+        ## parse and validate protobuf off the event loop
+        try:
+            time_f, data, codes = await self.parse(content = content, iata = i.upper()[-3:])
+        except Exception as e:
+            logger.error(
+                msg = 'Client failed to parse protobuf message from {url}: {x}'.format(
+                    url = url_log,
+                    x = e
+                )
+            )
+            return False
+
+        ## learn publish interval
+        state.learn(time_f = time_f, time_t = time_t)
+        if data is None:
+            return False
+
+        ## replace agency feed in cache
+        self.cache[i] = (time_t, data, codes)
+        state.digest = digest
+        state.etag = response_headers.get('ETag')
+        state.time_m = response_headers.get('Last-Modified')
+        self.dirty = True
+        return True
+
+    ## parse feed
+    async def parse(self, content, iata):
+
+        """
+        Desc:
+            Runs 'proc_feed' in the process pool, so large feeds do not block 
+            the event loop. Feeds smaller than 'size_p' bytes, or all feeds 
+            when there is no pool or it broke, are processed inline.
+
+        Args:
+            content (bytes): raw protobuf feed.
+            iata (str): IATA code of the agency (e.g. 'NYC').
+
+        Returns:
+            A tuple of the header timestamp, the serialized protobuf message, 
+            and the compressed messages, or None for both (strict order).
+
+        Raises:
+            google.protobuf.message.DecodeError: If the feed fails to parse.
+        """
+
+        if self.pool is not None and len(content) >= self.size_p:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self.pool, proc_feed, content, iata, self.codecs, 'arrow' in self.forms)
+            except BrokenProcessPool:
+                logger.warning(msg = 'Client process pool broke, processing feeds inline.')
+                self.pool = None
+        return proc_feed(content = content, iata = iata, codecs = self.codecs, arrow = 'arrow' in self.forms)
+
+    ## keep cached feed
+    def keep(self, i, time_t):
+
+        """
+        Desc:
+            Renews the cache time of an unchanged agency feed without parsing it
+            again, so it is not dropped as stale.
+
+        Args:
+            i (str): .ini key of the feed (e.g. 'API_END_NYC').
+            time_t (float): epoch time of the response in seconds.
+
+        Returns:
+            True.
+
+        Raises:
+            None.
+        """
+
+        self.cache[i] = (time_t,) + self.cache[i][1:]
+        self.state[i].changed = False
+        return True
+
+    ## extract data
+    async def run(self, time_c = None):
+
+        """
+        Desc:
+            Requests every agency feed once, concurrently, and refreshes the 
+            snapshot cache, for the benchmark (see 'ext/test/bench_extract.py').
+            '/extract' never calls it and serves the cache refreshed by 'watch'
+            instead, so the cycle deadline applies to the benchmark only. Each
+            feed is parsed and validated as soon as its response arrives, in 
+            completion order, and a feed exceeding the per feed deadline is 
+            dropped from this cycle. Feeds suspended by a rate limit are not
+            requested. At the cycle deadline the snapshot of the feeds 
+            finished so far is returned, and the missing feeds are reported 
+            in the 'X-Feeds-Missing' header while their requests finish in 
+            the background.
+
+        Args:
+            time_c (pos int): cycle deadline in seconds (default none).
+
+        Returns:
+            A tuple of the list of serialized protobuf messages, http status, 
+            and headers (strict order).
+
+        Raises:
+            None.
+        """
+
+        ## join requests and process responses until cycle deadline (suspended feeds wait)
+        time_t = time.time()
+        tasks = [asyncio.ensure_future(self.poll(i = i)) for i in self.urls if self.state[i].time_w <= time_t]
+        _, pending = await asyncio.wait(tasks, timeout = time_c) if tasks else (set(), set())
+        for i in pending:
+            self.polls.add(i)
+            i.add_done_callback(self.polls.discard)
+        if pending:
+            logger.warning(msg = 'Client returned partial results, {x} feeds missed the cycle deadline.'.format(
+                x = len(pending)
+                )
+            )
+
+        ## update snapshot of all agencies
+        self.snap()
+        logger.info(msg = 'Client successfully processed GET request.')
+        return self.read()
+
+    ## snapshot of cached feeds
+    def snap(self):
+
+        """
+        Desc:
+            Collects the cached feed of each agency in .ini order into a list of
+            buffers, omitting feeds older than the stale limit. The buffers are
+            streamed as the response body and never joined. Other workers 
+            follow the snapshot mapped from the shared file instead of their 
+            own cache (see 'publish').
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        time_t = time.time()
+        if self.shared is not None:
+            self.follow(time_t = time_t)
+            return
+
+        keys = [i for i in self.urls if
+            i in self.cache and time_t - self.cache[i][0] <= self.time_s
+        ]
+        self.feeds = [self.cache[i][1] for i in keys]
+        self.codes = {j: [self.cache[i][2][j] for i in keys] for j in self.blobs}
+        self.live = keys
+        self.etag = self.version(keys = keys)
+        self.time_n = time_t
+        self.dirty = False
+
+    ## publish shared snapshot
+    async def publish(self, keys, time_t):
+
+        """
+        Desc:
+            Writes the cached raw and compressed buffers of each agency in 
+            'keys' with their cache times and digests to the shared snapshot 
+            file. The file is written in the default executor, so the event 
+            loop keeps serving while it is written.
+
+        Args:
+            keys (list): .ini keys of the snapshot.
+            time_t (float): epoch time of the snapshot in seconds.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        blobs, rows, size = list(), list(), 0
+        for i in keys:
+            time_c, data, codes = self.cache[i]
+            row = {'key': i, 'time': time_c, 'digest': self.state[i].digest.hex()}
+            for j, blob in (('raw', data),) + tuple(codes.items()):
+                row[j] = [size, len(blob)]
+                blobs.append(blob)
+                size += len(blob)
+            rows.append(row)
+        etag = self.etag
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+                publish,
+                path = self.path,
+                index = {'etag': etag, 'time': time_t, 'feeds': rows},
+                blobs = blobs
+                )
+            )
+        except OSError as e:
+            logger.error(msg = 'Client failed to publish shared snapshot {x}: {y}'.format(
+                x = self.path,
+                y = e
+                )
+            )
+            return
+        self.time_p = time_t
+        self.etag_p = etag
+        logger.debug(msg = 'Client published shared snapshot of {x} bytes.'.format(
+            x = size
+            )
+        )
+
+    ## follow shared snapshot
+    def follow(self, time_t):
+
+        """
+        Desc:
+            Maps the latest snapshot published by the fetcher worker and points
+            the snapshot buffers at slices of it, omitting feeds older than the
+            stale limit.
+
+        Args:
+            time_t (float): epoch time in seconds.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.shared.load()
+        index = self.shared.index or {'feeds': list()}
+        rows = [i for i in index['feeds'] if
+            i['key'] in self.state and time_t - i['time'] <= self.time_s
+        ]
+        for i in rows:
+            self.state[i['key']].digest = bytes.fromhex(i['digest'])
+        self.feeds = [self.shared.slice(span = i['raw']) for i in rows]
+        self.codes = {j: [self.shared.slice(span = i[j]) for i in rows] for j in self.blobs}
+        self.live = [i['key'] for i in rows]
+        self.etag = self.version(keys = self.live)
+        self.time_n = time_t
+        self.dirty = False
+
+    ## snapshot age
+    def age(self, time_t):
+
+        """
+        Desc:
+            Returns the seconds since the shared snapshot served by this 
+            worker was published by the fetcher worker. In the fetcher worker,
+            it is the time since the last successful publish, so a failing 
+            publish (e.g. a full /dev/shm) shows in every worker.
+
+        Args:
+            time_t (float): epoch time in seconds.
+
+        Returns:
+            A float of seconds, or None before the first snapshot or when the
+            snapshot is not shared.
+
+        Raises:
+            None.
+        """
+
+        if self.shared is not None:
+            index = self.shared.index
+            return time_t - index['time'] if index else None
+        if self.lock is not None and self.time_p:
+            return time_t - self.time_p
+        return None
+
+    ## snapshot version
+    def version(self, keys):
+        return '"{x}"'.format(
+            x = hashlib.blake2b(
+                b''.join(i.encode() + self.state[i].digest for i in keys),
+                digest_size = 16
+            ).hexdigest()
+        )
+
+    ## filter agencies
+    def select(self, iata = None, region = None):
+
+        """
+        Desc:
+            Returns the .ini keys of the agencies matching a list of IATA codes
+            or a region, in .ini order.
+
+        Args:
+            iata (list): IATA codes of agencies (e.g. ['NYC', 'BOS']).
+            region (str): name of a region .ini file (e.g. 'us-east').
+
+        Returns:
+            A list of .ini keys, or None for all agencies.
+
+        Raises:
+            ValueError: If an IATA code is not an extracted agency.
+            KeyError: If the region does not exist.
+        """
+
+        keys = None
+        if iata is not None:
+            iata = [i.strip().upper() for i in iata if i.strip()]
+            miss = [i for i in iata if i not in self.iata]
+            if miss:
+                raise ValueError('Client does not extract iata_id {x}.'.format(
+                    x = ','.join(miss)
+                    )
+                )
+            keys = set(self.iata[i] for i in iata)
+        if region is not None:
+            if region not in self.regions:
+                raise KeyError(region)
+            keys = set(self.regions[region]) & (keys if keys is not None else set(self.urls))
+        if keys is None:
+            return None
+        return [i for i in self.urls if i in keys]
+
+    ## read snapshot
+    def read(self, etag = None, framing = None, keys = None, encoding = None, form = None):
+
+        """
+        Desc:
+            Returns the latest snapshot of all agencies, or of the agencies in 
+            'keys' (see 'select'), from the cache without requesting any 
+            agency. The snapshot is rebuilt at most once per second, and only 
+            after a feed changed or to drop stale feeds. When 'etag' matches 
+            the snapshot version, the snapshot is unchanged and only the 304 
+            status and headers are returned. Agencies missing from the 
+            snapshot are listed by IATA code in the 'X-Feeds-Missing' header,
+            and the seconds since a shared snapshot was published are in the
+            'X-Snapshot-Age' header (see 'age').
+            The body is compressed with the content encoding negotiated from
+            'encoding', from buffers compressed once per feed update. With the
+            'arrow' format, the body is an Arrow IPC stream of one record 
+            batch per agency instead (see 'arrow_batch').
+
+        Args:
+            etag (str): 'If-None-Match' header of the request (default None).
+            framing (str): None or 'delimited', see 'frame' (default None).
+            keys (list): .ini keys of agencies to return (default all).
+            encoding (str): 'Accept-Encoding' header of the request (default None).
+            form (str): None, 'protobuf', or 'arrow' (default None, protobuf).
+
+        Returns:
+            A tuple of the list of serialized protobuf messages, http status, 
+            and headers (strict order).
+
+        Raises:
+            ValueError: If 'framing' is not None or 'delimited', or 'form' is 
+                not a supported format or is framed.
+        """
+
+        form = None if form == 'protobuf' else form
+        if form is not None and form not in self.forms:
+            raise ValueError("The 'format' argument must be one of {x}.".format(
+                x = ', '.join(self.forms)
+                )
+            )
+        if form == 'arrow' and framing is not None:
+            raise ValueError("The 'framing' argument is not supported with the arrow format.")
+
+        if self.dirty or time.time() - self.time_n > 1:
+            self.snap()
+
+        ## negotiate content encoding
+        codec = accept(header = encoding, codecs = self.codecs)
+        feeds = self.codes[codec] if codec is not None else self.feeds
+        if form is not None:
+            feeds = self.codes[form if codec is None else form + '-' + codec]
+
+        ## filter agencies from cached buffers
+        sizes, version = [len(i) for i in self.feeds], self.etag
+        if keys is not None:
+            keys = set(keys)
+            index = [j for j, i in enumerate(self.live) if i in keys]
+            feeds = [feeds[j] for j in index]
+            sizes = [sizes[j] for j in index]
+            version = self.version(keys = [self.live[j] for j in index])
+
+        ## distinct version per representation
+        for i in (framing, form, codec):
+            if i is not None:
+                version = version[:-1] + '-' + i + '"'
+
+        ## feeds missing from snapshot (failed, late, or stale)
+        live = set(self.live)
+        missing = dict()
+        miss = [i.upper()[-3:] for i in self.urls if (keys is None or i in keys) and i not in live]
+        if miss:
+            missing['X-Feeds-Missing'] = ','.join(miss)
+
+        ## age of shared snapshot (stale when publishing fails)
+        time_a = self.age(time_t = time.time())
+        if time_a is not None:
+            missing['X-Snapshot-Age'] = str(int(time_a))
+
+        ## unsuccessful protobuf response, http status, headers (strict order)
+        if not feeds:
+            return None, 202, dict({
                 'Content-Type': 'application/x-protobuf',
-                'Content-Length': str(content_length),
+                'Content-Length': '0',
                 'Connection': 'keep-alive'
-            }
+            }, **missing)
+
+        ## unchanged protobuf response, http status, headers (strict order)
+        if etag is not None and etag == version:
+            return None, 304, dict({
+                'ETag': version,
+                'Vary': 'Accept-Encoding',
+                'Connection': 'keep-alive'
+            }, **missing)
+
+        ## successful protobuf response, http status, headers (strict order)
+        if form == 'arrow':
+            head, tail = ARROW_HEAD, ARROW_TAIL
+            if codec is not None:
+                head, tail = encode(data = head, codec = codec), encode(data = tail, codec = codec)
+            body = [head] + feeds + [tail]
+        else:
+            body = frame(chunks = feeds, framing = framing, codec = codec, sizes = sizes)
+        headers = {
+            'Content-Type': 'application/vnd.apache.arrow.stream' if form == 'arrow' else 'application/x-protobuf',
+            'Content-Length': str(sum(len(i) for i in body)),
+            'ETag': version,
+            'Vary': 'Accept-Encoding',
+            'Connection': 'keep-alive'
+        }
+        if codec is not None:
+            headers['Content-Encoding'] = codec
+        headers.update(missing)
+        return body, 200, headers
+
+    ## poll one feed on its schedule
+    async def watch(self, i):
+
+        """
+        Desc:
+            Polls one agency feed until cancelled, sleeping between polls for the
+            time planned by its feed schedule.
+
+        Args:
+            i (str): .ini key of the feed (e.g. 'API_END_NYC').
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        state = self.state[i]
+        while True:
+            try:
+                await self.poll(i = i)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(msg = 'Client failed to refresh {x}: {y}'.format(
+                    x = self.urls[i],
+                    y = e
+                    )
+                )
+            time_p = state.plan(time_t = time.time())
+            logger.debug(msg = 'Client polls {x} again in {y:.1f} seconds.'.format(
+                x = self.urls[i],
+                y = time_p
+                )
+            )
+            await asyncio.sleep(time_p)
+
+    ## start background refresh
+    async def start(self, time_r = 30, time_s = 120, time_min = 5, time_max = 60, time_d = 20, proc_n = None, path = None,
+        record = None, replay = None, codecs = ('gzip',), forms = ('protobuf',)):
+
+        """
+        Desc:
+            Opens the pooled session and starts one polling task per agency feed.
+            With 'path', workers share one snapshot: the worker that takes the
+            fetcher lock polls the agencies and publishes to 'path', and the
+            other workers serve the snapshot mapped from 'path' and take over
+            when the fetcher worker exits. With 'record', the fetcher appends 
+            every raw feed to segment files, and with 'replay', it replays
+            recorded feeds instead of polling the agencies. Each feed update 
+            is compressed and serialized once per codec in 'codecs' and 
+            format in 'forms', and only these are served, so unused variants
+            cost neither cpu nor shared snapshot space.
+
+        Args:
+            time_r (pos int): fallback seconds between polls (default 30).
+            time_s (pos int): stale limit in seconds (default 120).
+            time_min (pos int): min seconds between polls (default 5).
+            time_max (pos int): max seconds between polls (default 60).
+            time_d (pos int): per feed deadline in seconds (default 20).
+            proc_n (int): processes to parse feeds, 0 for inline (default cores).
+            path (str): shared snapshot file (default None, not shared).
+            record (Recorder): recorder of raw feeds (default None).
+            replay (Replayer): replayer of recorded feeds (default None).
+            codecs (tuple): content encodings 'gzip' or 'zstd' (default 'gzip').
+            forms (tuple): formats 'protobuf' or 'arrow' (default 'protobuf').
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: If a codec or format is not supported.
+        """
+
+        ## encoded variants per feed update
+        miss = [i for i in codecs if i not in CODECS] + [i for i in forms if i not in FORMATS]
+        if miss:
+            raise ValueError('Client does not support encoding or format {x}.'.format(
+                x = ', '.join(miss)
+                )
+            )
+        self.codecs = tuple(i for i in CODECS if i in codecs)  ## preferred order
+        self.forms = tuple(i for i in FORMATS if i in forms or i == 'protobuf')
+        self.blobs = blob_keys(codecs = self.codecs, forms = self.forms)
+
+        self.time_s = time_s
+        self.recorder = record if replay is None else None
+        self.replayer = replay
+        self.time_d = time_d
+        self.conf = {
+            'time_r': time_r,
+            'time_min': time_min,
+            'time_max': time_max,
+            'proc_n': proc_n
+        }
+
+        ## elect fetcher worker
+        if path is not None:
+            self.path = path
+            try:
+                self.time_u = os.stat(path + '.reload').st_mtime  ## skip earlier reloads
+            except FileNotFoundError:
+                pass
+            self.lock = lock(path = path)
+            if self.lock is None:
+                self.shared = SharedSnapshot(path = path)
+                logger.info(msg = 'Client follows shared snapshot {x}.'.format(
+                    x = path
+                    )
+                )
+            self.task_s = asyncio.ensure_future(self.share())
+            if self.shared is not None:
+                return
+        await self.lead()
+
+    ## poll agencies
+    async def lead(self):
+
+        """
+        Desc:
+            Starts the process pool and one polling task per agency feed with 
+            the params given to 'start', or one replay task.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        await self.open()
+
+        ## process pool sized to the container
+        proc_n = self.conf.get('proc_n')
+        proc_n = cpu_count() if proc_n is None else proc_n
+        if proc_n > 0 and self.pool is None:
+            try:
+                self.pool = ProcessPoolExecutor(max_workers = proc_n)
+                logger.info(msg = 'Client started process pool of {x} workers.'.format(
+                    x = proc_n
+                    )
+                )
+            except (OSError, NotImplementedError) as e:
+                logger.warning(msg = 'Client failed to start process pool, processing feeds inline: {x}'.format(
+                    x = e
+                    )
+                )
+
+        ## one writer thread for records
+        if self.recorder is not None and self.rec_pool is None:
+            self.rec_pool = ThreadPoolExecutor(max_workers = 1)
+
+        ## replay recorded feeds instead of polling
+        if self.replayer is not None:
+            self.tasks['replay'] = asyncio.ensure_future(self.play())
+            logger.info(msg = 'Client started replaying feeds from {x} at speed {y}.'.format(
+                x = self.replayer.path,
+                y = self.replayer.speed
+                )
+            )
+            return
+
+        for i in self.urls:
+            self.launch(i = i)
+        logger.info(msg = 'Client started polling {x} feeds.'.format(
+            x = len(self.tasks)
+            )
+        )
+
+    ## start polling one feed
+    def launch(self, i):
+        self.state[i].time_r = self.conf.get('time_r', 30)
+        self.state[i].time_min = self.conf.get('time_min', 5)
+        self.state[i].time_max = self.conf.get('time_max', 60)
+        self.tasks[i] = asyncio.ensure_future(self.watch(i = i))
+
+    ## reload feed configuration
+    async def reload(self, share = True):
+
+        """
+        Desc:
+            Reads the .env file and the .ini section again and applies the 
+            difference to the running feeds. Added feeds start polling, 
+            removed feeds stop and leave the snapshot, and feeds with a new 
+            URL restart. Other feeds keep their schedule, cache, and pooled 
+            connections, and unchanged key pools keep their buckets. API 
+            variables removed from the .env file are unset. With a
+            shared snapshot and 'share', the other workers reload as well 
+            (see 'share').
+
+        Args:
+            share (bool): trigger the reload in the other workers (default True).
+
+        Returns:
+            A dict of lists of the added, removed, and changed .ini keys.
+
+        Raises:
+            KeyError: If the .ini section does not exist.
+        """
+
+        ## read new configuration before changing any state
+        keys = env_var(file = self.env_file, override = True, clear = 'API_')
+        urls = ini_key(file = self.ini_file, sect = self.ini_sect)
+        quotas = ini_quota(file = self.ini_file)
+        regions = ini_region(file = self.ini_file, sect = self.ini_sect)
+
+        ## api key pools, unchanged pools keep their buckets
+        pools = dict()
+        for name, values in key_pools(env = keys).items():
+            rate, size = quotas.get(name, (None, 1.0))
+            pool = self.pools.get(name)
+            if pool is None or pool.keys != values or (pool.rate, pool.size) != (rate, size):
+                pool = KeyPool(name = name, keys = values, rate = rate, size = size)
+            pools[name] = pool
+
+        diff = {
+            'added': [i for i in urls if i not in self.urls],
+            'removed': [i for i in self.urls if i not in urls],
+            'changed': [i for i in urls if i in self.urls and urls[i] != self.urls[i]]
+        }
+
+        ## stop removed and changed feeds
+        stop = [self.tasks.pop(i) for i in diff['removed'] + diff['changed'] if i in self.tasks]
+        for i in stop:
+            i.cancel()
+        await asyncio.gather(*stop, return_exceptions = True)
+        for i in diff['removed'] + diff['changed']:
+            self.state.pop(i, None)
+            self.cache.pop(i, None)
+
+        ## apply new configuration
+        self.keys = keys
+        self.pools = pools
+        self.urls = urls
+        self.regions = regions
+        self.iata = {i.upper()[-3:]: i for i in self.urls}
+        for i in diff['added'] + diff['changed']:
+            self.state[i] = FeedState(key = i, url = urls[i])
+
+        ## start new feeds in the polling worker
+        if self.conf and self.shared is None and self.replayer is None:
+            for i in diff['added'] + diff['changed']:
+                self.launch(i = i)
+        self.dirty = True
+
+        ## trigger other workers
+        if share and self.path is not None:
+            try:
+                with open(self.path + '.reload', 'a'):
+                    os.utime(self.path + '.reload')
+                self.time_u = os.stat(self.path + '.reload').st_mtime
+            except OSError as e:
+                logger.error(msg = 'Client failed to trigger reload of other workers: {x}'.format(
+                    x = e
+                    )
+                )
+
+        logger.info(msg = 'Client reloaded feed configuration, {x} added, {y} removed, {z} changed.'.format(
+            x = len(diff['added']),
+            y = len(diff['removed']),
+            z = len(diff['changed'])
+            )
+        )
+        return diff
+
+    ## reload triggered by another worker
+    async def reloaded(self):
+        try:
+            time_u = os.stat(self.path + '.reload').st_mtime
+        except FileNotFoundError:
+            return
+        if time_u > self.time_u:
+            self.time_u = time_u
+            await self.reload(share = False)
+
+    ## replay recorded feeds
+    async def play(self):
+
+        """
+        Desc:
+            Feeds the recorded raw feeds through 'proc' in recorded order, 
+            spaced as recorded divided by the replay speed, so the snapshot 
+            cache and '/extract' behave as when they were recorded. Feeds 
+            recorded under .ini keys not in the .ini file are added.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        while True:
+            entries = self.replayer.entries()
+            if not entries:
+                logger.warning(msg = 'Client found no recorded feeds in {x}.'.format(
+                    x = self.replayer.path
+                    )
+                )
+                return
+
+            time_r, time_s = entries[0]['t'], time.monotonic()
+            for entry in entries:
+                await asyncio.sleep(self.replayer.delay(entry = entry, time_r = time_r, time_s = time_s))
+                i = entry['k']
+                if i not in self.state:
+                    self.urls[i] = entry['u']
+                    self.state[i] = FeedState(key = i, url = entry['u'])
+                    self.iata.setdefault(i.upper()[-3:], i)
+                try:
+                    content = self.replayer.read(entry = entry)
+                except (OSError, ValueError) as e:
+                    logger.error(msg = 'Client failed to read recorded feed {x}: {y}'.format(
+                        x = i,
+                        y = e
+                        )
+                    )
+                    continue
+                await self.proc(i = i, result = (200, content, dict()))
+
+            logger.info(msg = 'Client replayed {x} recorded feeds.'.format(
+                x = len(entries)
+                )
+            )
+            if not self.replayer.loop:
+                return
+
+    ## share snapshot across workers
+    async def share(self):
+
+        """
+        Desc:
+            Publishes the snapshot once a second when it changed, and every 
+            10 seconds to renew cache times, in the fetcher worker. In other workers, tries to take the fetcher lock 
+            once a second and takes over polling from the cached snapshot when
+            the fetcher worker exits. Every worker reloads the feed 
+            configuration when another worker triggered a reload.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        while True:
+            await asyncio.sleep(1)
+            try:
+                await self.reloaded()
+                if self.shared is None:
+                    if self.dirty or time.time() - self.time_n > 1:
+                        self.snap()
+                    if self.lock is not None and (self.etag != self.etag_p or self.time_n - self.time_p > 10):
+                        await self.publish(keys = self.live, time_t = self.time_n)
+                    continue
+
+                ## take over from exited fetcher worker
+                self.lock = lock(path = self.path)
+                if self.lock is None:
+                    continue
+                logger.warning(msg = 'Client took over fetching for shared snapshot {x}.'.format(
+                    x = self.path
+                    )
+                )
+                self.shared.load()
+                for i in (self.shared.index or {'feeds': list()})['feeds']:
+                    if i['key'] in self.state:
+                        self.cache[i['key']] = (
+                            i['time'],
+                            bytes(self.shared.slice(span = i['raw'])),
+                            {j: bytes(self.shared.slice(span = i[j])) for j in self.blobs}
+                        )
+                        self.state[i['key']].digest = bytes.fromhex(i['digest'])
+                self.shared = None
+                self.dirty = True
+                await self.lead()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(msg = 'Client failed to share snapshot: {x}'.format(
+                    x = e
+                    )
+                )
+
+    ## stop background refresh
+    async def close(self):
+        if self.task_s is not None:
+            self.task_s.cancel()
+            await asyncio.gather(self.task_s, return_exceptions = True)
+            self.task_s = None
+        for i in self.tasks.values():
+            i.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions = True)
+        if self.tasks:
+            logger.info(msg = 'Client stopped polling {x} feeds.'.format(
+                x = len(self.tasks)
+                )
+            )
+        self.tasks = dict()
+
+        ## flush records
+        if self.rec_pool is not None:
+            self.rec_pool.shutdown(wait = True)
+            self.rec_pool = None
+        if self.recorder is not None:
+            self.recorder.close()
+
+        ## stop process pool
+        if self.pool is not None:
+            self.pool.shutdown(wait = False)
+            self.pool = None
+
+        ## close pooled session
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+            logger.info(msg = 'Client closed pooled session.')
+        self.session = None
+
+        ## release fetcher lock
+        if self.lock is not None:
+            os.close(self.lock)
+            self.lock = None
 
 ## end program
@@ -0,0 +1,177 @@
+## libraries
+import os
+import logging
+
+## params
+LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
+
+## logging
+fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+hdlr = logging.StreamHandler()
+hdlr.setFormatter(fmt = fmt)
+logging.basicConfig(level = LOG_LEVEL, handlers = [hdlr])
+logger = logging.getLogger(name = __name__)
+logger.propagate = True
+
+## no key with headroom
+class KeyWait(Exception):
+    def __init__(self, name, time_w):
+        super().__init__('No API key of {x} has headroom for {y:.1f} seconds.'.format(
+            x = name,
+            y = time_w
+            )
+        )
+        self.name = name
+        self.time_w = time_w
+
+## quota of a key
+def quota(value):
+
+    """
+    Desc:
+        Parses a quota of the form 'requests/seconds' or 'requests/seconds/burst'
+        (e.g. '5000/86400' or '60/60/10') into a refill rate and a bucket size.
+        The bucket holds at most one minute of requests unless 'burst' is given.
+
+    Args:
+        value (str): quota of one API key.
+
+    Returns:
+        A tuple of the rate in requests per second and the bucket size (strict
+        order).
+
+    Raises:
+        ValueError: If the quota is malformed.
+    """
+
+    parts = [float(i) for i in value.split('/')]
+    if len(parts) not in (2, 3) or parts[0] <= 0 or parts[1] <= 0:
+        raise ValueError('Quota {x} must be requests/seconds[/burst].'.format(x = value))
+    rate = parts[0] / parts[1]
+    size = parts[2] if len(parts) == 3 else max(1.0, min(parts[0], rate * 60))
+    return rate, size
+
+## api keys from env variables
+def key_pools(env, prefix = 'API_KEY_'):
+
+    """
+    Desc:
+        Groups API keys from env variables into pools. 'API_KEY_DUB_A' and
+        'API_KEY_DUB_B' join the pool 'API_KEY_DUB', and a comma separated
+        value (e.g. 'API_KEY_NYC=key1,key2') adds each key to the pool.
+
+    Args:
+        env (dict): env variables.
+        prefix (str): prefix of API key variables (default 'API_KEY_').
+
+    Returns:
+        A dict of pool names and lists of keys.
+
+    Raises:
+        None.
+    """
+
+    pools = dict()
+    for i in sorted(env):
+        if not i.startswith(prefix) or not env[i]:
+            continue
+        name = prefix + i[len(prefix):].split('_')[0]
+        for j in env[i].split(','):
+            if j.strip() and j.strip() not in pools.setdefault(name, list()):
+                pools[name].append(j.strip())
+    return pools
+
+## credential pool
+class KeyPool():
+    def __init__(self, name, keys, rate = None, size = 1.0):
+
+        """
+        Desc:
+            Token buckets of the API keys of one agency (or agencies sharing
+            keys). Each request takes a token from the key with the most
+            headroom, and a key rate limited by the agency is backed off for
+            its 'Retry-After' time.
+
+        Args:
+            name (str): pool name (e.g. 'API_KEY_DUB').
+            keys (list): API keys.
+            rate (float): tokens per second per key (default None, no quota).
+            size (float): bucket size per key (default 1).
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.name = name
+        self.keys = list(keys)
+        self.rate = rate
+        self.size = size
+        self.tokens = {i: size for i in self.keys}
+        self.time_u = {i: 0.0 for i in self.keys}  ## last refill (epoch)
+        self.time_w = {i: 0.0 for i in self.keys}  ## backed off until (epoch)
+
+    ## refill bucket
+    def fill(self, key, time_t):
+        if self.rate is not None:
+            self.tokens[key] = min(self.size, self.tokens[key] + (time_t - self.time_u[key]) * self.rate)
+        self.time_u[key] = time_t
+
+    ## take a token
+    def take(self, time_t):
+
+        """
+        Desc:
+            Returns the key with the most tokens that is not backed off, and
+            takes one token from it. Without a quota, the least recently used
+            key is returned.
+
+        Args:
+            time_t (float): epoch time in seconds.
+
+        Returns:
+            A str of the API key.
+
+        Raises:
+            KeyWait: If no key has a token, with the seconds until one has.
+        """
+
+        ready = [i for i in self.keys if self.time_w[i] <= time_t]
+        if self.rate is None and ready:
+            key = min(ready, key = lambda i: self.time_u[i])
+            self.time_u[key] = time_t
+            return key
+
+        for i in ready:
+            self.fill(key = i, time_t = time_t)
+        ready = [i for i in ready if self.tokens[i] >= 1]
+        if not ready:
+            raise KeyWait(name = self.name, time_w = self.wait(time_t = time_t))
+        key = max(ready, key = lambda i: self.tokens[i])
+        self.tokens[key] -= 1
+        return key
+
+    ## back off a key
+    def backoff(self, key, time_w, time_t):
+        if key in self.time_w:
+            self.time_w[key] = max(self.time_w[key], time_t + time_w)
+            logger.warning(msg = 'Client backed off an API key of {x} for {y:.1f} seconds.'.format(
+                x = self.name,
+                y = time_w
+                )
+            )
+
+    ## seconds until a key has a token
+    def wait(self, time_t):
+        time_n = list()
+        for i in self.keys:
+            time_b = max(0.0, self.time_w[i] - time_t)
+            if self.rate is not None:
+                self.fill(key = i, time_t = time_t)
+                time_b = max(time_b, (1 - self.tokens[i]) / self.rate)
+            time_n.append(time_b)
+        return min(time_n) if time_n else 0.0
+
+## end program
@@ -0,0 +1,236 @@
+## libraries
+import os
+import gzip
+import json
+import time
+import logging
+
+## optional zstd encoding
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+## params
+LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
+CODEC = 'zstd' if zstandard is not None else 'gzip'  ## segment compression
+
+## logging
+fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+hdlr = logging.StreamHandler()
+hdlr.setFormatter(fmt = fmt)
+logging.basicConfig(level = LOG_LEVEL, handlers = [hdlr])
+logger = logging.getLogger(name = __name__)
+logger.propagate = True
+
+## compress record
+def compress(data, codec = CODEC):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level = 3).compress(data)
+    return gzip.compress(data, compresslevel = 6, mtime = 0)
+
+## decompress record
+def decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError('Client requires zstandard to replay zstd segments.')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+## record feeds
+class Recorder():
+    def __init__(self, path, size_m = 64 * 2 ** 20, time_m = 3600, keep_n = 0):
+
+        """
+        Desc:
+            Appends raw agency payloads with their fetch times to rotating
+            segment files in 'path'. Each payload is compressed on its own
+            into the segment file ('seg-<time>.rec'), and indexed by one JSON
+            line in the index file ('seg-<time>.idx') with its time, key, URL,
+            offset, and length, so a replay can read any payload directly.
+
+        Args:
+            path (str): directory of the segment files.
+            size_m (pos int): max bytes of a segment before rotating (default 64 MiB).
+            time_m (pos int): max seconds of a segment before rotating (default 3600).
+            keep_n (int): number of segments to keep, 0 for all (default 0).
+
+        Returns:
+            None.
+
+        Raises:
+            OSError: If the directory cannot be created.
+        """
+
+        self.path = path
+        self.size_m = size_m
+        self.time_m = time_m
+        self.keep_n = keep_n
+        self.data = None  ## open segment file
+        self.index = None  ## open index file
+        self.time_o = 0.0  ## segment open time
+        os.makedirs(path, exist_ok = True)
+
+    ## open new segment
+    def rotate(self, time_t):
+        self.close()
+        name = os.path.join(self.path, 'seg-{x:.6f}'.format(x = time_t))
+        self.data = open(name + '.rec', 'ab')
+        self.index = open(name + '.idx', 'a')
+        self.time_o = time_t
+        logger.info(msg = 'Client opened record segment {x}.'.format(
+            x = name
+            )
+        )
+
+        ## drop oldest segments
+        if self.keep_n > 0:
+            for i in segments(path = self.path)[:-self.keep_n]:
+                for j in ('.rec', '.idx'):
+                    try:
+                        os.remove(i + j)
+                    except FileNotFoundError:
+                        pass
+
+    ## append payload
+    def write(self, key, url, content, time_t = None):
+
+        """
+        Desc:
+            Compresses and appends one raw agency payload to the open segment,
+            rotating it first when it is full or old.
+
+        Args:
+            key (str): .ini key of the feed (e.g. 'API_END_NYC').
+            url (str): URL of the feed.
+            content (bytes): raw payload.
+            time_t (float): epoch fetch time in seconds (default now).
+
+        Returns:
+            None.
+
+        Raises:
+            OSError: If the segment cannot be written.
+        """
+
+        time_t = time.time() if time_t is None else time_t
+        if self.data is None or \
+            self.data.tell() >= self.size_m or \
+            time_t - self.time_o >= self.time_m:
+            self.rotate(time_t = time_t)
+
+        blob = compress(data = content)
+        offset = self.data.tell()
+        self.data.write(blob)
+        self.data.flush()
+        self.index.write(json.dumps(obj = {
+            't': time_t,
+            'k': key,
+            'u': url,
+            'o': offset,
+            'n': len(blob),
+            'c': CODEC
+        }, separators = (',', ':')) + '\n')
+        self.index.flush()
+
+    ## close segment
+    def close(self):
+        for i in (self.data, self.index):
+            if i is not None:
+                i.close()
+        self.data, self.index = None, None
+
+## segment files
+def segments(path):
+    return sorted(
+        os.path.join(path, i[:-len('.idx')]) for i in os.listdir(path) if
+            i.startswith('seg-') and i.endswith('.idx')
+    )
+
+## replay feeds
+class Replayer():
+    def __init__(self, path, speed = 1.0, loop = False):
+
+        """
+        Desc:
+            Reads the payloads recorded by 'Recorder' in 'path' in time order,
+            at recorded speed, accelerated by 'speed', or as fast as possible.
+
+        Args:
+            path (str): directory of the segment files.
+            speed (float): replay speed, 0 for no delay (default 1).
+            loop (bool): restart from the first payload at the end (default False).
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+
+    ## index of all segments
+    def entries(self):
+
+        """
+        Desc:
+            Loads the index of every segment, skipping a partial last line of
+            a segment that is still being written.
+
+        Args:
+            None.
+
+        Returns:
+            A list of index entries in time order, each with the segment path.
+
+        Raises:
+            None.
+        """
+
+        entries = list()
+        for i in segments(path = self.path):
+            with open(i + '.idx') as f:
+                for j in f:
+                    try:
+                        entry = json.loads(j)
+                    except ValueError:
+                        continue
+                    entry['s'] = i + '.rec'
+                    entries.append(entry)
+        entries.sort(key = lambda i: i['t'])
+        return entries
+
+    ## read payload
+    def read(self, entry):
+        with open(entry['s'], 'rb') as f:
+            f.seek(entry['o'])
+            return decompress(data = f.read(entry['n']), codec = entry['c'])
+
+    ## delay before payload
+    def delay(self, entry, time_r, time_s):
+
+        """
+        Desc:
+            Returns the seconds to wait before replaying 'entry', so payloads
+            are spaced as recorded, divided by the replay speed.
+
+        Args:
+            entry (dict): index entry.
+            time_r (float): recorded time of the first replayed entry.
+            time_s (float): monotonic time the replay started.
+
+        Returns:
+            A float of seconds.
+
+        Raises:
+            None.
+        """
+
+        if not self.speed:
+            return 0.0
+        return max(0.0, (entry['t'] - time_r) / self.speed - (time.monotonic() - time_s))
+
+## end program
@@ -0,0 +1,163 @@
+## libraries
+import os
+import json
+import mmap
+import fcntl
+import struct
+import logging
+
+## params
+LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
+
+## logging
+fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+hdlr = logging.StreamHandler()
+hdlr.setFormatter(fmt = fmt)
+logging.basicConfig(level = LOG_LEVEL, handlers = [hdlr])
+logger = logging.getLogger(name = __name__)
+logger.propagate = True
+
+## file header (magic, index length)
+MAGIC = b'GRDS'
+HEAD = struct.Struct('<4sQ')
+
+## fetcher lock
+def lock(path):
+
+    """
+    Desc:
+        Tries to take the exclusive fetcher lock of a shared snapshot without
+        blocking. The lock is held until the process exits or the returned
+        file descriptor is closed, so a crashed fetcher releases it.
+
+    Args:
+        path (str): path of the shared snapshot file.
+
+    Returns:
+        A file descriptor when the lock was taken, otherwise None.
+
+    Raises:
+        OSError: If the lock file cannot be opened.
+    """
+
+    fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+## publish snapshot
+def publish(path, index, blobs):
+
+    """
+    Desc:
+        Writes a snapshot to a new file and atomically renames it over 'path',
+        so readers see either the old or the new snapshot and never a partial
+        one. Readers that mapped the old file keep a valid mapping.
+
+    Args:
+        path (str): path of the shared snapshot file.
+        index (dict): JSON serializable index of the snapshot, with offsets
+            relative to the start of the blobs.
+        blobs (list): bytes written back to back after the index.
+
+    Returns:
+        None.
+
+    Raises:
+        OSError: If the file cannot be written.
+    """
+
+    head = json.dumps(obj = index, separators = (',', ':')).encode()
+    temp = '{x}.{y}.tmp'.format(x = path, y = os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(HEAD.pack(MAGIC, len(head)))
+        f.write(head)
+        for i in blobs:
+            f.write(i)
+    os.replace(temp, path)
+
+## read snapshot
+class SharedSnapshot():
+    def __init__(self, path):
+
+        """
+        Desc:
+            Read-only memory map of a snapshot published by 'publish'. Buffers
+            are returned as memoryview slices of the mapping, so serving them
+            does not copy the snapshot per worker.
+
+        Args:
+            path (str): path of the shared snapshot file.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.path = path
+        self.stat = None  ## (inode, mtime, size) of the mapped file
+        self.index = None
+        self.view = None
+        self.base = 0  ## offset of the blobs
+
+    ## remap on new snapshot
+    def load(self):
+
+        """
+        Desc:
+            Maps the snapshot file again when a new snapshot was published
+            since the last call.
+
+        Args:
+            None.
+
+        Returns:
+            True if a new snapshot was mapped, otherwise False.
+
+        Raises:
+            None.
+        """
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stat == self.stat or not st.st_size:
+            return False
+
+        ## map new file (old mapping stays valid until released)
+        try:
+            with open(self.path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            logger.warning(msg = 'Client failed to map shared snapshot {x}: {y}'.format(
+                x = self.path,
+                y = e
+                )
+            )
+            return False
+        view = memoryview(data)
+        magic, size = HEAD.unpack_from(view, 0)
+        if magic != MAGIC:
+            logger.warning(msg = 'Client found invalid shared snapshot {x}.'.format(
+                x = self.path
+                )
+            )
+            return False
+        self.index = json.loads(bytes(view[HEAD.size:HEAD.size + size]))
+        self.base = HEAD.size + size
+        self.view = view
+        self.stat = stat
+        return True
+
+    ## buffer slice
+    def slice(self, span):
+        return self.view[self.base + span[0]:self.base + span[0] + span[1]]
+
+## end program
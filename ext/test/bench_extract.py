@@ -0,0 +1,186 @@
+## libraries
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+## modules
+sys.path.insert(0, './')
+from ext.test.stand_in import ini_feeds, write_conf, serve
+from ext.src.extract import ExtractClient
+
+## params
+INI_FILE = './ext/conf/feed/ww-full.ini'
+
+## nearest rank percentile
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))] if values else float('nan')
+
+## free local port
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+## per agency option (e.g. '500' or 'NYC=2000')
+def opts(values, cast):
+    out = dict()
+    for i in values or list():
+        iata, _, value = i.rpartition('=')
+        out[iata or '*'] = cast(value)
+    return out
+
+## stand-in counters
+async def stand_in_stats(client, host):
+    async with client.session.get(host + '/_stats') as response:
+        return json.loads(await response.text())
+
+## benchmark extract cycles
+async def bench(args, ini_file, env_file, host):
+
+    """
+    Desc:
+        Drives 'ExtractClient.run' against the stand-in server for a number of
+        cycles and measures cycle latency, parse CPU time, bytes, and peak RSS.
+
+    Args:
+        args (Namespace): command line args.
+        ini_file (str): stand-in .ini file.
+        env_file (str): stand-in .env file.
+        host (str): base URL of the stand-in server.
+
+    Returns:
+        A dict of results.
+
+    Raises:
+        None.
+    """
+
+    client = ExtractClient(env_file = env_file, ini_file = ini_file, ini_sect = 'api')
+    client.time_d = args.deadline
+    await client.open()
+    if args.procs > 0:
+        client.pool = ProcessPoolExecutor(max_workers = args.procs)
+
+    ## time parses (cpu time of inline parses, wall time of pooled parses)
+    time_p = list()
+    parse = client.parse
+    async def timed(content, iata):
+        time_c, time_w = time.process_time(), time.perf_counter()
+        try:
+            return await parse(content = content, iata = iata)
+        finally:
+            time_p.append(time.process_time() - time_c if client.pool is None else time.perf_counter() - time_w)
+    client.parse = timed
+
+    ## warm up connections and pool
+    for _ in range(args.warmup):
+        await client.run(time_c = args.cycle)
+    time_p.clear()
+    stats_w = await stand_in_stats(client = client, host = host)
+
+    time_l, size_o = list(), 0
+    cpu_s = time.process_time()
+    for _ in range(args.cycles):
+        time_s = time.perf_counter()
+        body, status, headers = await client.run(time_c = args.cycle)
+        time_l.append(time.perf_counter() - time_s)
+        size_o += int(headers.get('Content-Length', 0)) if status == 200 else 0
+        await asyncio.sleep(max(0.0, args.interval - time_l[-1]))
+    cpu_s = time.process_time() - cpu_s
+
+    ## stand-in counters of measured cycles
+    stats = await stand_in_stats(client = client, host = host)
+    status = {i: j - stats_w['status'].get(i, 0) for i, j in stats['status'].items()}
+
+    await asyncio.gather(*client.polls, return_exceptions = True)
+    if client.pool is not None:
+        client.pool.shutdown(wait = True)  ## reap workers to count their cpu time
+        client.pool = None
+    await client.close()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'feeds': len(client.urls),
+        'cycles': args.cycles,
+        'cycle_p50_ms': pct(time_l, 0.50) * 1e3,
+        'cycle_p90_ms': pct(time_l, 0.90) * 1e3,
+        'cycle_p99_ms': pct(time_l, 0.99) * 1e3,
+        'cycle_max_ms': max(time_l) * 1e3,
+        'parses': len(time_p),
+        'parse_p50_ms': pct(time_p, 0.50) * 1e3,
+        'parse_sum_s': sum(time_p),
+        'cpu_s': cpu_s,
+        'cpu_pool_s': children.ru_utime + children.ru_stime,
+        'bytes_in': stats['bytes'] - stats_w['bytes'],
+        'bytes_out': size_o,
+        'status': {i: j for i, j in status.items() if j},
+        'rss_peak_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+## run benchmark
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark extract cycles against a local stand-in of the agencies.')
+    parser.add_argument('--ini', default = INI_FILE, help = 'feed .ini file to imitate')
+    parser.add_argument('--cycles', type = int, default = 20)
+    parser.add_argument('--warmup', type = int, default = 2)
+    parser.add_argument('--interval', type = float, default = 1.0, help = 'min seconds between cycles')
+    parser.add_argument('--cycle', type = float, default = None, help = 'cycle deadline in seconds')
+    parser.add_argument('--deadline', type = float, default = 20, help = 'per feed deadline in seconds')
+    parser.add_argument('--procs', type = int, default = 0, help = 'parse processes, 0 for inline')
+    parser.add_argument('--vehicles', action = 'append', help = 'vehicles per feed, or IATA=n (repeatable)')
+    parser.add_argument('--latency', action = 'append', help = 'median seconds:sigma, or IATA=median:sigma (repeatable)')
+    parser.add_argument('--p429', type = float, default = 0.0)
+    parser.add_argument('--p5xx', type = float, default = 0.0)
+    parser.add_argument('--pbad', type = float, default = 0.0, help = 'probability of a malformed payload')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--json', action = 'store_true', help = 'print results as JSON')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(level = os.getenv(key = 'LOG_LEVEL', default = 'CRITICAL'))
+
+    ## start stand-in server in its own process
+    port = free_port()
+    host = 'http://127.0.0.1:{x}'.format(x = port)
+    server = multiprocessing.Process(
+        target = serve,
+        kwargs = {
+            'port': port,
+            'vehicles': opts(args.vehicles, int),
+            'latency': opts(args.latency, lambda i: tuple(float(j) for j in i.split(':'))),
+            'p_429': args.p429,
+            'p_5xx': args.p5xx,
+            'p_bad': args.pbad,
+            'seed': args.seed
+        },
+        daemon = True
+    )
+    server.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout = 0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+
+    try:
+        with tempfile.TemporaryDirectory() as path:
+            ini_file, env_file = write_conf(feeds = ini_feeds(file = args.ini), host = host, path = path)
+            results = asyncio.run(bench(args = args, ini_file = ini_file, env_file = env_file, host = host))
+    finally:
+        server.terminate()
+
+    if args.json:
+        print(json.dumps(obj = results, indent = 2))
+    else:
+        for i, j in results.items():
+            print('{x:<14} {y}'.format(x = i, y = round(j, 2) if isinstance(j, float) else j))
+
+## end program
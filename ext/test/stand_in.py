@@ -0,0 +1,211 @@
+## libraries
+import os
+import json
+import time
+import random
+import asyncio
+import configparser
+from aiohttp import web
+from google.transit import gtfs_realtime_pb2
+
+## api key variable and auth scheme per agency (as required by each agency)
+AUTH = {
+    'NYC': ('API_KEY_NYC', 'param', 'key', ''),
+    'DCA': ('API_KEY_DCA', 'header', 'api_key', ''),
+    'LAX': ('API_KEY_LBM', 'header', 'Authorization', ''),
+    'MIA': ('API_KEY_LBM', 'header', 'Authorization', ''),
+    'TPA': ('API_KEY_LBM', 'header', 'Authorization', ''),
+    'SFO': ('API_KEY_SFO', 'param', 'api_key', ''),
+    'SAN': ('API_KEY_SAN', 'param', 'key', ''),
+    'PDX': ('API_KEY_PDX', 'param', 'appID', ''),
+    'PHX': ('API_KEY_PHX', 'param', 'apiKey', ''),
+    'YUL': ('API_KEY_YUL', 'header', 'apiKey', ''),
+    'YVR': ('API_KEY_YVR', 'param', 'apikey', ''),
+    'ARN': ('API_KEY_ARN', 'param', 'key', ''),
+    'DUB': ('API_KEY_DUB_A', 'header', 'x-api-key', ''),
+    'SYD': ('API_KEY_SYD', 'header', 'Authorization', 'apikey '),
+    'AKL': ('API_KEY_AKL', 'header', 'Ocp-Apim-Subscription-Key', ''),
+    'CHC': ('API_KEY_CHC', 'header', 'Ocp-Apim-Subscription-Key', ''),
+    'DEL': ('API_KEY_DEL', 'param', 'key', '')
+}
+
+## api key accepted by the stand-in
+KEY = 'stand-in'
+
+## feed keys of an .ini file
+def ini_feeds(file, sect = 'api'):
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    config.read(file)
+    return [i for i in config[sect] if i.startswith('API_END_')]
+
+## stand-in .ini and .env files
+def write_conf(feeds, host, path):
+
+    """
+    Desc:
+        Writes an .ini file pointing every feed at the stand-in server, and an
+        .env file with the API key the stand-in accepts for every agency.
+
+    Args:
+        feeds (list): .ini keys of the feeds (e.g. 'API_END_NYC').
+        host (str): base URL of the stand-in server (e.g. 'http://127.0.0.1:8080').
+        path (str): directory to write 'stand-in.ini' and 'stand-in.env' to.
+
+    Returns:
+        A tuple of the .ini and .env file paths (strict order).
+
+    Raises:
+        OSError: If the files cannot be written.
+    """
+
+    ini_file = os.path.join(path, 'stand-in.ini')
+    env_file = os.path.join(path, 'stand-in.env')
+    with open(ini_file, 'w') as f:
+        f.write('[api]\n')
+        for i in feeds:
+            f.write('{x}={y}/{z}\n'.format(x = i, y = host, z = i.upper()[-3:]))
+    with open(env_file, 'w') as f:
+        for i in sorted(set(j[0] for j in AUTH.values()) | {'API_KEY_DUB_B'}):
+            f.write('{x}={y}\n'.format(x = i, y = KEY))
+    return ini_file, env_file
+
+## agency stand-in
+class StandIn():
+    def __init__(self, vehicles = 500, latency = (0.05, 0.5), p_429 = 0.0, p_5xx = 0.0, p_bad = 0.0, seed = 0):
+
+        """
+        Desc:
+            Imitates the GTFS Realtime endpoints of the agencies at '/<IATA>'.
+            Each endpoint checks the API key in the header or param the agency
+            requires, waits a log-normal latency, and returns a feed of
+            vehicle positions renewed once a second. Rate limit (429) and
+            server error (5xx) responses, and malformed payloads, are
+            injected at random.
+
+        Args:
+            vehicles (int or dict): vehicles per feed, or per IATA code with
+                '*' as default (default 500).
+            latency (tuple or dict): median seconds and sigma of the latency,
+                or per IATA code with '*' as default (default (0.05, 0.5)).
+            p_429 (float): probability of a 429 response (default 0).
+            p_5xx (float): probability of a 5xx response (default 0).
+            p_bad (float): probability of a malformed payload (default 0).
+            seed (int): random seed (default 0).
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.vehicles = dict(vehicles) if isinstance(vehicles, dict) else {'*': vehicles}
+        self.latency = dict(latency) if isinstance(latency, dict) else {'*': latency}
+        self.vehicles.setdefault('*', 500)
+        self.latency.setdefault('*', (0.05, 0.5))
+        self.p_429 = p_429
+        self.p_5xx = p_5xx
+        self.p_bad = p_bad
+        self.random = random.Random(seed)
+        self.feeds = dict()  ## latest feed per agency (second, bytes)
+        self.stats = {'requests': 0, 'bytes': 0, 'status': dict()}
+
+    ## per agency option
+    def option(self, opts, iata):
+        return opts.get(iata, opts.get('*'))
+
+    ## feed of one agency
+    def feed(self, iata, time_t):
+
+        """
+        Desc:
+            Returns the feed of an agency for the current second, building it
+            once per second with every vehicle moved and timestamped.
+
+        Args:
+            iata (str): IATA code of the agency (e.g. 'NYC').
+            time_t (int): epoch time in seconds.
+
+        Returns:
+            A bytes serialized protobuf message.
+
+        Raises:
+            None.
+        """
+
+        if iata in self.feeds and self.feeds[iata][0] == time_t:
+            return self.feeds[iata][1]
+
+        message = gtfs_realtime_pb2.FeedMessage()
+        message.header.gtfs_realtime_version = '2.0'
+        message.header.timestamp = time_t
+        for i in range(self.option(opts = self.vehicles, iata = iata)):
+            entity = message.entity.add()
+            entity.id = '{x}-{y}'.format(x = iata, y = i)
+            vehicle = entity.vehicle
+            vehicle.vehicle.id = entity.id
+            vehicle.trip.trip_id = 'T{x}'.format(x = i % 400)
+            vehicle.trip.route_id = 'R{x}'.format(x = i % 40)
+            vehicle.position.latitude = 40.0 + i * 1e-4 + (time_t % 60) * 1e-5 * (i % 3)  ## a third idle
+            vehicle.position.longitude = -73.0 - i * 1e-4
+            vehicle.timestamp = time_t - self.random.randint(0, 30)
+        data = message.SerializeToString()
+        self.feeds[iata] = (time_t, data)
+        return data
+
+    ## malformed payload
+    def bad(self, data):
+        if self.random.random() < 0.5:
+            return data[:len(data) // 2]  ## truncated
+        return bytes(self.random.getrandbits(8) for _ in range(256))  ## garbage
+
+    ## request handler
+    async def handle(self, request):
+        iata = request.match_info['iata']
+
+        ## check api key
+        if iata in AUTH:
+            _, kind, name, prefix = AUTH[iata]
+            value = request.query.get(name) if kind == 'param' else request.headers.get(name)
+            if value != prefix + KEY:
+                return self.reply(response = web.Response(status = 401))
+
+        median, sigma = self.option(opts = self.latency, iata = iata)
+        await asyncio.sleep(self.random.lognormvariate(0, sigma) * median)
+
+        ## injected failures
+        draw = self.random.random()
+        if draw < self.p_429:
+            return self.reply(response = web.Response(status = 429, headers = {'Retry-After': '1'}))
+        if draw < self.p_429 + self.p_5xx:
+            return self.reply(response = web.Response(status = self.random.choice((500, 502, 503))))
+
+        data = self.feed(iata = iata, time_t = int(time.time()))
+        if self.random.random() < self.p_bad:
+            data = self.bad(data = data)
+        return self.reply(response = web.Response(body = data, content_type = 'application/x-protobuf'))
+
+    ## count response
+    def reply(self, response):
+        self.stats['requests'] += 1
+        self.stats['bytes'] += len(response.body or b'')
+        self.stats['status'][response.status] = self.stats['status'].get(response.status, 0) + 1
+        return response
+
+    ## stats handler
+    async def report(self, request):
+        return web.Response(text = json.dumps(obj = self.stats), content_type = 'application/json')
+
+    ## web app
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/_stats', self.report)
+        app.router.add_get('/{iata}', self.handle)
+        return app
+
+## run stand-in server
+def serve(host = '127.0.0.1', port = 8080, **kwargs):
+    web.run_app(StandIn(**kwargs).app(), host = host, port = port, print = None, access_log = None)
+
+## end program
@@ -0,0 +1,45 @@
+## libraries
+import os
+import sys
+import tempfile
+import unittest
+
+## modules
+sys.path.insert(0, './')
+from ext.src.cores import cpu_count, cpu_quota
+
+## tests
+class TestCores(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.root = self.temp.name
+        os.makedirs(os.path.join(self.root, 'sys/fs/cgroup/cpu'))
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def write(self, name, value):
+        with open(os.path.join(self.root, 'sys/fs/cgroup', name), 'w') as f:
+            f.write(value)
+
+    def test_v2(self):
+        self.write(name = 'cpu.max', value = '150000 100000\n')
+        self.assertEqual(cpu_quota(root = self.root), 2)
+        self.write(name = 'cpu.max', value = 'max 100000\n')
+        self.assertIsNone(cpu_quota(root = self.root))
+
+    def test_v1(self):
+        self.write(name = 'cpu/cpu.cfs_quota_us', value = '100000\n')
+        self.write(name = 'cpu/cpu.cfs_period_us', value = '100000\n')
+        self.assertEqual(cpu_quota(root = self.root), 1)
+        self.assertEqual(cpu_count(root = self.root), 1)
+        self.write(name = 'cpu/cpu.cfs_quota_us', value = '-1\n')
+        self.assertIsNone(cpu_quota(root = self.root))
+
+    def test_none(self):
+        self.assertIsNone(cpu_quota(root = self.root))
+        self.assertEqual(cpu_count(root = self.root), len(os.sched_getaffinity(0)))
+
+## run tests
+if __name__ == '__main__':
+    unittest.main()
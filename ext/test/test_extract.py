@@ -0,0 +1,412 @@
+## libraries
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate
+from google.transit import gtfs_realtime_pb2
+
+## modules
+sys.path.insert(0, './')
+import ext.src.extract as extract
+from ext.src.extract import CODECS, FORMATS, ExtractClient, arrow_batch, pyarrow, FeedState, accept, blob_keys, encode, frame, proc_feed, retry_after, varint
+from ext.src.share import SharedSnapshot, publish
+from sub.src.subset import get_body, get_delim
+
+## test config
+def ini(path, name, urls):
+    with open(os.path.join(path, name), 'w') as f:
+        f.write('[api]\n' + ''.join('{x}={y}\n'.format(x = i, y = j) for i, j in urls.items()))
+    return os.path.join(path, name)
+
+## test feed
+def feed(*rows, time_f = 1000):
+    message = gtfs_realtime_pb2.FeedMessage()
+    message.header.gtfs_realtime_version = '2.0'
+    message.header.timestamp = time_f
+    for vehicle_id, trip_id, lat, lon, ts in rows:
+        i = message.entity.add()
+        i.id = vehicle_id
+        i.vehicle.vehicle.id = vehicle_id
+        i.vehicle.trip.trip_id = trip_id
+        i.vehicle.position.latitude = lat
+        i.vehicle.position.longitude = lon
+        i.vehicle.timestamp = ts
+    return message.SerializeToString()
+
+## decode body as subset does, in small chunks
+def decode(body, encoding, framing = None):
+    async def chunks():
+        data = b''.join(body)
+        for i in range(0, len(data), 7):
+            yield data[i:i + 7]
+    async def run():
+        body = get_body(chunks = chunks(), encoding = encoding)
+        if framing == 'delimited':
+            return [i async for i in get_delim(chunks = body)]
+        return [b''.join([i async for i in body])]
+    return asyncio.run(run())
+
+## tests
+class TestRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(retry_after(headers = {'Retry-After': '120'}), 120.0)
+        self.assertEqual(retry_after(headers = {'Retry-After': '-5'}), 0.0)
+
+    def test_http_date(self):
+        time_w = retry_after(headers = {'Retry-After': formatdate(time.time() + 120, usegmt = True)})
+        self.assertAlmostEqual(time_w, 120.0, delta = 2.0)
+        self.assertEqual(retry_after(headers = {'Retry-After': formatdate(time.time() - 120, usegmt = True)}), 0.0)
+
+    def test_default(self):
+        self.assertEqual(retry_after(headers = None, default = 30), 30.0)
+        self.assertEqual(retry_after(headers = {}, default = 30), 30.0)
+        self.assertEqual(retry_after(headers = {'Retry-After': 'soon'}, default = 30), 30.0)
+
+class TestFeedState(unittest.TestCase):
+    def setUp(self):
+        self.state = FeedState(key = 'API_END_NYC', url = 'http://a/nyc', time_r = 30, time_min = 5, time_max = 60, time_l = 1)
+
+    def test_plan(self):
+        self.assertEqual(self.state.plan(time_t = 1000), 30.0)  ## no header timestamp
+        self.state.learn(time_f = 1000, time_t = 1002)
+        self.assertEqual(self.state.plan(time_t = 1002), 5.0)  ## learning interval
+        self.state.learn(time_f = 1020, time_t = 1023)
+        self.assertTrue(self.state.changed)
+        self.assertEqual(self.state.interval(), 20)
+        self.assertEqual(self.state.plan(time_t = 1023), 20.0)  ## publish 1020 + age 2 + 20, poll 1 later
+        self.assertEqual(self.state.plan(time_t = 1070), 5.0)  ## publish already due
+        self.state.learn(time_f = 1020, time_t = 1030)
+        self.assertFalse(self.state.changed)
+
+    def test_suspend(self):
+        self.state.learn(time_f = 1000, time_t = 1002)
+        self.state.learn(time_f = 1020, time_t = 1023)
+        self.state.suspend(time_w = 45, time_t = 1023)
+        self.assertEqual(self.state.plan(time_t = 1023), 45.0)
+        self.state.suspend(time_w = 10, time_t = 1023)  ## keeps the longer backoff
+        self.assertEqual(self.state.plan(time_t = 1048), 20.0)
+        self.assertEqual(self.state.plan(time_t = 1068), 5.0)
+
+    def test_hedge(self):
+        for _ in range(9):
+            self.state.time_q.append(0.1)
+        self.assertIsNone(self.state.hedge())  ## learning
+        self.state.time_q.extend([0.1] * 10 + [0.12])
+        self.assertIsNone(self.state.hedge())  ## stable tail
+        self.state.time_q.clear()
+        self.state.time_q.extend([0.1] * 18 + [1.5] * 2)
+        self.assertEqual(self.state.hedge(), 1.5)  ## erratic tail
+        self.assertIsNone(self.state.hedge(r = 20))
+
+class TestProcFeed(unittest.TestCase):
+    def test_proc_feed(self):
+        message = gtfs_realtime_pb2.FeedMessage()
+        message.ParseFromString(feed(
+            ('a', 't1', 40.5, -73.5, 1000),
+            ('b', 't2', 40.6, -73.6, 1000),
+            ('a', 't3', 40.7, -73.7, 1010)  ## duplicate vehicle id
+        ))
+        i = message.entity.add()  ## no position
+        i.id = 'c'
+        i.vehicle.vehicle.id = 'c'
+        i.vehicle.trip.trip_id = 't4'
+        i.vehicle.timestamp = 1000
+        i = message.entity.add()  ## vehicle id from entity id and label
+        i.id = 'd'
+        i.vehicle.vehicle.label = 'bus d'
+        i.vehicle.trip.route_id = 'r5'
+        i.vehicle.position.latitude = 40.8
+        i.vehicle.position.longitude = -73.8
+        i.vehicle.timestamp = 1000
+        content = message.SerializeToString()
+
+        time_f, data, codes = proc_feed(content = content, iata = 'NYC', codecs = CODECS)
+        self.assertEqual(time_f, 1000)
+        out = gtfs_realtime_pb2.FeedMessage()
+        out.ParseFromString(data)
+        self.assertEqual([i.vehicle.vehicle.id for i in out.entity], ['a', 'b', 'a', 'd'])  ## dupl omitted by subset
+        self.assertEqual({i.vehicle.vehicle.label for i in out.entity}, {'NYC'})
+        self.assertEqual({i: encode(data = data, codec = i) for i in CODECS}, codes)
+
+        with ProcessPoolExecutor(max_workers = 1) as pool:
+            self.assertEqual(pool.submit(proc_feed, content, 'NYC', CODECS, False).result(), (time_f, data, codes))
+
+        message.header.incrementality = gtfs_realtime_pb2.FeedHeader.DIFFERENTIAL
+        self.assertEqual(proc_feed(content = message.SerializeToString(), iata = 'NYC'), (1000, None, None))
+
+class TestEncodings(unittest.TestCase):
+    def test_blob_keys(self):
+        self.assertEqual(blob_keys(codecs = ('gzip',), forms = ('protobuf',)), ('gzip',))
+        self.assertEqual(blob_keys(codecs = ('zstd', 'gzip'), forms = ('protobuf', 'arrow')),
+            ('zstd', 'gzip', 'arrow', 'arrow-zstd', 'arrow-gzip'))
+
+    def test_accept(self):
+        self.assertEqual(accept(header = 'gzip, zstd', codecs = ('gzip',)), 'gzip')
+        self.assertEqual(accept(header = 'zstd', codecs = ('gzip',)), None)  ## identity
+        self.assertEqual(accept(header = 'gzip;q=0.5, zstd', codecs = ('zstd', 'gzip')), 'zstd')
+        self.assertEqual(accept(header = None), None)
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        path = self.temp.name
+        ini(path = path, name = 'us-east.ini', urls = {'API_END_NYC': 'http://a/nyc', 'API_END_BOS': 'http://a/bos'})
+        open(os.path.join(path, '.env'), 'w').close()
+        self.client = ExtractClient(
+            env_file = os.path.join(path, '.env'),
+            ini_file = ini(path = path, name = 'ww-full.ini', urls = {
+                'API_END_AKL': 'http://a/akl',
+                'API_END_BOS': 'http://a/bos',
+                'API_END_NYC': 'http://a/nyc'
+            }),
+            ini_sect = 'api'
+        )
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+class TestSelect(TestClient):
+    def test_iata(self):
+        self.assertEqual(self.client.select(), None)
+        self.assertEqual(self.client.select(iata = ['nyc', ' AKL', '']), ['API_END_AKL', 'API_END_NYC'])  ## .ini order
+        with self.assertRaises(ValueError):
+            self.client.select(iata = ['NYC', 'LAX'])
+
+    def test_region(self):
+        self.assertEqual(self.client.select(region = 'us-east'), ['API_END_BOS', 'API_END_NYC'])
+        self.assertEqual(self.client.select(iata = ['NYC', 'AKL'], region = 'us-east'), ['API_END_NYC'])
+        self.assertEqual(sorted(self.client.regions), ['us-east', 'ww-full'])
+        with self.assertRaises(KeyError):
+            self.client.select(region = 'mars')
+
+class TestShare(TestClient):
+    def test_age(self):
+        path = os.path.join(self.temp.name, 'extract.snap')
+        self.assertIsNone(self.client.age(time_t = 1000.0))  ## not shared
+        self.client.shared = SharedSnapshot(path = path)
+        self.assertIsNone(self.client.age(time_t = 1000.0))  ## not published yet
+        publish(path = path, index = {'etag': None, 'time': 950.0, 'feeds': []}, blobs = [])
+        self.client.shared.load()
+        self.assertEqual(self.client.age(time_t = 1000.0), 50.0)
+        self.client.snap()
+        self.assertEqual(self.client.read()[1], 202)
+        self.assertIn('X-Snapshot-Age', self.client.read()[2])
+
+    def test_publish(self):
+        path = os.path.join(self.temp.name, 'extract.snap')
+        self.client.path, self.client.lock = path, -1  ## fetcher worker
+        asyncio.run(self.client.proc(i = 'API_END_NYC', result = (200, feed(('a', 't1', 40.5, -73.5, 1000)), {})))
+        self.client.snap()
+        self.assertFalse(os.path.exists(path))  ## not written in snap
+        asyncio.run(self.client.publish(keys = self.client.live, time_t = 1000.0))
+        self.assertEqual((self.client.time_p, self.client.etag_p), (1000.0, self.client.etag))
+
+        shared = SharedSnapshot(path = path)
+        self.assertTrue(shared.load())
+        self.assertEqual([i['key'] for i in shared.index['feeds']], ['API_END_NYC'])
+        self.assertEqual(bytes(shared.slice(span = shared.index['feeds'][0]['raw'])), self.client.feeds[0])
+        self.client.lock = None
+
+class TestRun(TestClient):
+    def test_suspended(self):
+        polled = list()
+        async def poll(i):
+            polled.append(i)
+            return await self.client.proc(i = i, result = (200, feed(('a', 't1', 40.5, -73.5, 1000)), {}))
+        self.client.poll = poll
+        self.client.state['API_END_BOS'].suspend(time_w = 60, time_t = time.time())
+        body, status, headers = asyncio.run(self.client.run(time_c = 5))
+        self.assertEqual(polled, ['API_END_AKL', 'API_END_NYC'])
+        self.assertEqual((status, headers['X-Feeds-Missing']), (200, 'BOS'))
+
+class TestReload(TestClient):
+    def tearDown(self):
+        os.environ.pop('API_KEY_TST', None)
+        super().tearDown()
+
+    def test_reload(self):
+        path = self.temp.name
+        with open(os.path.join(path, '.env'), 'w') as f:
+            f.write('API_KEY_TST=a\n')
+        asyncio.run(self.client.reload(share = False))
+        pool = self.client.pools['API_KEY_TST']
+        self.client.cache['API_END_NYC'] = (0.0, b'nyc', dict())
+        self.client.cache['API_END_BOS'] = (0.0, b'bos', dict())
+        state = self.client.state['API_END_BOS']
+
+        ini(path = path, name = 'ww-full.ini', urls = {
+            'API_END_BOS': 'http://a/bos',
+            'API_END_NYC': 'http://b/nyc',
+            'API_END_LAX': 'http://a/lax'
+        })
+        diff = asyncio.run(self.client.reload(share = False))
+        self.assertEqual(diff, {'added': ['API_END_LAX'], 'removed': ['API_END_AKL'], 'changed': ['API_END_NYC']})
+        self.assertEqual(list(self.client.urls), ['API_END_BOS', 'API_END_NYC', 'API_END_LAX'])
+        self.assertEqual(list(self.client.cache), ['API_END_BOS'])  ## changed feed left the snapshot
+        self.assertIs(self.client.state['API_END_BOS'], state)  ## unchanged feed kept its schedule
+        self.assertEqual(self.client.state['API_END_NYC'].url, 'http://b/nyc')
+        self.assertNotIn('API_END_AKL', self.client.state)
+        self.assertIs(self.client.pools['API_KEY_TST'], pool)  ## unchanged pool kept its buckets
+        self.assertEqual(self.client.select(iata = ['LAX']), ['API_END_LAX'])
+        with self.assertRaises(ValueError):
+            self.client.select(iata = ['AKL'])
+
+    def test_removed_key(self):
+        with open(os.path.join(self.temp.name, '.env'), 'w') as f:
+            f.write('API_KEY_TST=a\n')
+        asyncio.run(self.client.reload(share = False))
+        self.assertIn('API_KEY_TST', self.client.pools)
+
+        with open(os.path.join(self.temp.name, '.env'), 'w') as f:
+            f.write('')
+        asyncio.run(self.client.reload(share = False))
+        self.assertNotIn('API_KEY_TST', os.environ)
+        self.assertNotIn('API_KEY_TST', self.client.pools)
+
+class TestConditional(TestClient):
+    def proc(self, i, result):
+        return asyncio.run(self.client.proc(i = i, result = result))
+
+    def test_not_modified(self):
+        content = feed(('a', 't1', 40.5, -73.5, 1000))
+        self.assertFalse(self.proc(i = 'API_END_NYC', result = (304, b'', {})))  ## not cached yet
+        self.assertTrue(self.proc(i = 'API_END_NYC', result = (200, content, {'ETag': '"v1"', 'Last-Modified': 'x'})))
+        state = self.client.state['API_END_NYC']
+        self.assertEqual(state.cond(), {'If-None-Match': '"v1"', 'If-Modified-Since': 'x'})
+        data = self.client.cache['API_END_NYC'][1]
+        self.client.cache['API_END_NYC'] = (0.0,) + self.client.cache['API_END_NYC'][1:]
+        self.client.dirty = False
+        self.assertTrue(self.proc(i = 'API_END_NYC', result = (304, b'', {})))
+        self.assertGreater(self.client.cache['API_END_NYC'][0], 0.0)  ## renewed cache time
+        self.assertIs(self.client.cache['API_END_NYC'][1], data)
+        self.assertFalse(self.client.dirty)
+
+    def test_same_digest(self):
+        content = feed(('a', 't1', 40.5, -73.5, 1000))
+        self.assertTrue(self.proc(i = 'API_END_NYC', result = (200, content, {'ETag': '"v1"'})))
+        data = self.client.cache['API_END_NYC'][1]
+        self.client.dirty = False
+        parse = self.client.parse
+        async def fail(**kwargs):
+            raise AssertionError('parsed unchanged feed')
+        self.client.parse = fail
+        self.assertTrue(self.proc(i = 'API_END_NYC', result = (200, bytes(content), {'ETag': '"v2"'})))
+        self.assertIs(self.client.cache['API_END_NYC'][1], data)
+        self.assertEqual(self.client.state['API_END_NYC'].etag, '"v2"')
+        self.assertFalse(self.client.dirty)
+        self.client.parse = parse
+        self.assertTrue(self.proc(i = 'API_END_NYC', result = (200, feed(('a', 't1', 40.6, -73.5, 1030)), {})))
+        self.assertTrue(self.client.dirty)
+
+    def test_if_none_match(self):
+        self.proc(i = 'API_END_NYC', result = (200, feed(('a', 't1', 40.5, -73.5, 1000)), {}))
+        body, status, headers = self.client.read()
+        self.assertEqual(status, 200)
+        body, status, headers_n = self.client.read(etag = headers['ETag'])
+        self.assertEqual((body, status, headers_n['ETag']), (None, 304, headers['ETag']))
+        _, status, headers_g = self.client.read(etag = headers['ETag'], encoding = 'gzip')
+        self.assertEqual(status, 200)  ## distinct version per encoding
+        self.assertEqual(self.client.read(etag = headers_g['ETag'], encoding = 'gzip')[1], 304)
+        self.proc(i = 'API_END_NYC', result = (200, feed(('a', 't1', 40.6, -73.5, 1030)), {}))
+        self.assertEqual(self.client.read(etag = headers['ETag'])[1], 200)  ## changed feed
+
+class TestRead(TestClient):
+    def setUp(self):
+        super().setUp()
+        self.client.codecs = CODECS
+        self.client.blobs = blob_keys(codecs = CODECS)
+        self.feeds = {
+            'API_END_NYC': feed(('a', 't1', 40.5, -73.5, 1000), ('b', 't2', 40.6, -73.6, 1000)),
+            'API_END_BOS': feed(('c', 't3', 42.3, -71.0, 1000))
+        }
+        for i, j in self.feeds.items():
+            asyncio.run(self.client.proc(i = i, result = (200, j, {})))
+
+    def vehicles(self, messages):
+        out = list()
+        for i in messages:
+            message = gtfs_realtime_pb2.FeedMessage()
+            message.ParseFromString(i)
+            out.append([j.vehicle.vehicle.id for j in message.entity])
+        return out
+
+    def test_round_trip(self):
+        for encoding in (None,) + CODECS:
+            for framing in (None, 'delimited'):
+                body, status, headers = self.client.read(framing = framing, encoding = encoding)
+                self.assertEqual(status, 200)
+                self.assertEqual(headers.get('Content-Encoding'), encoding)
+                self.assertEqual(int(headers['Content-Length']), sum(len(i) for i in body))
+                self.assertEqual(headers['X-Feeds-Missing'], 'AKL')
+                vehicles = self.vehicles(messages = decode(body = body, encoding = encoding, framing = framing))
+                if framing == 'delimited':
+                    self.assertEqual(vehicles, [['c'], ['a', 'b']])  ## one message per agency, .ini order
+                else:
+                    self.assertEqual(vehicles, [['c', 'a', 'b']])  ## merged message
+
+    def test_keys(self):
+        body, status, headers = self.client.read(keys = ['API_END_BOS'], encoding = 'gzip', framing = 'delimited')
+        self.assertNotIn('X-Feeds-Missing', headers)
+        self.assertEqual(self.vehicles(messages = decode(body = body, encoding = 'gzip', framing = 'delimited')), [['c']])
+        _, status, headers = self.client.read(keys = ['API_END_AKL'])
+        self.assertEqual((status, headers['X-Feeds-Missing']), (202, 'AKL'))
+        with self.assertRaises(ValueError):
+            self.client.read(framing = 'length')
+
+    def test_frame(self):
+        self.assertEqual(varint(1), b'\x01')
+        self.assertEqual(varint(300), b'\xac\x02')
+        self.assertEqual(frame(chunks = [b'ab', b'c']), [b'ab', b'c'])
+        self.assertEqual(frame(chunks = [b'ab', b'c'], framing = 'delimited'), [b'\x02', b'ab', b'\x01', b'c'])
+
+SCHEMA = getattr(extract, 'SCHEMA', None)
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class TestArrow(TestClient):
+    def setUp(self):
+        super().setUp()
+        self.client.codecs, self.client.forms = CODECS, FORMATS
+        self.client.blobs = blob_keys(codecs = CODECS, forms = FORMATS)
+        self.feeds = {
+            'API_END_NYC': feed(('a', 't1', 40.5, -73.5, 1000), ('b', 't2', 40.6, -73.6, 1010)),
+            'API_END_BOS': feed(('c', 't3', 42.3, -71.0, 1020))
+        }
+        for i, j in self.feeds.items():
+            asyncio.run(self.client.proc(i = i, result = (200, j, {})))
+
+    def test_batch(self):
+        message = gtfs_realtime_pb2.FeedMessage()
+        message.ParseFromString(self.feeds['API_END_BOS'])
+        message.entity[0].vehicle.vehicle.label = 'BOS'
+        batch = pyarrow.ipc.read_record_batch(pyarrow.py_buffer(arrow_batch(entity = message.entity)), SCHEMA)
+        row = {i: j[0] for i, j in batch.to_pydict().items()}
+        self.assertAlmostEqual(row.pop('latitude'), 42.3, places = 5)  ## float32
+        self.assertAlmostEqual(row.pop('longitude'), -71.0, places = 5)
+        self.assertEqual(row, {'iata_id': 'BOS', 'vehicle_id': 'c', 'trip_id': 't3', 'route_id': '', 'timestamp': 1020})
+
+    def test_stream(self):
+        for encoding in (None,) + CODECS:
+            body, status, headers = self.client.read(form = 'arrow', encoding = encoding, keys = ['API_END_NYC'])
+            self.assertEqual(status, 200)
+            self.assertEqual(headers['Content-Type'], 'application/vnd.apache.arrow.stream')
+            self.assertEqual(headers.get('Content-Encoding'), encoding)
+            self.assertEqual(int(headers['Content-Length']), sum(len(i) for i in body))
+            data = decode(body = body, encoding = encoding, framing = None)[0]
+            table = pyarrow.ipc.open_stream(data).read_all()
+            self.assertEqual(table.column_names, ['iata_id', 'vehicle_id', 'trip_id', 'route_id', 'latitude', 'longitude', 'timestamp'])
+            self.assertEqual(table.num_rows, 2)
+            self.assertEqual(table.column('iata_id').to_pylist(), ['NYC', 'NYC'])
+            self.assertEqual(table.column('vehicle_id').to_pylist(), ['a', 'b'])
+            self.assertEqual(table.column('timestamp').to_pylist(), [1000, 1010])
+        table = pyarrow.ipc.open_stream(b''.join(self.client.read(form = 'arrow')[0])).read_all()
+        self.assertEqual(table.column('vehicle_id').to_pylist(), ['c', 'a', 'b'])
+        with self.assertRaises(ValueError):
+            self.client.read(form = 'arrow', framing = 'delimited')
+
+## run tests
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+## libraries
+import sys
+import unittest
+
+## modules
+sys.path.insert(0, './')
+from ext.src.keys import KeyPool, KeyWait, key_pools, quota
+
+## tests
+class TestKeyPool(unittest.TestCase):
+    def test_exhaust_and_refill(self):
+        pool = KeyPool(name = 'API_KEY_DUB', keys = ['a', 'b'], rate = 1.0, size = 2.0)
+        self.assertEqual([pool.take(time_t = 0.0) for _ in range(4)], ['a', 'b', 'a', 'b'])
+        with self.assertRaises(KeyWait) as e:
+            pool.take(time_t = 0.0)
+        self.assertEqual(e.exception.name, 'API_KEY_DUB')
+        self.assertEqual(e.exception.time_w, 1.0)
+        with self.assertRaises(KeyWait) as e:
+            pool.take(time_t = 0.5)
+        self.assertEqual(e.exception.time_w, 0.5)
+        self.assertEqual(pool.take(time_t = 1.0), 'a')
+        pool.take(time_t = 100.0)
+        self.assertEqual(pool.tokens, {'a': 1.0, 'b': 2.0})  ## refill capped at bucket size
+
+    def test_backoff(self):
+        pool = KeyPool(name = 'API_KEY_DUB', keys = ['a', 'b'], rate = 1.0, size = 2.0)
+        pool.backoff(key = 'a', time_w = 10.0, time_t = 0.0)
+        self.assertEqual([pool.take(time_t = 0.0) for _ in range(2)], ['b', 'b'])
+        self.assertEqual(pool.wait(time_t = 0.0), 1.0)
+        pool.backoff(key = 'b', time_w = 30.0, time_t = 0.0)
+        self.assertEqual(pool.wait(time_t = 0.0), 10.0)
+        with self.assertRaises(KeyWait):
+            pool.take(time_t = 5.0)
+        self.assertEqual(pool.take(time_t = 10.0), 'a')
+
+    def test_no_quota(self):
+        pool = KeyPool(name = 'API_KEY_NYC', keys = ['a', 'b'])
+        self.assertEqual([pool.take(time_t = float(i)) for i in range(1, 5)], ['a', 'b', 'a', 'b'])
+        pool.backoff(key = 'a', time_w = 10.0, time_t = 5.0)
+        self.assertEqual([pool.take(time_t = float(i)) for i in range(6, 8)], ['b', 'b'])
+
+class TestQuota(unittest.TestCase):
+    def test_quota(self):
+        self.assertEqual(quota(value = '60/60'), (1.0, 60.0))
+        self.assertEqual(quota(value = '60/60/10'), (1.0, 10.0))
+        self.assertAlmostEqual(quota(value = '5000/86400')[1], 5000 / 1440)  ## one minute of requests
+        for i in ('60', '0/60', '60/60/1/1', 'a/b'):
+            with self.assertRaises(ValueError):
+                quota(value = i)
+
+    def test_key_pools(self):
+        self.assertEqual(key_pools(env = {
+            'API_KEY_DUB_A': 'a',
+            'API_KEY_DUB_B': 'b',
+            'API_KEY_NYC': 'c, d,c',
+            'API_KEY_SFO': '',
+            'PATH': '/bin'
+        }), {'API_KEY_DUB': ['a', 'b'], 'API_KEY_NYC': ['c', 'd']})
+
+## run tests
+if __name__ == '__main__':
+    unittest.main()
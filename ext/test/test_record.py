@@ -0,0 +1,51 @@
+## libraries
+import sys
+import tempfile
+import unittest
+
+## modules
+sys.path.insert(0, './')
+from ext.src.record import Recorder, Replayer, segments
+
+## tests
+class TestRecord(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.path = self.temp.name
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def test_replay_order(self):
+        recorder = Recorder(path = self.path)
+        recorder.write(key = 'API_END_NYC', url = 'http://a/nyc', content = b'nyc-1', time_t = 100.0)
+        recorder.write(key = 'API_END_BOS', url = 'http://a/bos', content = b'bos-1', time_t = 101.0)
+        recorder.write(key = 'API_END_NYC', url = 'http://a/nyc', content = b'nyc-2', time_t = 102.0)
+        recorder.close()
+
+        replayer = Replayer(path = self.path, speed = 0)
+        entries = replayer.entries()
+        self.assertEqual([i['k'] for i in entries], ['API_END_NYC', 'API_END_BOS', 'API_END_NYC'])
+        self.assertEqual([replayer.read(entry = i) for i in entries], [b'nyc-1', b'bos-1', b'nyc-2'])
+        self.assertEqual(replayer.delay(entry = entries[2], time_r = 100.0, time_s = 0.0), 0.0)
+
+    def test_rotate_and_keep(self):
+        recorder = Recorder(path = self.path, time_m = 10, keep_n = 2)
+        for i in range(4):
+            recorder.write(key = 'API_END_NYC', url = 'http://a/nyc', content = bytes([i]), time_t = 100.0 + i * 10)
+        recorder.close()
+
+        self.assertEqual(len(segments(path = self.path)), 2)
+        replayer = Replayer(path = self.path)
+        self.assertEqual([replayer.read(entry = i) for i in replayer.entries()], [b'\x02', b'\x03'])
+
+    def test_partial_index(self):
+        recorder = Recorder(path = self.path)
+        recorder.write(key = 'API_END_NYC', url = 'http://a/nyc', content = b'nyc-1', time_t = 100.0)
+        recorder.index.write('{"t":101.0,"k":')  ## interrupted write
+        recorder.close()
+        self.assertEqual(len(Replayer(path = self.path).entries()), 1)
+
+## run tests
+if __name__ == '__main__':
+    unittest.main()
@@ -1,19 +1,30 @@
 ## libraries
 import os
 import sys
+import asyncio
 import threading
 from flask import Flask, Response, request, abort
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, ConnectionRefusedError, join_room, leave_room
 
 ## source
 sys.path.insert(0, './')
 from .src.subset import find_idle
+from .src.encode import encode, to_format
+from .src.subscribe import EventIndex, ini_region, to_subscription
 
 ## params
 PB_DATA = str(os.getenv(key = 'PB_DATA', default = 'http://extract:8080/extract'))
 R_PARAM = int(os.getenv(key = 'R_PARAM', default = 30))  ## request rate (seconds)
 H_PARAM = int(os.getenv(key = 'H_PARAM', default = 1))  ## time-horizon (interval)
 M_PARAM = int(os.getenv(key = 'M_PARAM', default = 10))  ## append limit (constant)
+E_PARAM = str(os.getenv(key = 'E_PARAM', default = 'python'))  ## idle engine (python or numpy)
+K_PARAM = int(os.getenv(key = 'K_PARAM', default = 1000000))  ## max events in feed h (constant)
+L_PARAM = int(os.getenv(key = 'L_PARAM', default = 86400))  ## event lifetime after last seen (seconds)
+N_PARAM = int(os.getenv(key = 'N_PARAM', default = 4))  ## processes computing agencies apart, 0 for one feed h
+CKPT_PATH = str(os.getenv(key = 'CKPT_PATH', default = ''))  ## checkpoint of buffer and feed h, empty for none
+CKPT_TIME = int(os.getenv(key = 'CKPT_TIME', default = 60))  ## seconds between checkpoints
+REGION_PATH = str(os.getenv(key = 'REGION_PATH', default = './ext/conf/feed'))  ## region .ini files
+CELL_SIZE = float(os.getenv(key = 'CELL_SIZE', default = 1.0))  ## spatial index cell (degrees)
 LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
 
 ## app
@@ -30,6 +41,72 @@ sio = SocketIO(
     cors_allowed_origins = '*'
 )
 
+## encoding and subscription per client (negotiated on connect)
+clients = dict()
+lock = threading.Lock()
+regions = ini_region(path = REGION_PATH)
+
+## client option from query or auth payload
+def option(auth, name):
+    if isinstance(auth, dict) and auth.get(name) is not None:
+        return auth[name]
+    return request.args.get(name)
+
+## move client to room of its format and subscription
+def to_room(form, subscription):
+    room = '{x}:{y}'.format(x = form, y = subscription.key)
+    with lock:
+        if request.sid in clients:
+            leave_room(room = clients[request.sid][2])
+        clients[request.sid] = (form, subscription, room)
+    join_room(room = room)  ## one emission per room
+    return room
+
+## connect client
+@sio.on('connect')
+def connect(auth = None):
+    try:
+        form = to_format(value = option(auth = auth, name = 'format'))
+        subscription = to_subscription(
+            iata_id = option(auth = auth, name = 'iata_id'),
+            region = option(auth = auth, name = 'region'),
+            bbox = option(auth = auth, name = 'bbox'),
+            regions = regions
+        )
+    except ValueError as e:
+        raise ConnectionRefusedError(str(e))
+
+    room = to_room(form = form, subscription = subscription)
+    app.logger.debug(msg = 'Client {x} connected to room {y}.'.format(
+        x = request.sid,
+        y = room
+        )
+    )
+
+## change subscription
+@sio.on('subscribe')
+def subscribe(data = None):
+    data = data if isinstance(data, dict) else dict()
+    try:
+        subscription = to_subscription(
+            iata_id = data.get('iata_id'),
+            region = data.get('region'),
+            bbox = data.get('bbox'),
+            regions = regions
+        )
+    except ValueError as e:
+        return {'error': str(e)}
+
+    with lock:
+        form = clients[request.sid][0]
+    return {'room': to_room(form = form, subscription = subscription)}
+
+## disconnect client
+@sio.on('disconnect')
+def disconnect():
+    with lock:
+        clients.pop(request.sid, None)
+
 ## test app
 @app.route(rule = '/', methods = ['GET'])
 def test():
@@ -39,20 +116,40 @@ def test():
     return Response(response = None, status = 200)
 
 ## buffer and subset
-def subset(sio = sio):
+async def stream(sio = sio):
     app.logger.info(msg = 'Application layer started sucessful.')
-    for i in find_idle(  ## iter thro gen obj
+    async for i in find_idle(  ## iter thro async gen obj
         url = PB_DATA,
         time_r = R_PARAM,
         time_h = H_PARAM,
-        move_m = M_PARAM
+        move_m = M_PARAM,
+        engine = E_PARAM,
+        size_m = K_PARAM,
+        time_l = L_PARAM,
+        part_n = N_PARAM or None,  ## feed h per agency
+        path = CKPT_PATH or None,  ## restored on restart
+        time_k = CKPT_TIME,
+        framing = 'delimited',  ## parse each agency as it arrives
+        form = None  ## encoded per client format
         ):
 
-        ## client data stream
-        sio.emit(
-            event = 'events',  ## listen for event titled "events"
-            data = i  ## send data
-        )
+        ## client data stream (filtered once per subscription, encoded once per room)
+        with lock:
+            rooms = set(clients.values())
+        index = EventIndex(events = i, cell = CELL_SIZE)
+        events = dict()
+        for form, subscription, room in rooms:
+            if subscription not in events:
+                events[subscription] = index.select(subscription = subscription)
+            sio.emit(
+                event = 'events',  ## listen for event titled "events"
+                data = encode(events = events[subscription], form = form),  ## send data
+                to = room
+            )
+
+## event loop
+def subset(sio = sio):
+    asyncio.run(stream(sio = sio))
 
 ## process thread
 thread = threading.Thread(target = lambda: subset(sio = sio))
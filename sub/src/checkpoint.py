@@ -0,0 +1,128 @@
+## libraries
+import os
+import json
+import time
+import zlib
+import logging
+import numpy as np
+from .snapshot import Snapshot, KEYS_STR, KEYS_NUM
+
+## params
+LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
+VERSION = 1  ## checkpoint format
+
+## logging
+fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+hdlr = logging.StreamHandler()
+hdlr.setFormatter(fmt = fmt)
+logging.basicConfig(level = LOG_LEVEL, handlers = [hdlr])
+logger = logging.getLogger(name = __name__)
+logger.propagate = True
+
+## write checkpoint
+def save(path, buffer, stores, time_t = None):
+
+    """
+    Desc:
+        Writes the ring buffer and the idle state stores to a compressed 
+        checkpoint file. The file is written and synced under a temporary 
+        name and atomically renamed over 'path', so a crash during a write 
+        leaves the last complete checkpoint in place.
+
+    Args:
+        path (str): checkpoint file.
+        buffer (deque): ring buffer of Snapshot objects.
+        stores (dict): IdleStore objects per iata id ('' for one feed H).
+        time_t (float): epoch time of the checkpoint (default now).
+
+    Returns:
+        An int of the bytes written.
+
+    Raises:
+        OSError: If the file cannot be written.
+    """
+
+    state = {
+        'version': VERSION,
+        'time': time.time() if time_t is None else time_t,
+        'buffer': [
+            {j: getattr(i, j).tolist() for j in Snapshot.__slots__} for i in list(buffer)
+        ],
+        'stores': {i: j.dump() for i, j in list(stores.items())}
+    }
+    data = zlib.compress(json.dumps(obj = state, separators = (',', ':')).encode(), 6)
+
+    temp = '{x}.{y}.tmp'.format(x = path, y = os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+    logger.debug(msg = 'Client wrote checkpoint of {x} bytes to {y}.'.format(
+        x = len(data),
+        y = path
+        )
+    )
+    return len(data)
+
+## read checkpoint
+def load(path, time_b = None, time_l = None):
+
+    """
+    Desc:
+        Reads a checkpoint written by 'save'. The buffer is only restored when
+        the checkpoint is at most 'time_b' seconds old, so snapshots from 
+        before a long outage are not compared with new ones, and the idle 
+        state only when at most 'time_l' seconds old.
+
+    Args:
+        path (str): checkpoint file.
+        time_b (float): max age of the buffer in seconds (default None, any).
+        time_l (float): max age of the idle state in seconds (default None, any).
+
+    Returns:
+        A tuple of a list of Snapshot objects and a list of idle state rows of
+        (key, first seen, misses, last seen), with the key (iata_id, 
+        vehicle_id, trip_id, route_id, latitude, longitude) (strict order). Both are empty when there is
+        no valid checkpoint.
+
+    Raises:
+        None.
+    """
+
+    try:
+        with open(path, 'rb') as f:
+            state = json.loads(zlib.decompress(f.read()))
+        if state.get('version') != VERSION:
+            raise ValueError('unknown version {x}'.format(x = state.get('version')))
+    except FileNotFoundError:
+        return list(), list()
+    except (OSError, ValueError, zlib.error) as e:
+        logger.warning(msg = 'Client ignored checkpoint {x}: {y}'.format(
+            x = path,
+            y = e
+            )
+        )
+        return list(), list()
+
+    ## restore fresh state only
+    age = time.time() - state['time']
+    buffer, rows = list(), list()
+    if time_b is None or age <= time_b:
+        dtypes = dict.fromkeys(KEYS_STR, object)
+        dtypes.update(dict.fromkeys(KEYS_NUM, np.float64), timestamp = np.int64)
+        buffer = [
+            Snapshot(**{j: np.array(i[j], dtype = dtypes[j]) for j in Snapshot.__slots__}) for i in state['buffer']
+        ]
+    if time_l is None or age <= time_l:
+        rows = [(tuple(i[:6]),) + tuple(i[6:]) for j in state['stores'].values() for i in j]
+
+    logger.info(msg = 'Client restored checkpoint of age {x:.0f} seconds with {y} snapshots and {z} events.'.format(
+        x = age,
+        y = len(buffer),
+        z = len(rows)
+        )
+    )
+    return buffer, rows
+
+## end program
@@ -0,0 +1,201 @@
+## libraries
+import os
+import logging
+import numpy as np
+from .snapshot import KEYS_STR, KEYS_NUM
+
+## params
+LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
+
+## logging
+fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+hdlr = logging.StreamHandler()
+hdlr.setFormatter(fmt = fmt)
+logging.basicConfig(level = LOG_LEVEL, handlers = [hdlr])
+logger = logging.getLogger(name = __name__)
+logger.propagate = True
+
+## state keys to columns
+def state_cols(keys):
+
+    """
+    Desc:
+        Converts a list of feed H keys into the string and numeric columns of
+        a Snapshot object without timestamps.
+
+    Args:
+        keys (list): tuples of (iata_id, vehicle_id, trip_id, route_id,
+            latitude, longitude).
+
+    Returns:
+        A tuple of arrays (strict order of the key).
+
+    Raises:
+        None.
+    """
+
+    cols = tuple(zip(*keys)) or ((),) * 6
+    return tuple(np.array(i, dtype = object) for i in cols[:4]) + \
+        tuple(np.array(i, dtype = np.float64) for i in cols[4:])
+
+## interned integer ids
+def intern_ids(*feeds):
+
+    """
+    Desc:
+        Interns the composite key (iata_id, vehicle_id, trip_id, route_id,
+        latitude, longitude) of each row across all feeds into one integer id,
+        so equal keys share an id regardless of which feed they came from.
+
+    Args:
+        feeds (tuple): tuples of key columns (strict order of the key).
+
+    Returns:
+        A list of int64 arrays, one per feed.
+
+    Raises:
+        None.
+    """
+
+    size = [len(i[0]) for i in feeds]
+    cols = list()
+    for j in range(len(KEYS_STR)):
+        _, code = np.unique(
+            np.concatenate([i[j] for i in feeds]),
+            return_inverse = True
+        )
+        cols.append(code.reshape(-1).astype(np.int64))
+    for j in range(len(KEYS_STR), len(KEYS_STR) + len(KEYS_NUM)):
+        cols.append(np.concatenate([i[j] for i in feeds]).view(np.int64))  ## exact float bits
+
+    _, ids = np.unique(np.stack(cols, axis = 1), axis = 0, return_inverse = True)
+    return np.split(ids.reshape(-1), np.cumsum(size)[:-1])
+
+## feed key columns
+def feed_cols(feed):
+    return tuple(getattr(feed, i) for i in KEYS_STR + KEYS_NUM)
+
+## find idle events
+def feed_idle(buffer, feed_h, move_m, time_h):
+
+    """
+    Desc:
+        Vectorized equivalent of 'subset.feed_idle' over Snapshot objects. It
+        computes the stationary set of feeds A and B, the time lag of
+        telemetry, and the join of feed H and feed C with array operations
+        and produces the same feed Y and feed H.
+
+    Args:
+        buffer (deque): ring buffer of Snapshot objects (default empty).
+        feed_h (IdleStore): idle state store (default empty).
+        move_m (pos int): number of times to omit events (default empty).
+        time_h (pos int): time-horizon interval (default empty).
+
+    Returns:
+        A list and an IdleStore. List is the feed Y. IdleStore is feed H.
+
+    Raises:
+        None.
+    """
+
+    ## init feeds
+    feed_a, feed_b, feed_c = buffer[0], buffer[time_h], buffer[time_h + 1]
+    logger.debug(msg = 'Client initialized feeds A, B, and C of length {x}, {y}, and {z} respectively.'.format(
+        x = len(feed_a),
+        y = len(feed_b),
+        z = len(feed_c)
+        )
+    )
+
+    ## pre-process feed a and feed b from symmet diff
+    feed_a = feed_a.take(np.isin(feed_a.vehicle_id, feed_b.vehicle_id))
+    feed_b = feed_b.take(np.isin(feed_b.vehicle_id, feed_a.vehicle_id))
+
+    ## find events for feed h from intersect of feed a and feed b
+    mask = feed_a.timestamp < feed_b.timestamp
+    for i in KEYS_STR + KEYS_NUM:
+        mask &= getattr(feed_a, i) == getattr(feed_b, i)
+    time_g = feed_b.timestamp[mask] - feed_a.timestamp[mask]
+    feed_s = feed_b.take(mask)
+
+    ## intern keys of feed h, stationary feed b, and feed c
+    keys_h = list(feed_h)
+    ids_h, ids_s, ids_c = intern_ids(
+        state_cols(keys = keys_h),
+        feed_cols(feed = feed_s),
+        feed_cols(feed = feed_c)
+    )
+
+    ## filter for unique events in feed h
+    new = np.flatnonzero(~np.isin(ids_s, ids_h))
+
+    ## append events to feed h
+    keys_s = list(zip(*(getattr(feed_s, i)[new].tolist() for i in KEYS_STR + KEYS_NUM)))
+    for i, j in zip(keys_s, feed_s.timestamp[new].tolist()):
+        feed_h.add(key = i, time_x = j)
+    keys_h += keys_s
+    ids_h = np.concatenate([ids_h, ids_s[new]])
+    time_x = np.array(list(feed_h.values()), dtype = np.int64)
+
+    ## compute time lag of telemtry
+    time_d = np.zeros(len(ids_h), dtype = np.int64)
+    time_d[len(ids_h) - len(new):] = np.where(time_g[new] > time_h, time_g[new] - time_h, 0)
+    logger.debug(msg = 'Client initalized feed H of length {x}.'.format(
+        x = len(feed_h)
+        )
+    )
+
+    ## intersect of feed h and feed c
+    in_c = np.isin(ids_h, ids_c)
+    sort_c = np.argsort(ids_c)
+    join = np.flatnonzero(in_c)
+    index = sort_c[np.searchsorted(ids_c, ids_h[join], sorter = sort_c)]
+
+    ## keep count of times feed h attr not in feed c attr
+    for i, j in zip(join.tolist(), feed_c.timestamp[index].tolist()):
+        feed_h.seen(key = keys_h[i], time_t = j)
+
+    ## omit events from feed h when not in feed c, m number of times
+    for i in np.flatnonzero(~in_c).tolist():
+        if feed_h.miss(key = keys_h[i]) >= move_m:
+            feed_h.remove(key = keys_h[i])
+
+    ## idle durations
+    time_y = feed_c.timestamp[index]
+    duration = time_y - time_x[join] + time_d[join]
+    mask = (time_x[join] < time_y) & (duration > 0)  ## ensure no time sync errors
+    index = index[mask]
+
+    ## create idle events
+    feed_y = [
+        {
+            'iata_id': a,
+            'vehicle_id': b,
+            'trip_id': c,
+            'route_id': d,
+            'latitude': e,
+            'longitude': f,
+            'datetime': g,
+            'duration': h
+        } for a, b, c, d, e, f, g, h in zip(
+            feed_c.iata_id[index].tolist(),
+            feed_c.vehicle_id[index].tolist(),
+            feed_c.trip_id[index].tolist(),
+            feed_c.route_id[index].tolist(),
+            feed_c.latitude[index].tolist(),
+            feed_c.longitude[index].tolist(),
+            feed_c.timestamp[index].tolist(),
+            duration[mask].tolist()
+        )
+    ]
+
+    logger.debug(msg = 'Client successfully computed feed Y of length {x}.'.format(
+        x = len(feed_y)
+        )
+    )
+
+    ## bound feed h
+    feed_h.evict(time_t = feed_c.latest())  ## clock per agency
+
+    ## idle event feeds
+    return feed_y, feed_h
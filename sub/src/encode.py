@@ -0,0 +1,130 @@
+## libraries
+import os
+import json
+import logging
+
+## optional msgpack encoding
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+## params
+LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
+FORMATS = ('json', 'msgpack', 'columnar') if msgpack is not None else ('json',)  ## event encodings
+FIELDS = ('iata_id', 'vehicle_id', 'trip_id', 'route_id', 'latitude', 'longitude', 'datetime', 'duration')
+TABLED = ('iata_id', 'route_id')  ## fields indexed into the string table
+
+## logging
+fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+hdlr = logging.StreamHandler()
+hdlr.setFormatter(fmt = fmt)
+logging.basicConfig(level = LOG_LEVEL, handlers = [hdlr])
+logger = logging.getLogger(name = __name__)
+logger.propagate = True
+
+## negotiated format
+def to_format(value = None):
+
+    """
+    Desc:
+        Returns the event encoding a client asked for on connect, or compact
+        JSON when it did not ask.
+
+    Args:
+        value (str): requested format (default None).
+
+    Returns:
+        A str of 'json', 'msgpack', or 'columnar'.
+
+    Raises:
+        ValueError: If the format is unknown or its encoder is not installed.
+    """
+
+    form = (value or 'json').lower()
+    if form not in FORMATS:
+        raise ValueError('Format {x} must be one of {y}.'.format(
+            x = value,
+            y = ', '.join(FORMATS)
+            )
+        )
+    return form
+
+## columnar batch
+def to_columnar(events):
+
+    """
+    Desc:
+        Converts idle events to one column per field. IATA codes and route
+        ids repeat across events, so they are stored once in a string table
+        ('strings') and their columns hold indexes into it.
+
+    Args:
+        events (list): idle events.
+
+    Returns:
+        A dict of the event count, string table, and columns.
+
+    Raises:
+        None.
+    """
+
+    strings, index = list(), dict()
+    batch = {'n': len(events), 'strings': strings}
+    for i in FIELDS:
+        column = [j[i] for j in events]
+        if i in TABLED:
+            for j, k in enumerate(column):
+                if k not in index:
+                    index[k] = len(strings)
+                    strings.append(k)
+                column[j] = index[k]
+        batch[i] = column
+    return batch
+
+## idle events from columnar batch
+def from_columnar(batch):
+    strings = batch['strings']
+    columns = [
+        [strings[j] for j in batch[i]] if i in TABLED else batch[i] for i in FIELDS
+    ]
+    return [dict(zip(FIELDS, i)) for i in zip(*columns)]
+
+## encode idle events
+def encode(events, form = 'json'):
+
+    """
+    Desc:
+        Encodes idle events for the websocket stream. JSON is compact (no
+        indentation or spaces). MessagePack keeps the list of events, and the
+        columnar batch packs 'to_columnar' with MessagePack. Coordinates are
+        packed as single floats, which holds the GTFS Realtime float values
+        exactly.
+
+    Args:
+        events (list): idle events.
+        form (str): 'json', 'msgpack', or 'columnar' (default 'json').
+
+    Returns:
+        A str of JSON, or bytes of MessagePack.
+
+    Raises:
+        ValueError: If the format is unknown or its encoder is not installed.
+    """
+
+    form = to_format(value = form)
+    if form == 'json':
+        return json.dumps(obj = events, separators = (',', ':'))
+    if form == 'columnar':
+        events = to_columnar(events = events)
+    return msgpack.packb(events, use_single_float = True)
+
+## decode idle events
+def decode(data, form = 'json'):
+    form = to_format(value = form)
+    if form == 'json':
+        return json.loads(data)
+    events = msgpack.unpackb(data)
+    return from_columnar(batch = events) if form == 'columnar' else events
+
+## end program
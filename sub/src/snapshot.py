@@ -0,0 +1,172 @@
+## libraries
+import sys
+import numpy as np
+
+## string and numeric fields (strict order)
+KEYS_STR = ('iata_id', 'vehicle_id', 'trip_id', 'route_id')
+KEYS_NUM = ('latitude', 'longitude')
+
+## compact feed snapshot
+class Snapshot():
+    __slots__ = KEYS_STR + KEYS_NUM + ('timestamp',)
+
+    def __init__(self, iata_id, vehicle_id, trip_id, route_id, latitude, longitude, timestamp):
+
+        """
+        Desc:
+            Struct of arrays holding only the fields idle detection reads, one
+            row per unique vehicle. String columns reference interned strings,
+            so ids repeated across snapshots are stored once.
+
+        Args:
+            iata_id (array): object array of iata ids.
+            vehicle_id (array): object array of vehicle ids.
+            trip_id (array): object array of trip ids.
+            route_id (array): object array of route ids.
+            latitude (array): float64 array of latitudes.
+            longitude (array): float64 array of longitudes.
+            timestamp (array): int64 array of timestamps.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.iata_id = iata_id
+        self.vehicle_id = vehicle_id
+        self.trip_id = trip_id
+        self.route_id = route_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.timestamp = timestamp
+
+    def __len__(self):
+        return len(self.vehicle_id)
+
+    ## subset rows
+    def take(self, index):
+        return Snapshot(*(getattr(self, i)[index] for i in self.__slots__))
+
+    ## split by agency
+    def partition(self):
+
+        """
+        Desc:
+            Splits the snapshot by iata id into one snapshot per agency, 
+            keeping the order of rows within each agency.
+
+        Args:
+            None.
+
+        Returns:
+            A dict of iata ids and Snapshot objects.
+
+        Raises:
+            None.
+        """
+
+        if not len(self):
+            return dict()
+        keys, inverse = np.unique(self.iata_id, return_inverse = True)
+        order = np.argsort(inverse.reshape(-1), kind = 'stable')
+        index = np.split(order, np.cumsum(np.bincount(inverse.reshape(-1)))[:-1])
+        return {i: self.take(j) for i, j in zip(keys.tolist(), index)}
+
+    ## latest timestamp by agency
+    def latest(self):
+
+        """
+        Desc:
+            Returns the latest timestamp of each agency, so each agency is 
+            compared against its own clock, and one agency with skewed or 
+            millisecond timestamps does not age the rows of the others.
+
+        Args:
+            None.
+
+        Returns:
+            A dict of iata ids and int timestamps.
+
+        Raises:
+            None.
+        """
+
+        if not len(self):
+            return dict()
+        keys, inverse = np.unique(self.iata_id, return_inverse = True)
+        time_l = np.full(len(keys), np.iinfo(np.int64).min, dtype = np.int64)
+        np.maximum.at(time_l, inverse.reshape(-1), self.timestamp)
+        return dict(zip(keys.tolist(), time_l.tolist()))
+
+    ## row tuples
+    def rows(self):
+
+        """
+        Desc:
+            Returns the snapshot as a list of row tuples of (iata_id,
+            vehicle_id, trip_id, route_id, latitude, longitude, timestamp)
+            with native python types.
+
+        Args:
+            None.
+
+        Returns:
+            A list of tuples.
+
+        Raises:
+            None.
+        """
+
+        return list(zip(*(getattr(self, i).tolist() for i in self.__slots__)))
+
+## protobuf to snapshot
+def to_snapshot(feed):
+
+    """
+    Desc:
+        Converts a list of protobuf entities into a compact snapshot at parse
+        time. Omits entities with an empty vehicle id, trip and route id,
+        position, or timestamp, and duplicate vehicle ids (first position,
+        last value).
+
+    Args:
+        feed (object): protobuf entities.
+
+    Returns:
+        A Snapshot object.
+
+    Raises:
+        None.
+    """
+
+    ## omit dupl and empty ids
+    rows = dict()
+    for i in feed:
+        v = i.vehicle
+        if v.vehicle.id and \
+            (v.trip.trip_id or v.trip.route_id) and \
+            v.position.latitude and \
+            v.position.longitude and \
+            v.timestamp:
+            rows[v.vehicle.id] = (
+                sys.intern(v.vehicle.label),
+                sys.intern(v.vehicle.id),
+                sys.intern(v.trip.trip_id),
+                sys.intern(v.trip.route_id),
+                v.position.latitude,
+                v.position.longitude,
+                v.timestamp
+            )
+
+    cols = tuple(zip(*rows.values())) or ((),) * 7
+    return Snapshot(
+        iata_id = np.array(cols[0], dtype = object),
+        vehicle_id = np.array(cols[1], dtype = object),
+        trip_id = np.array(cols[2], dtype = object),
+        route_id = np.array(cols[3], dtype = object),
+        latitude = np.array(cols[4], dtype = np.float64),
+        longitude = np.array(cols[5], dtype = np.float64),
+        timestamp = np.array(cols[6], dtype = np.int64)
+    )
@@ -0,0 +1,146 @@
+## libraries
+import os
+import logging
+from collections import OrderedDict
+
+## params
+LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
+
+## logging
+fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+hdlr = logging.StreamHandler()
+hdlr.setFormatter(fmt = fmt)
+logging.basicConfig(level = LOG_LEVEL, handlers = [hdlr])
+logger = logging.getLogger(name = __name__)
+logger.propagate = True
+
+## idle state store
+class IdleStore():
+    def __init__(self, size_m = None, time_l = None):
+
+        """
+        Desc:
+            Bounded state store of feed H and its miss counters. Each key of
+            (iata_id, vehicle_id, trip_id, route_id, latitude, longitude)
+            holds the timestamp the event was first seen, the number of times
+            in a row it was missing from feed C, and the timestamp it was last
+            seen, in one place, so every removal is O(1) and removes all three.
+            Keys are ordered by last seen, and 'evict' drops keys not seen for
+            'time_l' seconds and then the least recently seen keys over
+            'size_m', so memory stays flat however long subset runs.
+
+        Args:
+            size_m (pos int): max number of keys (default None, unbounded).
+            time_l (pos int): seconds a key lives after last seen (default None).
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.size_m = size_m
+        self.time_l = time_l
+        self.time_x = dict()  ## first seen timestamp (feed H)
+        self.move_k = dict()  ## times missing from feed C in a row
+        self.time_s = OrderedDict()  ## last seen timestamp, least recent first
+
+    def __len__(self):
+        return len(self.time_x)
+
+    def __contains__(self, key):
+        return key in self.time_x
+
+    def __iter__(self):
+        return iter(self.time_x)
+
+    def __getitem__(self, key):
+        return self.time_x[key]
+
+    ## first seen timestamps
+    def items(self):
+        return self.time_x.items()
+
+    def values(self):
+        return self.time_x.values()
+
+    ## add event
+    def add(self, key, time_x):
+        self.time_x[key] = time_x
+        self.move_k[key] = 0
+        self.time_s[key] = time_x
+
+    ## event in feed c
+    def seen(self, key, time_t):
+        self.move_k[key] = 0
+        self.time_s[key] = time_t
+        self.time_s.move_to_end(key)
+
+    ## event missing from feed c
+    def miss(self, key):
+        self.move_k[key] += 1
+        return self.move_k[key]
+
+    ## remove event
+    def remove(self, key):
+        del self.time_x[key]
+        del self.move_k[key]
+        del self.time_s[key]
+
+    ## rows of state
+    def dump(self):
+        return [
+            list(i) + [self.time_x[i], self.move_k[i], j] for i, j in list(self.time_s.items())
+        ]
+
+    ## restore event
+    def restore(self, key, time_x, move_k, time_s):
+        self.time_x[key] = time_x
+        self.move_k[key] = move_k
+        self.time_s[key] = time_s
+
+    ## bound store
+    def evict(self, time_t = None):
+
+        """
+        Desc:
+            Removes keys last seen more than 'time_l' seconds before 'time_t',
+            then the least recently seen keys until at most 'size_m' remain.
+            With a dict, each key is compared against the latest timestamp of
+            its own agency, and keys of agencies missing from it are kept.
+
+        Args:
+            time_t (int or dict): latest feed timestamp in seconds, or a dict
+                of them per iata id (default None, no TTL).
+
+        Returns:
+            An int of the number of keys removed.
+
+        Raises:
+            None.
+        """
+
+        size = len(self.time_x)
+        if self.time_l is not None and isinstance(time_t, dict):
+            for key in [i for i, j in self.time_s.items() if i[0] in time_t and time_t[i[0]] - j > self.time_l]:
+                self.remove(key = key)
+        elif self.time_l is not None and time_t is not None:
+            while self.time_s:
+                key, time_s = next(iter(self.time_s.items()))
+                if time_t - time_s <= self.time_l:
+                    break
+                self.remove(key = key)
+        if self.size_m is not None:
+            while len(self.time_x) > self.size_m:
+                self.remove(key = next(iter(self.time_s)))
+
+        size -= len(self.time_x)
+        if size:
+            logger.info(msg = 'Client evicted {x} events from feed H.'.format(
+                x = size
+                )
+            )
+        return size
+
+## end program
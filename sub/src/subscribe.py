@@ -0,0 +1,245 @@
+## libraries
+import os
+import math
+import logging
+import configparser
+
+## params
+LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
+
+## logging
+fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+hdlr = logging.StreamHandler()
+hdlr.setFormatter(fmt = fmt)
+logging.basicConfig(level = LOG_LEVEL, handlers = [hdlr])
+logger = logging.getLogger(name = __name__)
+logger.propagate = True
+
+## agencies per region
+def ini_region(path, sect = 'api', prefix = 'API_END_'):
+
+    """
+    Desc:
+        Loads the agencies of every .ini feed file in 'path' as a region named
+        after the file (e.g. 'us-east.ini' is region 'us-east'), the same
+        regions extract serves at '/extract/region/<region>'.
+
+    Args:
+        path (str): directory of the .ini feed files.
+        sect (str): section of the feed keys (default 'api').
+        prefix (str): prefix of the feed keys (default 'API_END_').
+
+    Returns:
+        A dict of region names and sets of IATA codes.
+
+    Raises:
+        None.
+    """
+
+    regions = dict()
+    if not os.path.isdir(path):
+        logger.warning(msg = 'Client found no region directory {x}.'.format(
+            x = path
+            )
+        )
+        return regions
+
+    for i in sorted(os.listdir(path)):
+        if not i.endswith('.ini'):
+            continue
+        config = configparser.ConfigParser()
+        config.optionxform = str
+        config.read(os.path.join(path, i))
+        if sect in config:
+            regions[i[:-len('.ini')]] = set(
+                j.upper()[-3:] for j in config[sect] if j.upper().startswith(prefix)
+            )
+    return regions
+
+## client subscription
+class Subscription():
+    def __init__(self, iata = None, bbox = None):
+
+        """
+        Desc:
+            Events a client watches: the events of a set of agencies, within
+            a lat/lon bounding box, or both. A bounding box with west greater
+            than east crosses the antimeridian.
+
+        Args:
+            iata (set): IATA codes, None for every agency (default None).
+            bbox (tuple): west, south, east, north in degrees, None for the
+                world (default None).
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.iata = None if iata is None else frozenset(iata)
+        self.bbox = bbox
+
+        ## room of clients with the same subscription
+        self.key = '{x}/{y}'.format(
+            x = ','.join(sorted(self.iata)) if self.iata is not None else '*',
+            y = ','.join('{z:g}'.format(z = i) for i in self.bbox) if self.bbox is not None else '*'
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, Subscription) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    ## event in bounding box
+    def within(self, latitude, longitude):
+        west, south, east, north = self.bbox
+        if not south <= latitude <= north:
+            return False
+        if west <= east:
+            return west <= longitude <= east
+        return longitude >= west or longitude <= east
+
+## parse subscription
+def to_subscription(iata_id = None, region = None, bbox = None, regions = None):
+
+    """
+    Desc:
+        Parses the subscription a client asked for. Agencies named by
+        'iata_id' and 'region' are combined, and 'bbox' narrows them down.
+        Nothing asked for subscribes to every event.
+
+    Args:
+        iata_id (str or list): IATA codes, comma separated (e.g. 'NYC,BOS').
+        region (str or list): region names, comma separated (e.g. 'us-east').
+        bbox (str or list): west, south, east, north in degrees, comma
+            separated (e.g. '-74.3,40.5,-73.7,40.9').
+        regions (dict): region names and sets of IATA codes (see 'ini_region').
+
+    Returns:
+        A Subscription.
+
+    Raises:
+        ValueError: If a region is unknown or the bounding box is malformed.
+    """
+
+    def split(value):
+        if value is None:
+            return list()
+        if isinstance(value, str):
+            value = value.split(',')
+        return [str(i).strip() for i in value if str(i).strip()]
+
+    ## agencies
+    iata, names, areas = None, split(value = iata_id), split(value = region)
+    if names or areas:
+        iata = set(i.upper() for i in names)
+        for i in areas:
+            if i not in (regions or dict()):
+                raise ValueError('Region {x} is unknown.'.format(x = i))
+            iata |= regions[i]
+
+    ## bounding box
+    box = split(value = bbox)
+    if box:
+        try:
+            box = tuple(float(i) for i in box)
+        except ValueError:
+            raise ValueError('Bounding box {x} must be numbers.'.format(x = bbox))
+        if len(box) != 4 or not all(math.isfinite(i) for i in box) or \
+            not -180 <= box[0] <= 180 or not -180 <= box[2] <= 180 or \
+            not -90 <= box[1] <= box[3] <= 90:
+            raise ValueError('Bounding box {x} must be west,south,east,north in degrees.'.format(x = bbox))
+
+    return Subscription(iata = iata, bbox = box or None)
+
+## index of one emission
+class EventIndex():
+    def __init__(self, events, cell = 1.0):
+
+        """
+        Desc:
+            Agency and spatial index of the idle events of one emission, built
+            once and shared by every subscription, so each subscription reads
+            only the events of its agencies or of the grid cells its bounding
+            box covers rather than every event in the world.
+
+        Args:
+            events (list): idle events.
+            cell (pos float): grid cell size in degrees (default 1).
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+
+        self.events = events
+        self.cell = cell
+        self.agency = dict()  ## iata id to event positions
+        self.grid = dict()  ## grid cell to event positions
+        for i, j in enumerate(events):
+            self.agency.setdefault(j['iata_id'], list()).append(i)
+            self.grid.setdefault(self.to_cell(j['latitude'], j['longitude']), list()).append(i)
+
+    ## grid cell of a position
+    def to_cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell), math.floor(longitude / self.cell))
+
+    ## grid cells of a bounding box
+    def cells(self, bbox):
+        west, south, east, north = bbox
+        rows = range(math.floor(south / self.cell), math.floor(north / self.cell) + 1)
+        if west <= east:
+            cols = [range(math.floor(west / self.cell), math.floor(east / self.cell) + 1)]
+        else:
+            cols = [
+                range(math.floor(west / self.cell), math.floor(180 / self.cell) + 1),
+                range(math.floor(-180 / self.cell), math.floor(east / self.cell) + 1)
+            ]
+
+        ## fewer occupied cells than covered cells
+        if len(rows) * sum(len(i) for i in cols) > len(self.grid):
+            return [i for i in self.grid if i[0] in rows and any(i[1] in j for j in cols)]
+        return [(i, k) for i in rows for j in cols for k in j if (i, k) in self.grid]
+
+    ## events of a subscription
+    def select(self, subscription):
+
+        """
+        Desc:
+            Returns the events a subscription watches, in emission order.
+
+        Args:
+            subscription (Subscription): agencies and bounding box.
+
+        Returns:
+            A list of idle events.
+
+        Raises:
+            None.
+        """
+
+        if subscription.iata is None and subscription.bbox is None:
+            return self.events
+
+        ## candidates by agency, or by grid cell
+        if subscription.iata is not None:
+            index = [j for i in subscription.iata for j in self.agency.get(i, list())]
+        else:
+            index = [j for i in self.cells(bbox = subscription.bbox) for j in self.grid[i]]
+
+        ## exact bounds
+        if subscription.bbox is not None:
+            index = [
+                i for i in index if subscription.within(
+                    latitude = self.events[i]['latitude'],
+                    longitude = self.events[i]['longitude']
+                )
+            ]
+        return [self.events[i] for i in sorted(index)]
+
+## end program
@@ -1,13 +1,34 @@
 ## libaries
 import os
 import time
-import json
+import zlib
+import asyncio
 import logging
-import requests as rq
+import aiohttp
+import functools
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from google.transit import gtfs_realtime_pb2
+from google.protobuf.message import DecodeError
+from .snapshot import to_snapshot
+from .store import IdleStore
+from .checkpoint import save, load
+from .encode import encode, to_format
+from .columnar import feed_idle as feed_idle_np
+
+## optional zstd encoding
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 ## params
 LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
+CODECS = ('zstd', 'gzip') if zstandard is not None else ('gzip',)  ## accepted content encodings
+ERRORS = (asyncio.IncompleteReadError, DecodeError, ValueError, zlib.error) + \
+    ((zstandard.ZstdError,) if zstandard is not None else ())  ## body decode and parse errors
 
 ## logging
 fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
@@ -17,92 +38,279 @@ logging.basicConfig(level = LOG_LEVEL, handlers = [hdlr])
 logger = logging.getLogger(name = __name__)
 logger.propagate = True
 
+## next tick
+def next_tick(time_r, time_t = None):
+
+    """
+    Desc:
+        Returns the next wall-clock tick after 'time_t' aligned to whole 
+        multiples of 'time_r', so the polling period does not drift with 
+        fetch and compute time.
+
+    Args:
+        time_r (pos int): seconds between requests.
+        time_t (float): epoch time in seconds (default now).
+
+    Returns:
+        A float of epoch time in seconds.
+
+    Raises:
+        None.
+    """
+
+    time_t = time.time() if time_t is None else time_t
+    return (time_t // time_r + 1) * time_r
+
+## content decoder
+def get_codec(encoding):
+
+    """
+    Desc:
+        Returns a factory of streaming decoders for a content encoding, or 
+        None for identity.
+
+    Args:
+        encoding (str): 'Content-Encoding' header of the response.
+
+    Returns:
+        A function or None.
+
+    Raises:
+        ValueError: If the content encoding is not supported.
+    """
+
+    if not encoding or encoding == 'identity':
+        return None
+    if encoding == 'gzip':
+        return lambda: zlib.decompressobj(wbits = 16 + zlib.MAX_WBITS)
+    if encoding == 'zstd' and zstandard is not None:
+        return lambda: zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError('Client does not support content encoding {x}.'.format(x = encoding))
+
+## decode response body
+async def get_body(chunks, encoding = None):
+
+    """
+    Desc:
+        Asynchronous generator that decodes a response body as it streams in.
+        Back to back gzip members or zstd frames, as sent by extract with one
+        per agency, decode as one body.
+
+    Args:
+        chunks (object): asynchronous iterator of body chunks.
+        encoding (str): 'Content-Encoding' header of the response (default None).
+
+    Returns:
+        Asynchronous generator object of bytes.
+
+    Raises:
+        ValueError: If the content encoding is not supported.
+        asyncio.IncompleteReadError: If the body ends within a member or frame.
+    """
+
+    codec = get_codec(encoding = encoding)
+    if codec is None:
+        async for data in chunks:
+            yield data
+        return
+
+    ## decode member by member
+    decoder, fed = codec(), False
+    async for data in chunks:
+        while data:
+            fed = True
+            out = decoder.decompress(data)
+            if out:
+                yield out
+            if decoder.eof:
+                data = decoder.unused_data
+                decoder, fed = codec(), False
+            else:
+                data = b''
+    if fed:
+        raise asyncio.IncompleteReadError(partial = b'', expected = None)
+
+## read length-delimited messages
+async def get_delim(chunks):
+
+    """
+    Desc:
+        Asynchronous generator that returns each varint length-delimited 
+        message of a response body as soon as it has arrived.
+
+    Args:
+        chunks (object): asynchronous iterator of decoded body chunks.
+
+    Returns:
+        Asynchronous generator object of bytes.
+
+    Raises:
+        asyncio.IncompleteReadError: If the body ends within a message.
+    """
+
+    buffer = bytearray()
+    async for data in chunks:
+        buffer += data
+        pos = 0
+        while True:
+
+            ## varint length prefix
+            size, shift, end = 0, 0, pos
+            while end < len(buffer):
+                byte = buffer[end]
+                size |= (byte & 0x7f) << shift
+                shift += 7
+                end += 1
+                if not byte & 0x80:
+                    break
+            else:
+                break  ## partial prefix
+
+            ## message
+            if end + size > len(buffer):
+                break  ## partial message
+            yield bytes(buffer[end:end + size])
+            pos = end + size
+        del buffer[:pos]
+
+    if buffer:
+        raise asyncio.IncompleteReadError(partial = bytes(buffer), expected = None)
+
 ## get request
-def get_req_par(url, key = None):
+async def get_req_par(session, url, key = None, time_o = None, etag = None, framing = None):
 
     """ 
     Desc:
-        Makes a GET request to 'url' with 'key' in header. Expects a valid 
-        protobuf response and parses it.
+        Makes a GET request to 'url' with 'key' in header over a pooled 
+        keep-alive session. Expects a valid protobuf response and parses it 
+        into a compact snapshot, so the protobuf message is not retained. 
+        With 'etag', the request is conditional and a feed unchanged since 
+        the last request is not downloaded or parsed again. With 'delimited'
+        framing, each agency message is parsed as soon as it arrives while 
+        the rest of the body is still downloading. When the session does not
+        decompress, gzip or zstd bodies are requested and decoded as they 
+        stream in. Messages that are not full datasets of a known version 
+        are omitted (see 'val_head').
     
     Args:
+        session (object): aiohttp client session.
         url (str): URL of API endpoint (default empty).
         key (str): API auth token (default None).
+        time_o (pos int): request deadline in seconds (default session).
+        etag (str): 'ETag' header of the last response (default None).
+        framing (str): None or 'delimited' (default None).
 
     Returns:
-        A list of protobuf entities. 
+        A tuple of a Snapshot object, or None when the feed is unchanged, and
+        the 'ETag' header of the response (strict order).
 
     Raises:
-        ValueError: If response is invalid or missing required field.
+        asyncio.TimeoutError: If the request exceeds the deadline.
     """
 
-    ## make request
-    response = rq.get(
-        url = url,
-        headers = key
-    )
-    logger.debug(msg = 'Client successfully completed GET request to {x}.'.format(
-        x = url
-        )
-    )
+    ## make request (session deadline unless given)
+    params = dict()
+    if time_o is not None:
+        params['timeout'] = aiohttp.ClientTimeout(total = time_o)
+    if framing is not None:
+        params['params'] = {'framing': framing}
+    headers = dict(key or {})
+    if etag is not None:
+        headers['If-None-Match'] = etag  ## conditional request
+    decode = not getattr(session, 'auto_decompress', True)
+    if decode:
+        headers['Accept-Encoding'] = ', '.join(CODECS)  ## compressed transport
+    async with session.get(url = url, headers = headers, **params) as response:
+        status = response.status
+        etag = response.headers.get('ETag', etag)
+
+        ## unchanged feed since last request
+        if status == 304:
+            logger.debug(msg = 'Client found unchanged feed at {x}.'.format(
+                x = url
+                )
+            )
+            return None, etag
 
-    ## parse protobuf
-    message = gtfs_realtime_pb2.FeedMessage()
-    if response.content is not None:
+        ## parse protobuf (per message as it arrives, or whole body)
+        feeds = list()
         try:
-            message.ParseFromString(
-                bytes(response.content)
+            body = get_body(
+                chunks = response.content.iter_any(),
+                encoding = response.headers.get('Content-Encoding') if decode else None
             )
+            if framing == 'delimited':
+                async for i in get_delim(chunks = body):
+                    message = gtfs_realtime_pb2.FeedMessage()
+                    message.ParseFromString(i)
+                    feeds.append(message)
+            else:
+                message = gtfs_realtime_pb2.FeedMessage()
+                message.ParseFromString(
+                    b''.join([i async for i in body])
+                )
+                feeds.append(message)
             logger.debug(msg = 'Client successfully parsed protobuf message.')
-        except Exception as e:
+        except ERRORS as e:
             logger.error(
                 msg = 'Client failed to parse protobuf message: {x}'.format(
                     x = e
                 )
             )
+    logger.debug(msg = 'Client successfully completed GET request to {x}.'.format(
+        x = url
+        )
+    )
 
-    ## unsuccessful protobuf response, http status, headers (strict order)
-    else:
-        logger.warning(msg = 'Client found no protobuf response to parse.')
-        return None, 202, {
-            'Content-Type': 'application/x-protobuf',
-            'Content-Length': 0,
-            'Connection': 'keep-alive'
-        }
-
-    ## validate header
-    if (message.header.gtfs_realtime_version == '2.0' or \
-        message.header.gtfs_realtime_version == '1.0' or \
-        message.header.gtfs_realtime_version == '0.1') and \
-        message.header.incrementality == gtfs_realtime_pb2.FeedHeader.FULL_DATASET:
-        logger.debug(msg = 'Client successfully validated protobuf message header.')
+    ## validate header (omit differential and unknown version feeds)
+    feeds = [i for i in feeds if val_head(message = i)]
 
-        ## validate entity
-        entity_valid = [i for i in message.entity if (
-            i.vehicle.vehicle.id and \
-            i.vehicle.timestamp and \
-            i.vehicle.position.latitude and \
-            i.vehicle.position.longitude and \
-            (i.vehicle.trip.route_id or i.vehicle.trip.trip_id)
-            )
-        ]
+    ## validate entity and omit dupl ids
+    snapshot = to_snapshot(feed = itertools.chain.from_iterable(i.entity for i in feeds))
+    logger.debug(msg = 'Client successfully validated protobuf message entity.')
+    return snapshot, etag
+
+## validate header
+def val_head(message):
+
+    """
+    Desc:
+        Returns whether a protobuf message has a known GTFS realtime version
+        and is a full dataset. Differential feeds only hold changes since
+        the last message, so their vehicles cannot be compared across 
+        snapshots.
+
+    Args:
+        message (object): protobuf feed message.
 
-        ## final message validation
-        del message.entity[:]
-        message.entity.extend(entity_valid)
-        logger.debug(msg = 'Client successfully validated protobuf message entity.')
-    return message.entity
+    Returns:
+        A bool.
+
+    Raises:
+        None.
+    """
+
+    if message.header.gtfs_realtime_version in ('2.0', '1.0', '0.1') and \
+        message.header.incrementality == gtfs_realtime_pb2.FeedHeader.FULL_DATASET:
+        logger.debug(msg = 'Client successfully validated protobuf message header.')
+        return True
+    logger.warning(msg = 'Client omitted protobuf message of version {x} and incrementality {y}.'.format(
+        x = message.header.gtfs_realtime_version or None,
+        y = message.header.incrementality
+        )
+    )
+    return False
 
 ## parse ids
 def set_ids(feed):
 
     """ 
     Desc: 
-        Extracts unique IDs from the vehicle object in a protobuf feed and 
-        returns them as a set.
+        Extracts unique vehicle IDs from a list of snapshot rows and returns 
+        them as a set.
         
     Args:
-        feed (object): protobuf
+        feed (list): snapshot rows.
 
     Returns:
         A set.
@@ -112,7 +320,7 @@ def set_ids(feed):
     """
     
     return set(
-        [i.vehicle.vehicle.id for i in feed]
+        [i[1] for i in feed]
     )
 
 ## exclude ids
@@ -120,78 +328,52 @@ def exd_ids(feed_x, ids_x):
 
     """
     Desc:
-        Returns a list of entities from a given feed that do not have a 
+        Returns a list of rows from a given feed that do not have a 
         vehicle ID in a list of excluded IDs.
 
     Args:
-        feed_x (list): A list of entity objects to filter.
+        feed_x (list): A list of snapshot rows to filter.
         ids_x (list): A list of vehicle IDs to exclude.
 
     Returns:
-        A list of entity objects from `feed_x` whose vehicle ID is not in 
+        A list of snapshot rows from `feed_x` whose vehicle ID is not in 
         `ids_x`.
 
     Raises:
         None.
     """
 
-    return [i for i in feed_x if i.vehicle.vehicle.id not in ids_x]
-
-## omit dupl and empty ids
-def del_ids(feed):
-
-    """
-    Desc: 
-        Removes duplicate and empty vehicle IDs from a valid protobuf feed 
-        and returns a list of the unique vehicles.
-
-    Args:
-        feed (object): A protobuf feed containing entities.
-
-    Returns:
-        A list of protobuf entities with unique IDs.
-
-    Raises:
-        None.
-    """
-
-    feed = [
-        i for i in feed if 
-            i.vehicle.vehicle.id and \
-            (i.vehicle.trip.trip_id or i.vehicle.trip.route_id) and \
-            i.vehicle.position.latitude and \
-            i.vehicle.position.longitude and \
-            i.vehicle.timestamp
-        ]
-
-    return list(
-        {i.vehicle.vehicle.id: i for i in feed}.values()
-    )
+    return [i for i in feed_x if i[1] not in ids_x]
 
 ## find idle events
-def feed_idle(buffer, feed_h, move_k, move_m, time_h):
+def feed_idle(buffer, feed_h, move_m, time_h):
     
     """
     Desc:
+        Computes idle events from feeds A, B, and C in the buffer. Feed H is 
+        a state store keyed on (iata_id, vehicle_id, trip_id, route_id, 
+        latitude, longitude) holding the timestamp each event was first seen
+        and its miss counter, so lookups, evictions, and the join against 
+        feed C are O(1) per vehicle and each call is linear in fleet size.
 
     Args:
-        buffer (list): array of protobufs (default empty).
-        feed_h (list): array of protobufs (default empty).
-        move_k (dict): dictionary of counters (default empty).
+        buffer (deque): ring buffer of Snapshot objects (default empty).
+        feed_h (IdleStore): idle state store (default empty).
         move_m (pos int): number of times to omit events (default empty).
         time_h (pos int): time-horizon interval (default empty).
 
     Returns:
-        2 lists. List 1 is the feed Y. List 2 is feed H.
+        A list and an IdleStore. List is the feed Y. IdleStore is feed H.
 
     Raises:
-        ValueError: 'GTFS feeds A and B not of equal length.'
-        
+        None.
     """
 
-    ## init feeds
+    ## init feeds (rows of key and timestamp)
     try:
-        feed_a, feed_b, feed_c = buffer[0], buffer[time_h], buffer[time_h + 1]
+        feed_a = buffer[0].rows()
+        feed_b = buffer[time_h].rows()
+        feed_c = buffer[time_h + 1].rows()
         logger.debug(msg = 'Client initialized feeds A, B, and C of length {x}, {y}, and {z} respectively.'.format(
             x = len(feed_a),
             y = len(feed_b),
@@ -205,11 +387,6 @@ def feed_idle(buffer, feed_h, move_k, move_m, time_h):
             )
         )
 
-    ## omit dupl and empty ids
-    feed_a = del_ids(feed = feed_a)
-    feed_b = del_ids(feed = feed_b)
-    feed_c = del_ids(feed = feed_c)
-
     ## pre-process feed a and feed b from symmet diff
     ids_a = set_ids(feed = feed_a)
     ids_b = set_ids(feed = feed_b)
@@ -230,151 +407,223 @@ def feed_idle(buffer, feed_h, move_k, move_m, time_h):
     )
 
     ## find events for feed h from intersect of feed a and feed b
-    time_d = list()
+    time_d = dict()
     for a, b in zip(feed_a, feed_b):
-        if (str(a.vehicle.vehicle.id) == str(b.vehicle.vehicle.id) and \
-        ((str(a.vehicle.trip.trip_id) == str(b.vehicle.trip.trip_id) if hasattr(a.vehicle.trip, 'trip_id') and hasattr(b.vehicle.trip, 'trip_id') else True) and \
-        (str(a.vehicle.trip.route_id) == str(b.vehicle.trip.route_id) if hasattr(a.vehicle.trip, 'route_id') and hasattr(b.vehicle.trip, 'route_id') else True)) and \
-        float(a.vehicle.position.latitude) == float(b.vehicle.position.latitude) and \
-        float(a.vehicle.position.longitude) == float(b.vehicle.position.longitude) and \
-        int(a.vehicle.timestamp) < int(b.vehicle.timestamp)):
+        key_b = b[:6]
+        if a[:6] == key_b and a[6] < b[6]:
 
             ## filter for unique events in feed h
-            idle_h = next((i for i in feed_h
-                if (str(i.vehicle.vehicle.id) == str(b.vehicle.vehicle.id) and \
-                ((str(i.vehicle.trip.trip_id) == str(b.vehicle.trip.trip_id) if hasattr(i.vehicle.trip, 'trip_id') and hasattr(b.vehicle.trip, 'trip_id') else True) and \
-                (str(i.vehicle.trip.route_id) == str(b.vehicle.trip.route_id) if hasattr(i.vehicle.trip, 'route_id') and hasattr(b.vehicle.trip, 'route_id') else True)) and \
-                float(i.vehicle.position.latitude) == float(b.vehicle.position.latitude) and \
-                float(i.vehicle.position.longitude) == float(b.vehicle.position.longitude))),
-                None
-            )
-            logger.debug(msg = 'Client successfully filtered H_i for unique events.')
+            if key_b in feed_h:
+                continue
+            feed_h.add(key = key_b, time_x = b[6])
+
+            ## compute time lag of telemtry
+            time_g = b[6] - a[6]
+            if time_g > time_h:
+                time_d[key_b] = time_g - time_h
 
-            ## filter for most recent event in feed h
-            if idle_h is not None:
-                if int(idle_h.vehicle.timestamp) > int(b.vehicle.timestamp):
-                    continue
-            else:
-                feed_h.append(b)
-
-                ## compute time lag of telemtry
-                if len(feed_h) > 0:
-                    time_g = int(b.vehicle.timestamp) - int(a.vehicle.timestamp)
-                    if time_g > time_h:
-                        time_d.append({
-                            'vehicle_id': b.vehicle.vehicle.id,
-                            'duration': int(time_g) - int(time_h)
-                        }
-                    )
     logger.debug(msg = 'Client initalized feed H of length {x}.'.format(
         x = len(feed_h)
         )
     )
 
-    ## pre-process feed h and feed c from symmet diff
-    ids_h = set_ids(feed = feed_h)
-    ids_c = set_ids(feed = feed_c)
-    ids_z = ids_h.symmetric_difference(ids_c)
-    if len(ids_z) > 0:
-        feed_c = exd_ids(
-            feed_x = feed_c,
-            ids_x = ids_z
-        )
-    logger.debug(msg = 'Client preprocessed feeds H and C of length {x} and {y} respectively.'.format(
+    ## index feed c attr
+    attr_c = {i[:6]: i for i in feed_c}
+    logger.debug(msg = 'Client indexed feeds H and C of length {x} and {y} respectively.'.format(
         x = len(feed_h),
-        y = len(feed_c)
+        y = len(attr_c)
         )
     )
 
-    ## init feed c attr
-    attr_c = {(
-        i.vehicle.vehicle.id,
-        i.vehicle.trip.trip_id if hasattr(i.vehicle.trip, 'trip_id') else None,
-        i.vehicle.trip.route_id if hasattr(i.vehicle.trip, 'route_id') else None,
-        i.vehicle.position.latitude,
-        i.vehicle.position.longitude
-        ) for i in feed_c
-    }
-
     ## keep count of times feed h attr not in feed c attr
-    for i in feed_h:
-        attr_h = (
-            i.vehicle.vehicle.id,
-            i.vehicle.trip.trip_id if hasattr(i.vehicle.trip, 'trip_id') else None,
-            i.vehicle.trip.route_id if hasattr(i.vehicle.trip, 'route_id') else None,
-            i.vehicle.position.latitude,
-            i.vehicle.position.longitude
-        )
-
-        ## init counter
-        if attr_h not in move_k:
-            move_k[attr_h] = 0
-
-        ## increment counter
-        if attr_h not in attr_c:
-            move_k[attr_h] += 1
+    for attr_h in list(feed_h):
 
         ## reset counter
-        else:
-            move_k[attr_h] = 0
+        j = attr_c.get(attr_h)
+        if j is not None:
+            feed_h.seen(key = attr_h, time_t = j[6])
 
         ## omit events from feed h when not in feed c, m number of times
-        if move_k.get(attr_h, 0) >= move_m:
-            feed_h.remove(i)
-            move_k.pop(attr_h, None)
+        elif feed_h.miss(key = attr_h) >= move_m:
+            feed_h.remove(key = attr_h)
 
     ## intersect of feed h and feed c
     feed_y = list()
-    for i in feed_h:
-        for j in feed_c:
-            if (str(i.vehicle.vehicle.id) == str(j.vehicle.vehicle.id) and \
-            ((str(i.vehicle.trip.trip_id) == str(j.vehicle.trip.trip_id) if hasattr(i.vehicle.trip, 'trip_id') and hasattr(j.vehicle.trip, 'trip_id') else True) and \
-            (str(i.vehicle.trip.route_id) == str(j.vehicle.trip.route_id) if hasattr(i.vehicle.trip, 'route_id') and hasattr(j.vehicle.trip, 'route_id') else True)) and \
-            float(i.vehicle.position.latitude) == float(j.vehicle.position.latitude) and \
-            float(i.vehicle.position.longitude) == float(j.vehicle.position.longitude) and \
-            int(i.vehicle.timestamp) < int(j.vehicle.timestamp)):
-
-                ## create idle event
-                idle_y = {
-                    'iata_id': j.vehicle.vehicle.label,
-                    'vehicle_id': j.vehicle.vehicle.id,
-                    'trip_id': j.vehicle.trip.trip_id if hasattr(j.vehicle.trip, 'trip_id') else None,
-                    'route_id': j.vehicle.trip.route_id if hasattr(j.vehicle.trip, 'route_id') else None,
-                    'latitude': j.vehicle.position.latitude,
-                    'longitude': j.vehicle.position.longitude,
-                    'datetime': j.vehicle.timestamp,
-                    'duration': int(j.vehicle.timestamp) - int(i.vehicle.timestamp)
-                }
-
-                ## add time lag of telemetry
-                time_y = next(
-                    (k for k in time_d if k['vehicle_id'] == idle_y['vehicle_id']), 
-                    None
-                )
-                if time_y is not None:
-                    idle_y['duration'] = int(
-                        idle_y['duration'] + time_y['duration']
-                    )
-
-                ## add idle event to final output
-                if idle_y['duration'] > 0:  ## ensure no time sync errors
-                    feed_y.append(idle_y)
+    for attr_h, time_x in feed_h.items():
+        j = attr_c.get(attr_h)
+        if j is not None and time_x < j[6]:
+
+            ## create idle event
+            idle_y = {
+                'iata_id': j[0],
+                'vehicle_id': j[1],
+                'trip_id': j[2],
+                'route_id': j[3],
+                'latitude': j[4],
+                'longitude': j[5],
+                'datetime': j[6],
+                'duration': j[6] - time_x
+            }
+
+            ## add time lag of telemetry
+            idle_y['duration'] += time_d.get(attr_h, 0)
+
+            ## add idle event to final output
+            if idle_y['duration'] > 0:  ## ensure no time sync errors
+                feed_y.append(idle_y)
 
     logger.debug(msg = 'Client successfully computed feed Y of length {x}.'.format(
         x = len(feed_y)
         )
     )
 
+    ## bound feed h
+    feed_h.evict(time_t = buffer[time_h + 1].latest())  ## clock per agency
+
     ## idle event feeds
     return feed_y, feed_h
 
+## timed partition
+def part_run(idle_fn, buffer, feed_h, move_m, time_h):
+
+    """
+    Desc:
+        Computes the idle events of one agency partition and times it. Feed H
+        is returned as well, since in a process pool the partition computes 
+        against a copy of it.
+
+    Args:
+        idle_fn (function): idle engine, see 'feed_idle'.
+        buffer (list): Snapshot objects of one agency.
+        feed_h (IdleStore): idle state store of the agency.
+        move_m (pos int): number of times to omit events.
+        time_h (pos int): time-horizon interval.
+
+    Returns:
+        A tuple of feed Y, feed H, and seconds (strict order).
+
+    Raises:
+        None.
+    """
+
+    time_s = time.perf_counter()
+    feed_y, feed_h = idle_fn(buffer = buffer, feed_h = feed_h, move_m = move_m, time_h = time_h)
+    return feed_y, feed_h, time.perf_counter() - time_s
+
+## find idle events per agency
+async def part_idle(pool, idle_fn, buffer, stores, busy, move_m, time_h, time_o = None, **kwargs):
+
+    """
+    Desc:
+        Splits feeds A, B, and C of the buffer by iata id and computes the 
+        idle events of each agency in the pool, each against its own feed H,
+        so one agency with a bad feed only delays or fails its own events.
+        An agency that failed is logged and emits nothing this time, and an
+        agency still computing after 'time_o' seconds is skipped until it 
+        finishes, when its feed H is kept and its late events are dropped. 
+        A process pool computes each agency on a copy of its feed H, so the 
+        stored feed H stays the one from before submission until then.
+        Agencies with a feed H but missing from feed C are computed against 
+        an empty feed C, so their events are omitted as before.
+
+    Args:
+        pool (object): executor of the partitions, a process pool runs them
+            in parallel and apart from the event loop, a thread pool may
+            change the feed H of a busy agency while it is skipped.
+        idle_fn (function): idle engine, see 'feed_idle', picklable with a 
+            process pool.
+        buffer (deque): ring buffer of Snapshot objects.
+        stores (dict): IdleStore per iata id, added as agencies appear.
+        busy (dict): futures of partitions still computing per iata id.
+        move_m (pos int): number of times to omit events.
+        time_h (pos int): time-horizon interval.
+        time_o (float): seconds to wait for partitions (default None).
+        kwargs (dict): args of new IdleStore objects.
+
+    Returns:
+        A tuple of the merged feed Y in iata id order and a dict of seconds 
+        per iata id (strict order).
+
+    Raises:
+        None.
+    """
+
+    loop = asyncio.get_running_loop()
+    empty = to_snapshot(feed = list())
+    parts = [buffer[i].partition() for i in (0, time_h, time_h + 1)]
+    iatas = sorted(set(parts[2]) | set(stores))
+
+    ## submit partitions not still computing
+    tasks = dict()
+    for i in iatas:
+        if i in busy:
+            if not busy[i].done():
+                logger.warning(msg = 'Client skipped agency {x}, still computing.'.format(x = i))
+                continue
+            task = busy.pop(i)
+            if not task.cancelled() and task.exception() is None:
+                stores[i] = task.result()[1]  ## feed h of late partition
+        part = [j.get(i, empty) for j in parts]
+        part = part[:1] + [empty] * (time_h - 1) + part[1:]  ## feeds at 0, time_h, and time_h + 1
+        store = stores.setdefault(i, IdleStore(**kwargs))
+        tasks[i] = asyncio.ensure_future(loop.run_in_executor(pool, part_run, idle_fn, part, store, move_m, time_h))
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout = time_o)
+
+    ## merge partitions
+    feed_y, timing = list(), dict()
+    for i, task in tasks.items():
+        if not task.done():
+            busy[i] = task
+            logger.warning(msg = 'Client omitted agency {x}, exceeded {y} seconds.'.format(
+                x = i,
+                y = time_o
+                )
+            )
+            continue
+        if task.exception() is not None:
+            logger.error(msg = 'Client failed to compute idle events of agency {x}: {y}'.format(
+                x = i,
+                y = repr(task.exception())
+                )
+            )
+            continue
+        events, stores[i], timing[i] = task.result()
+        feed_y += events
+
+    ## drop agencies with empty state
+    for i in [i for i in stores if not len(stores[i]) and i not in parts[2] and i not in busy]:
+        del stores[i]
+
+    logger.debug(msg = 'Client computed {x} agencies, slowest {y}.'.format(
+        x = len(timing),
+        y = ', '.join('{a} {b:.3f}s'.format(a = a, b = b) for a, b in
+            sorted(timing.items(), key = lambda i: -i[1])[:3])
+        )
+    )
+    return feed_y, timing
+
 ## find idle events
-def find_idle(url, key = None, time_r = 30, time_h = 1, move_m = 10, loop_n = None):
+async def find_idle(url, key = None, time_r = 30, time_h = 1, move_m = 10, loop_n = None, engine = 'python', time_o = None, framing = None,
+    size_m = None, time_l = None, part_n = None, path = None, time_k = 60, form = 'json'):
 
     """
     Desc:
-        Generator function that returns a list of idle events from a GTFS 
-        realtime feed.
+        Asynchronous generator that returns a list of idle events from a GTFS 
+        realtime feed. Requests fire on wall-clock ticks aligned to 'time_r' 
+        over one pooled keep-alive session, and the request for the next 
+        snapshot is in flight while idle events of the current one are 
+        computed in an executor. Requests are conditional, and a feed 
+        unchanged since the last request is not added to the buffer, so it 
+        is not counted as new evidence of idle or moved vehicles. With 
+        'part_n', each agency is computed against its own feed H in a pool 
+        of 'part_n' processes (see 'part_idle'), so agencies compute in 
+        parallel and a runaway agency does not hold up the others or the 
+        event loop. With 'path', the buffer and feed H are checkpointed 
+        every 'time_k' seconds and restored on start, so a restart neither 
+        waits for the buffer to fill nor loses the durations of idle 
+        vehicles. Each list is encoded as 'form' (see 
+        'encode'), or returned as is when 'form' is None.
 
     Args:
         url (str): API end point.
@@ -383,68 +632,191 @@ def find_idle(url, key = None, time_r = 30, time_h = 1, move_m = 10, loop_n = No
         time_h (pos int): time-horizon interval (default 1).
         move_m (pos int): number of times to omit events (default 10).
         loop_n (pos int): limit number of iterations (default None).
+        engine (str): idle engine 'python' or 'numpy' (default 'python').
+        time_o (pos int): request deadline in seconds (default 'time_r').
+        framing (str): None or 'delimited' response framing (default None).
+        size_m (pos int): max events in feed H (default None, unbounded).
+        time_l (pos int): seconds an event lives in feed H after last seen
+            (default None).
+        part_n (pos int): processes to compute agencies in, None for one feed H
+            (default None).
+        path (str): checkpoint file (default None, no checkpoints).
+        time_k (pos int): seconds between checkpoints (default 60).
+        form (str): 'json', 'msgpack', 'columnar', or None (default 'json').
 
     Returns:
-        Generator object.
+        Asynchronous generator object.
 
     Raises:
-        None.
+        ValueError: If 'engine' is not 'python' or 'numpy', or 'form' is 
+            unknown.
     """
 
-    ## init buffer
-    buffer = list()
-    t_cap = time_h + 1
-    t = 0
+    ## select engine
+    if engine not in ('python', 'numpy'):
+        raise ValueError("The 'engine' argument must be 'python' or 'numpy'.")
+    idle_fn = feed_idle_np if engine == 'numpy' else feed_idle
+    form = form if form is None else to_format(value = form)
 
-    ## init feed h and move c
-    feed_h = list()
-    move_k = dict()
-    
-    ## cont buffer
-    while True:
+    ## init ring buffer of snapshots
+    buffer = deque(maxlen = time_h + 2)
+    t = 0
 
-        ## fill buffer
+    ## init feed h and move c (one per agency when partitioned)
+    feed_h = IdleStore(size_m = size_m, time_l = time_l)
+    stores, busy = dict(), dict()
+    pool = ProcessPoolExecutor(max_workers = part_n) if part_n else None
+
+    ## restore checkpoint (buffer only when its snapshots are still in horizon)
+    time_c = time.time()
+    if path is not None:
+        snapshots, rows = load(path = path, time_b = time_r * buffer.maxlen, time_l = time_l)
+        buffer.extend(snapshots)
+        for key_h, time_x, move_c, time_s in rows:
+            store = stores.setdefault(key_h[0], IdleStore(size_m = size_m, time_l = time_l)) if pool else feed_h
+            store.restore(key = key_h, time_x = time_x, move_k = move_c, time_s = time_s)
+
+    ## write checkpoint (a thread pool may change the stores of agencies 
+    ## still computing, a process pool leaves them as before submission)
+    def checkpoint():
         try:
-            response = get_req_par(
-                url = url,
-                key = key
-            )
-            buffer.append(
-                response
+            save(path = path, buffer = buffer, stores = {
+                i: j for i, j in list(stores.items())
+                if i not in busy or isinstance(pool, ProcessPoolExecutor)
+            } if pool is not None else {'': feed_h})
+        except Exception as e:
+            logger.error(msg = 'Client failed to write checkpoint {x}: {y}'.format(
+                x = path,
+                y = repr(e)
+                )
             )
 
-        ## skip iter
-        except Exception as e:
-            logger.error(msg = e)
-            continue
+    ## fetch snapshot at tick
+    async def get_tick(session, tick, etag):
+        await asyncio.sleep(max(0, tick - time.time()))
+        return await get_req_par(
+            session = session,
+            url = url,
+            key = key,
+            etag = etag,
+            framing = framing
+        )
 
-        ## limit buffer length
-        if t > t_cap:
-            del buffer[0]
-
-            ## compute idle events
-            idle_y, feed_h = feed_idle(
-                buffer = buffer,  ## feed a, feed b, feed c
-                feed_h = feed_h,
-                move_m = move_m,
-                move_k = move_k,
-                time_h = time_h
-            )
+    ## pooled keep-alive session with deadline
+    loop = asyncio.get_running_loop()
+    connector = aiohttp.TCPConnector(
+        limit = 2,  ## current and next snapshot
+        keepalive_timeout = 125
+    )
+    async with aiohttp.ClientSession(
+        connector = connector,
+        timeout = aiohttp.ClientTimeout(total = time_o or time_r),
+        auto_decompress = False  ## decoded as it streams in
+        ) as session:
+
+        ## cont buffer
+        tick = next_tick(time_r = time_r)
+        etag = None
+        fetch = asyncio.ensure_future(get_tick(session = session, tick = tick, etag = etag))
+        try:
+            while True:
+
+                ## fill buffer (evicts oldest snapshot when full)
+                try:
+                    response = await fetch
+                except Exception as e:
+                    logger.error(msg = 'Client failed to fetch snapshot at tick {x}: {y}'.format(
+                        x = tick,
+                        y = repr(e)
+                        )
+                    )
+                    response = None
+
+                ## snapshot version
+                snapshot = None
+                if response is not None:
+                    snapshot, etag = response
+
+                ## request next snapshot (overlaps compute)
+                tick_n = next_tick(time_r = time_r, time_t = max(tick, time.time()))
+                if tick_n - tick > time_r:
+                    logger.warning(msg = 'Client skipped {x} ticks of {y} seconds.'.format(
+                        x = int((tick_n - tick) // time_r) - 1,
+                        y = time_r
+                        )
+                    )
+                tick = tick_n
+                fetch = asyncio.ensure_future(get_tick(session = session, tick = tick, etag = etag))
 
-            ## return generator object
-            yield json.dumps(
-                obj = idle_y,
-                indent = 2
-            )
+                ## skip iter
+                if response is None:
+                    continue
 
-        ## increment time
-        t += 1
+                ## unchanged feed is not new evidence
+                if snapshot is None:
+                    logger.info(msg = 'Client found unchanged feed, skipped idle events.')
+                else:
+                    buffer.append(
+                        snapshot
+                    )
 
-        ## limit number of loops
-        if loop_n is not None and t == loop_n:
-            break
-        
-        ## limit request rate
-        time.sleep(time_r)
+                ## full buffer
+                if snapshot is not None and len(buffer) == buffer.maxlen:
+
+                    ## compute idle events
+                    if pool is not None:
+                        try:
+                            idle_y, _ = await part_idle(
+                                pool = pool,
+                                idle_fn = idle_fn,
+                                buffer = buffer,  ## feed a, feed b, feed c
+                                stores = stores,
+                                busy = busy,
+                                move_m = move_m,
+                                time_h = time_h,
+                                time_o = time_r / 2,  ## leave time for the next snapshot
+                                size_m = size_m,
+                                time_l = time_l
+                            )
+
+                        ## worker process died, restart pool (feed h of busy agencies kept)
+                        except BrokenProcessPool:
+                            logger.warning(msg = 'Client process pool broke, restarted pool.')
+                            pool.shutdown(wait = False)
+                            pool = ProcessPoolExecutor(max_workers = part_n)
+                            busy.clear()
+                            idle_y = list()
+                    else:
+                        idle_y, feed_h = await loop.run_in_executor(None, functools.partial(
+                            idle_fn,
+                            buffer = buffer,  ## feed a, feed b, feed c
+                            feed_h = feed_h,
+                            move_m = move_m,
+                            time_h = time_h
+                            )
+                        )
+
+                    ## checkpoint state
+                    if path is not None and time.time() - time_c >= time_k:
+                        time_c = time.time()
+                        await loop.run_in_executor(None, checkpoint)
+
+                    ## return generator object
+                    yield idle_y if form is None else encode(events = idle_y, form = form)
+
+                ## increment time
+                t += 1
+
+                ## limit number of loops
+                if loop_n is not None and t == loop_n:
+                    break
+
+        ## stop pending request
+        finally:
+            fetch.cancel()
+            if path is not None:
+                checkpoint()  ## latest state on shutdown
+            if pool is not None:
+                pool.shutdown(wait = False)
 
 ## end of program
\ No newline at end of file
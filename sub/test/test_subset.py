@@ -0,0 +1,319 @@
+## libraries
+import sys
+import time
+import random
+import asyncio
+import tempfile
+import unittest
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from google.transit import gtfs_realtime_pb2
+
+## modules
+sys.path.insert(0, './')
+from sub.src.subset import feed_idle, next_tick, part_idle, val_head
+from sub.src.snapshot import to_snapshot
+from sub.src.columnar import feed_idle as feed_idle_np
+from sub.src.store import IdleStore
+from sub.src.checkpoint import save, load
+from sub.src.encode import FORMATS, encode, decode, to_format
+from sub.src.subscribe import EventIndex, to_subscription
+
+## test feed
+def feed(*rows):
+    message = gtfs_realtime_pb2.FeedMessage()
+    message.header.gtfs_realtime_version = '2.0'
+    for iata_id, vehicle_id, trip_id, lat, lon, ts in rows:
+        i = message.entity.add()
+        i.id = vehicle_id
+        i.vehicle.vehicle.id = vehicle_id
+        i.vehicle.vehicle.label = iata_id
+        i.vehicle.trip.trip_id = trip_id
+        i.vehicle.trip.route_id = 'R' + trip_id
+        i.vehicle.position.latitude = lat
+        i.vehicle.position.longitude = lon
+        i.vehicle.timestamp = ts
+    return to_snapshot(feed = message.entity)
+
+## tests
+class TestFeedIdle(unittest.TestCase):
+    def setUp(self):
+        self.feed_h = IdleStore()
+
+    def test_idle_event(self):
+        buffer = [
+            feed(('NYC', 'a', 't1', 40.5, -73.5, 100), ('NYC', 'b', 't2', 40.6, -73.6, 100)),
+            feed(('NYC', 'a', 't1', 40.5, -73.5, 130), ('NYC', 'b', 't2', 40.7, -73.7, 130)),
+            feed(('NYC', 'a', 't1', 40.5, -73.5, 160), ('NYC', 'b', 't2', 40.8, -73.8, 160))
+        ]
+        feed_y, feed_h = feed_idle(
+            buffer = buffer,
+            feed_h = self.feed_h,
+            move_m = 10,
+            time_h = 1
+        )
+        self.assertEqual(len(feed_y), 1)
+        self.assertEqual(feed_y[0]['iata_id'], 'NYC')
+        self.assertEqual(feed_y[0]['vehicle_id'], 'a')
+        self.assertEqual(feed_y[0]['datetime'], 160)
+        self.assertEqual(feed_y[0]['duration'], 30 + 29)  ## c - b plus lag a to b
+        self.assertEqual(len(feed_h), 1)
+
+    def test_evict_event(self):
+        stay = [feed(('BOS', 'a', 't1', 42.3, -71.0, i)) for i in (100, 130, 160)]
+        move = feed(('BOS', 'a', 't1', 42.4, -71.1, 200))
+        feed_idle(
+            buffer = stay,
+            feed_h = self.feed_h,
+            move_m = 2,
+            time_h = 1
+        )
+        self.assertEqual(len(self.feed_h), 1)
+        for _ in range(2):
+            feed_y, feed_h = feed_idle(
+                buffer = [move, move, move],
+                feed_h = self.feed_h,
+                move_m = 2,
+                time_h = 1
+            )
+        self.assertEqual(feed_y, [])
+        self.assertEqual(len(feed_h), 0)
+        self.assertEqual(len(self.feed_h.move_k), 0)
+
+    def test_skewed_clock(self):
+        feed_h, feed_h_np = IdleStore(time_l = 120), IdleStore(time_l = 120)
+        buffer = [feed(('NYC', 'a', 't1', 40.5, -73.5, i), ('BOS', 'b', 't2', 42.3, -71.0, i)) for i in (100, 130, 160)]
+        feed_idle(buffer = buffer, feed_h = feed_h, move_m = 10, time_h = 1)
+        feed_idle_np(buffer = buffer, feed_h = feed_h_np, move_m = 10, time_h = 1)
+        buffer = buffer[1:] + [feed(('NYC', 'a', 't1', 40.5, -73.5, 190), ('BOS', 'b', 't2', 42.3, -71.0, 190000))]  ## ms clock
+        feed_y, feed_h = feed_idle(buffer = buffer, feed_h = feed_h, move_m = 10, time_h = 1)
+        feed_y_np, feed_h_np = feed_idle_np(buffer = buffer, feed_h = feed_h_np, move_m = 10, time_h = 1)
+        self.assertEqual(sorted(i['iata_id'] for i in feed_y), ['BOS', 'NYC'])
+        self.assertEqual(feed_y, feed_y_np)
+        self.assertEqual(sorted(i[0] for i in feed_h), ['BOS', 'NYC'])  ## skewed agency does not age the others
+        self.assertEqual(list(feed_h.items()), list(feed_h_np.items()))
+
+## test header validation
+class TestValHead(unittest.TestCase):
+    def test_val_head(self):
+        message = gtfs_realtime_pb2.FeedMessage()
+        message.header.gtfs_realtime_version = '2.0'
+        self.assertTrue(val_head(message = message))
+        message.header.incrementality = gtfs_realtime_pb2.FeedHeader.DIFFERENTIAL
+        self.assertFalse(val_head(message = message))
+        message.header.incrementality = gtfs_realtime_pb2.FeedHeader.FULL_DATASET
+        message.header.gtfs_realtime_version = '3.0'
+        self.assertFalse(val_head(message = message))
+
+## test state store
+class TestIdleStore(unittest.TestCase):
+    def test_evict(self):
+        store = IdleStore(size_m = 2, time_l = 60)
+        store.add(key = 'a', time_x = 100)
+        store.add(key = 'b', time_x = 110)
+        store.add(key = 'c', time_x = 120)
+        store.seen(key = 'a', time_t = 150)
+        self.assertEqual(store.evict(time_t = 150), 1)
+        self.assertEqual(list(store.time_s), ['c', 'a'])
+        self.assertEqual(store.evict(time_t = 200), 1)
+        self.assertEqual(list(store), ['a'])
+        self.assertEqual((store.move_k, dict(store.time_s)), ({'a': 0}, {'a': 150}))
+
+## test scheduler
+class TestNextTick(unittest.TestCase):
+    def test_aligned(self):
+        self.assertEqual(next_tick(time_r = 30, time_t = 95.5), 120)
+        self.assertEqual(next_tick(time_r = 30, time_t = 120), 150)
+        self.assertEqual(next_tick(time_r = 5, time_t = 121.2), 125)
+
+## test encodings
+class TestEncode(unittest.TestCase):
+    def test_round_trip(self):
+        buffer = [feed(('NYC', 'a', 't1', 40.5, -73.5, i), ('BOS', 'b', 't2', 42.3, -71.0, i)) for i in (100, 130, 160)]
+        feed_y, feed_h = feed_idle(buffer = buffer, feed_h = IdleStore(), move_m = 10, time_h = 1)
+        buffer = buffer[1:] + [feed(('NYC', 'a', 't1', 40.5, -73.5, 190))]
+        feed_y, feed_h = feed_idle(buffer = buffer, feed_h = feed_h, move_m = 10, time_h = 1)
+        self.assertTrue(feed_y)
+        self.assertNotIn(' ', encode(events = feed_y))  ## compact json
+        for i in FORMATS:
+            self.assertEqual(decode(data = encode(events = feed_y, form = i), form = i), feed_y)
+        self.assertEqual(to_format(value = None), 'json')
+        with self.assertRaises(ValueError):
+            to_format(value = 'xml')
+
+## test subscriptions
+class TestSubscribe(unittest.TestCase):
+    def test_select(self):
+        rand = random.Random(0)
+        events = [{
+            'iata_id': rand.choice(['NYC', 'BOS', 'AKL']),
+            'latitude': rand.uniform(-60, 60),
+            'longitude': rand.uniform(-180, 180)
+        } for _ in range(500)]
+        index = EventIndex(events = events)
+        regions = {'us-east': {'NYC', 'BOS'}}
+        for i in (
+            {'iata_id': 'nyc'},
+            {'region': 'us-east'},
+            {'bbox': '-74.3,-10,-20,40.9'},
+            {'iata_id': 'AKL', 'bbox': '170,-50,-170,10'},  ## crosses antimeridian
+            {}
+        ):
+            subscription = to_subscription(regions = regions, **i)
+            self.assertEqual(index.select(subscription = subscription), [
+                j for j in events if
+                    (subscription.iata is None or j['iata_id'] in subscription.iata) and
+                    (subscription.bbox is None or subscription.within(j['latitude'], j['longitude']))
+            ])
+        self.assertEqual(to_subscription(region = 'us-east', regions = regions), to_subscription(iata_id = 'BOS,NYC'))
+        for i in ({'region': 'mars'}, {'bbox': '1,2,3'}, {'bbox': '0,10,1,5'}):
+            with self.assertRaises(ValueError):
+                to_subscription(regions = regions, **i)
+
+## test engines
+class TestFeedIdleNumpy(unittest.TestCase):
+    def test_same_feed_y(self):
+        rand = random.Random(0)
+        fleet = {
+            str(i): (rand.choice(['NYC', 'BOS']), 't' + str(rand.randint(0, 3)), 40.5, -73.5)
+            for i in range(200)
+        }
+        buffer = list()
+        feed_h, feed_h_np = IdleStore(size_m = 150, time_l = 120), IdleStore(size_m = 150, time_l = 120)
+        for t in range(30):
+            for i, (iata_id, trip_id, lat, lon) in fleet.items():
+                if rand.random() < 0.3:
+                    fleet[i] = (iata_id, trip_id, rand.choice([lat, lat + 0.25]), rand.choice([lon, lon - 0.25]))
+            buffer.append(feed(*(
+                (iata_id, i, trip_id, lat, lon, 1000 + 30 * t - rand.choice([0, 0, 40]))
+                for i, (iata_id, trip_id, lat, lon) in fleet.items() if rand.random() > 0.05
+            )))
+            if len(buffer) < 3:
+                continue
+            feed_y, feed_h = feed_idle(
+                buffer = buffer[-3:],
+                feed_h = feed_h,
+                move_m = 3,
+                time_h = 1
+            )
+            feed_y_np, feed_h_np = feed_idle_np(
+                buffer = buffer[-3:],
+                feed_h = feed_h_np,
+                move_m = 3,
+                time_h = 1
+            )
+            self.assertEqual(feed_y, feed_y_np)
+            self.assertEqual(list(feed_h.items()), list(feed_h_np.items()))
+            self.assertEqual(feed_h.move_k, feed_h_np.move_k)
+            self.assertEqual(list(feed_h.time_s.items()), list(feed_h_np.time_s.items()))
+
+## test checkpoints
+class TestCheckpoint(unittest.TestCase):
+    def test_restore(self):
+        buffer = [feed(('NYC', 'a', 't1', 40.5, -73.5, i), ('BOS', 'b', 't2', 42.3, -71.0, i)) for i in (100, 130, 160)]
+        feed_h = IdleStore()
+        feed_y, _ = feed_idle(buffer = buffer, feed_h = feed_h, move_m = 10, time_h = 1)
+        with tempfile.TemporaryDirectory() as path:
+            save(path = path + '/ckpt', buffer = buffer, stores = {'': feed_h})
+            snapshots, rows = load(path = path + '/ckpt', time_b = 60)
+            self.assertEqual([i.rows() for i in snapshots], [i.rows() for i in buffer])
+            self.assertEqual(rows, [(i, feed_h[i], feed_h.move_k[i], feed_h.time_s[i]) for i in feed_h.time_s])
+            self.assertEqual(load(path = path + '/ckpt', time_b = -1, time_l = -1), ([], []))
+            self.assertEqual(load(path = path + '/none'), ([], []))
+
+## slow agency in a process pool
+def slow_idle(buffer, feed_h, move_m, time_h):
+    if buffer[0].iata_id[0] == 'BOS':
+        time.sleep(1)  ## past time_o
+    return feed_idle(buffer = buffer, feed_h = feed_h, move_m = move_m, time_h = time_h)
+
+## test partitions
+class TestPartIdle(unittest.TestCase):
+    def setUp(self):
+        self.pool = ThreadPoolExecutor(max_workers = 2)
+        self.buffer = [
+            feed(('NYC', 'a', 't1', 40.5, -73.5, 100), ('BOS', 'b', 't2', 42.3, -71.0, 100)),
+            feed(('NYC', 'a', 't1', 40.5, -73.5, 130), ('BOS', 'b', 't2', 42.3, -71.0, 130)),
+            feed(('NYC', 'a', 't1', 40.5, -73.5, 160), ('BOS', 'b', 't2', 42.3, -71.0, 160))
+        ]
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def part(self, idle_fn, stores, busy = None, pool = None, time_o = None):
+        return part_idle(
+            pool = pool or self.pool,
+            idle_fn = idle_fn,
+            buffer = self.buffer,
+            stores = stores,
+            busy = dict() if busy is None else busy,
+            move_m = 10,
+            time_h = 1,
+            time_o = time_o
+        )
+
+    def test_same_feed_y(self):
+        stores = dict()
+        feed_y, timing = asyncio.run(self.part(idle_fn = feed_idle, stores = stores))
+        feed_y_all, _ = feed_idle(buffer = self.buffer, feed_h = IdleStore(), move_m = 10, time_h = 1)
+        self.assertEqual(feed_y, sorted(feed_y_all, key = lambda i: i['iata_id']))
+        self.assertEqual(sorted(stores), ['BOS', 'NYC'])
+        self.assertEqual(sorted(timing), ['BOS', 'NYC'])
+
+    def test_failed_agency(self):
+        def idle_fn(buffer, feed_h, move_m, time_h):
+            if buffer[0].iata_id[0] == 'BOS':
+                raise ValueError('bad feed')
+            return feed_idle(buffer = buffer, feed_h = feed_h, move_m = move_m, time_h = time_h)
+        feed_y, timing = asyncio.run(self.part(idle_fn = idle_fn, stores = dict()))
+        self.assertEqual([i['iata_id'] for i in feed_y], ['NYC'])
+        self.assertEqual(list(timing), ['NYC'])
+
+    def test_process_pool(self):
+        stores, stores_p = dict(), dict()
+        with ProcessPoolExecutor(max_workers = 2) as pool:
+            for _ in range(2):
+                feed_y_p, timing = asyncio.run(self.part(idle_fn = feed_idle, stores = stores_p, pool = pool))
+                feed_y, _ = asyncio.run(self.part(idle_fn = feed_idle, stores = stores))
+        self.assertEqual(feed_y_p, feed_y)
+        self.assertEqual(sorted(timing), ['BOS', 'NYC'])
+        self.assertEqual({i: list(j.items()) for i, j in stores_p.items()}, {i: list(j.items()) for i, j in stores.items()})
+
+    def test_slow_agency(self):
+        release = threading.Event()
+        def idle_fn(buffer, feed_h, move_m, time_h):
+            if buffer[0].iata_id[0] == 'BOS':
+                release.wait(timeout = 10)  ## blocks past time_o
+            return feed_idle(buffer = buffer, feed_h = feed_h, move_m = move_m, time_h = time_h)
+
+        async def run():
+            stores, busy = dict(), dict()
+            feed_y, timing = await self.part(idle_fn = idle_fn, stores = stores, busy = busy, time_o = 0.2)
+            self.assertEqual([i['iata_id'] for i in feed_y], ['NYC'])
+            self.assertEqual(list(timing), ['NYC'])
+            self.assertEqual(list(busy), ['BOS'])
+            feed_y, _ = await self.part(idle_fn = idle_fn, stores = stores, busy = busy, time_o = 0.2)
+            self.assertEqual([i['iata_id'] for i in feed_y], ['NYC'])  ## still computing, skipped
+            release.set()
+            await asyncio.wait(list(busy.values()))
+            feed_y, _ = await self.part(idle_fn = idle_fn, stores = stores, busy = busy, time_o = 5)
+            self.assertEqual(sorted(i['iata_id'] for i in feed_y), ['BOS', 'NYC'])
+            self.assertEqual(busy, dict())
+            self.assertEqual(len(stores['BOS']), 1)
+        asyncio.run(run())
+
+    def test_slow_agency_process_pool(self):
+        async def run(pool):
+            stores, busy = dict(), dict()
+            await self.part(idle_fn = slow_idle, stores = stores, busy = busy, pool = pool, time_o = 0.2)
+            self.assertEqual(list(busy), ['BOS'])
+            self.assertEqual(len(stores['BOS']), 0)  ## copy before submission, safe to checkpoint
+            await asyncio.wait(list(busy.values()))
+            feed_y, _ = await self.part(idle_fn = slow_idle, stores = stores, busy = busy, pool = pool, time_o = 5)
+            self.assertEqual(busy, dict())
+            self.assertEqual(len(stores['BOS']), 1)
+        with ProcessPoolExecutor(max_workers = 2) as pool:
+            asyncio.run(run(pool = pool))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,7 @@ from .src.write import WriteClient
 
 ## params
 WS_HOST = str(os.getenv(key = 'WS_HOST', default = 'http://subset:7080'))
+WS_FORMAT = str(os.getenv(key = 'WS_FORMAT', default = 'msgpack'))  ## event encoding (json or msgpack)
 DB_NAME = str(os.getenv(key = 'DB_NAME', default = 'idle'))
 DB_USER = str(os.getenv(key = 'DB_USER', default = 'user'))
 DB_PASS = str(os.getenv(key = 'DB_PASS', default = 'pass'))
@@ -31,6 +32,7 @@ app.debug = True if LOG_LEVEL == 'DEBUG' else False
 ##client instance
 client = WriteClient(
     ws_host = WS_HOST,
+    ws_form = WS_FORMAT,
     db_name = DB_NAME,
     db_user = DB_USER,
     db_pswd = DB_PASS,
@@ -8,6 +8,12 @@ import socket
 import socketio
 import psycopg2
 
+## optional msgpack encoding
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 ## params
 LOG_LEVEL = os.getenv(key = 'LOG_LEVEL', default = 'INFO')
 
@@ -25,9 +31,10 @@ class WriteClient():
                  ws_host,
                  db_name, db_user, db_pswd, db_host, db_port,
                  sql_init, sql_agency, sql_events,
-                 recon_tries = 20, recon_delay = 1, recon_timeo = 120):
+                 recon_tries = 20, recon_delay = 1, recon_timeo = 120, ws_form = 'json'):
 
         self.ws_host = ws_host
+        self.ws_form = ws_form if msgpack is not None else 'json'  ## 'json' or 'msgpack' events
         self.db_name = db_name
         self.db_user = db_user
         self.db_pswd = db_pswd
@@ -147,15 +154,19 @@ class WriteClient():
                 logger.warning(msg = 'Client is not connected to the websocket server.')
                 return
 
-            ## parse json response
+            ## parse json or msgpack response
             try:
-                data = json.loads(json_data)
+                if isinstance(json_data, (bytes, bytearray)):
+                    data = msgpack.unpackb(json_data)
+                else:
+                    data = json.loads(json_data)
                 if len(data) == 0:
                     logger.warning(msg = 'Client received empty websocket response.')
                     return
 
             except Exception as e:
                 logger.error(msg = 'Client failed to parse websocket response.')
+                return
 
             ## insert events into table (use a long-lived connection)
             with self.lock:
@@ -203,7 +214,7 @@ class WriteClient():
         for i in range(0, self.recon_tries):
             try:
                 self.sio.connect(
-                    url = self.ws_host,
+                    url = '{x}?format={y}'.format(x = self.ws_host, y = self.ws_form),  ## event encoding
                     transports = 'websocket',
                     wait_timeout = self.recon_timeo
                 )